@@ -9,6 +9,24 @@ In this config file you have to assign the variables which are used in the calcu
 PATH_HTW_WEATHER = r"pv3_weather_2015_filled_mview.csv"
 PATH_FRED_WEATHER = r"openfred_weatherdata_2015_htw.csv"
 
+# Define the time zone of the htw weather-data, if the time stamps are local time (e.g. "Europe/Berlin").
+# None: the time stamps are UTC.
+HTW_WEATHER_TZ = None
+
+# Define the period of the weather-data (UTC, the end is excluded)
+WEATHER_START = "2015-01-01"
+WEATHER_END = "2016-01-01"
+
+# Define, if the openFRED weather-data is corrected against the htw weather station (bias per month and hour).
+# The correction is fitted with the station data of the same period (see htw_reconciliation.py).
+FRED_CORRECTION = False
+
+# Parameters of the models which are used by several scripts (names of the module parameters)
+# CEC single diode model (pvlib.pvsystem.calcparams_cec)
+CEC_PARAMETERS = ["alpha_sc", "a_ref", "I_L_ref", "I_o_ref", "R_sh_ref", "R_s", "Adjust"]
+# Physical aoi model (pvlib.iam.physical)
+IAM_PARAMETERS = ["n", "K", "L"]
+
 # Define the location of the PV-system (lat, lon).
 HTW_LAT = 52.45544
 HTW_LON = 13.52481
@@ -18,3 +36,23 @@ HTW_LON = 13.52481
 # It is important to type path seperator at the end: e.g. /home/user/Documents/
 PATH_RESULTS = r""
 
+
+# Define the directory of the Parquet datasets with the hourly and monthly results (partitioned by system/year/month)
+PATH_EXPORT = r"results_parquet/"
+
+# Define the directory and the maximum size (in bytes) of the cache for model results
+PATH_CACHE = r"cache/"
+CACHE_MAX_BYTES = 500 * 1024 ** 2
+
+# Define the path of the measured ac power of the inverters (export of the SonnJA monitoring)
+# The file contains a "timestamp" column and one column per inverter (wr1 - wr5) in W, separated by ";".
+PATH_MEASURED_AC = r"sonnja_ac_2015.csv"
+
+# Define, if the calibration uses a synthetic stand-in of the measured ac power (known derate factors, see
+# htw_calibration.py) and the path of the stand-in (in the cache directory, it is not a monitoring export).
+MEASURED_AC_STANDIN = False
+PATH_MEASURED_AC_STANDIN = r"cache/sonnja_ac_2015_standin.csv"
+
+# Define the host and port of the forecast service (htw_forecast.py)
+FORECAST_HOST = "127.0.0.1"
+FORECAST_PORT = 8765
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains the batched evaluation of pv-systems with several pv-arrays (sub-fields).
+
+The arrays of all systems are grouped by their orientation (tilt, azimuth, albedo), the aoi model parameters and the
+temperature model parameters. For every group the POA irradiation, the angle of incidence, the effective irradiation
+and the cell temperature are calculated only once (the POA irradiation of all groups in one broadcast operation,
+see `htw_irradiance`). The models then start with `ModelChain.run_model_from_effective_irradiance`: the dc power of
+every array is calculated and the arrays of an inverter are summed (sandia_multi) before the inverter stage.
+
+The grouping assumes the model chain of `main.setup_model` (physical aoi losses, no spectral losses,
+sapm cell temperature).
+"""
+
+import numpy as np
+import pandas as pd
+
+from config import IAM_PARAMETERS
+from htw_irradiance import get_geometry, get_poa_irradiance
+
+
+def array_group(array):
+    """
+    Returns the group key of an array: arrays with the same key have the same effective irradiation
+    and cell temperature.
+
+    Parameters
+    ----------
+    array: pvlib.pvsystem.Array
+        Array with fixed mount.
+
+    Returns
+    -------
+    tuple
+        (surface_tilt, surface_azimuth, albedo, aoi parameters, temperature model parameters)
+    """
+    iam_parameters = tuple((key, array.module_parameters[key]) for key in IAM_PARAMETERS
+                           if key in array.module_parameters)
+    iam_parameters += (("FD", array.module_parameters.get("FD", 1.)),)
+    temperature_parameters = tuple(sorted(array.temperature_model_parameters.items()))
+    return (array.mount.surface_tilt, array.mount.surface_azimuth, array.albedo,
+            iam_parameters, temperature_parameters)
+
+
+def group_arrays(models):
+    """
+    Groups the arrays of all models.
+
+    Parameters
+    ----------
+    models: list[pvlib.modelchain.ModelChain]
+        ModelChain objects with fixed mounts.
+
+    Returns
+    -------
+    dict
+        Group key: list of (model, array index, array).
+    """
+    groups = {}
+    for model in models:
+        for i, array in enumerate(model.system.arrays):
+            groups.setdefault(array_group(array), []).append((model, i, array))
+    return groups
+
+
+def group_inputs(groups, geometry, weather, model="haydavies"):
+    """
+    Calculates the input DataFrames of `ModelChain.run_model_from_effective_irradiance` once per group.
+
+    Parameters
+    ----------
+    groups: dict
+        Groups from `group_arrays`.
+    geometry: pd.DataFrame
+        Geometry from `htw_irradiance.get_geometry`.
+    weather: pd.DataFrame
+        Weather with the columns "ghi", "dni", "dhi" and optionally "temp_air" and "wind_speed".
+    model: str
+        Transposition model.
+
+    Returns
+    -------
+    dict
+        Group key: DataFrame with "effective_irradiance", "poa_global", "poa_direct", "poa_diffuse",
+        "cell_temperature" (and "temp_air", "wind_speed").
+    """
+    from pvlib import irradiance
+
+    keys = list(groups)
+
+    # POA irradiation of the distinct orientations in one operation
+    orientations = list(dict.fromkeys((key[0], key[1], key[2]) for key in keys))
+    tilts, azimuths, albedos = (np.array(values, dtype=np.float64) for values in zip(*orientations))
+    poa = get_poa_irradiance(tilts, azimuths, geometry, weather, albedo=albedos, model=model)
+
+    # Angle of incidence of the distinct orientations (surfaces x time steps)
+    aoi = irradiance.aoi(tilts[:, np.newaxis], azimuths[:, np.newaxis],
+                         geometry["apparent_zenith"].to_numpy(), geometry["azimuth"].to_numpy())
+
+    temp_air = weather["temp_air"].to_numpy(dtype=np.float64) if "temp_air" in weather else 20.
+    wind_speed = weather["wind_speed"].to_numpy(dtype=np.float64) if "wind_speed" in weather else 0.
+
+    inputs = {}
+    for key in keys:
+        i = orientations.index((key[0], key[1], key[2]))
+        array = groups[key][0][2]
+
+        effective_irradiance = (poa["poa_direct"][i] * array.get_iam(aoi[i], iam_model="physical")
+                                + array.module_parameters.get("FD", 1.) * poa["poa_diffuse"][i])
+        cell_temperature = array.get_cell_temperature(poa["poa_global"][i], temp_air, wind_speed, model="sapm")
+
+        frame = pd.DataFrame({"effective_irradiance": effective_irradiance,
+                              "poa_global": poa["poa_global"][i],
+                              "poa_direct": poa["poa_direct"][i],
+                              "poa_diffuse": poa["poa_diffuse"][i],
+                              "cell_temperature": cell_temperature,
+                              }, index=weather.index)
+        for column in ["temp_air", "wind_speed"]:
+            if column in weather:
+                frame[column] = weather[column]
+        inputs[key] = frame
+
+    return inputs
+
+
+def run_fleet(models, weather, model="haydavies"):
+    """
+    Runs all models with the shared array groups.
+
+    All models have to use the same location, solar position and airmass model. The results are the same as with
+    `ModelChain.run_model` for a `htw_location.CachedLocation` (a plain location uses the air temperature for the
+    refraction correction of the solar position, differences < 0.1 W).
+
+    Parameters
+    ----------
+    models: list[pvlib.modelchain.ModelChain]
+        ModelChain objects with fixed mounts (configured like `main.setup_model`).
+    weather: pd.DataFrame
+        Weather with the columns "ghi", "dni", "dhi" and optionally "temp_air" and "wind_speed".
+    model: str
+        Transposition model.
+
+    Returns
+    -------
+    list[pvlib.modelchain.ModelChain]
+        The ModelChain objects with the results.
+    """
+    first = models[0]
+    geometry = get_geometry(first.location, weather.index,
+                            solar_position_method=first.solar_position_method,
+                            airmass_model=first.airmass_model)
+
+    groups = group_arrays(models)
+    inputs = group_inputs(groups, geometry, weather, model=model)
+
+    for mc in models:
+        # The arrays of a group share the same DataFrame (no copies)
+        data = tuple(inputs[array_group(array)] for array in mc.system.arrays)
+        mc.run_model_from_effective_irradiance(data if len(data) > 1 else data[0])
+
+    return models
+
+
+def fleet_dc(models):
+    """
+    Sums the dc power of all arrays per system.
+
+    Parameters
+    ----------
+    models: list[pvlib.modelchain.ModelChain]
+        ModelChain objects after a run.
+
+    Returns
+    -------
+    pd.DataFrame
+        dc power in W, one column per system.
+    """
+    import htw_export
+
+    return pd.DataFrame({mc.name: htw_export.dc_power(mc.results.dc)[0] for mc in models})
+
+
+if __name__ == "__main__":
+    import copy
+    import time
+
+    from htw_weather import load_weather
+    from main import SYSTEMS, setup_location, setup_models
+
+    # Example: the first inverter with two sub-fields of different orientation
+    systems = copy.deepcopy(SYSTEMS)
+    systems[0]["arrays"] = [{"modules_per_string": 10, "strings": 2},
+                            {"modules_per_string": 10, "strings": 1, "surface_tilt": 30, "surface_azimuth": 125}]
+
+    weather_fred = load_weather("fred")
+    fleet = setup_models(location=setup_location(cached=True), systems=systems)
+
+    time_start = time.perf_counter()
+    run_fleet(fleet, weather_fred)
+    print(f"Runtime (grouped arrays): {time.perf_counter() - time_start:.2f} s, "
+          f"{len(group_arrays(fleet))} groups for {sum(mc.system.num_arrays for mc in fleet)} arrays")
+
+    print(pd.DataFrame({mc.name: [round(mc.results.ac.sum() / 1000, 1)] for mc in fleet}, index=["annual_yield"]).T)
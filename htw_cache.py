@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains a cache for the results of the models.
+
+A run is identified by a fingerprint of the weather data, the pv-system (module, inverter, temperature and losses
+parameters, mounts), the location (class and coordinates), the ModelChain options and the pvlib version.
+If a run with the same fingerprint was already calculated, the stored `ModelChain.results` are used instead of
+running the model again.
+The cache directory is limited in size, the least recently used results are removed first.
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from config import PATH_CACHE, CACHE_MAX_BYTES
+
+# ModelChain options which are part of the fingerprint
+MODEL_OPTIONS = ["clearsky_model", "transposition_model", "solar_position_method", "airmass_model",
+                 "dc_model", "ac_model", "aoi_model", "spectral_model", "temperature_model",
+                 "dc_ohmic_model", "losses_model"]
+
+
+def weather_fingerprint(weather):
+    """
+    Creates a fingerprint of the weather DataFrame (index, column names and values).
+
+    Parameters
+    ----------
+    weather: pd.DataFrame
+        Weather DataFrame which is passed to `ModelChain.run_model`.
+
+    Returns
+    -------
+    str
+        sha256 hex digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(column) for column in weather.columns]).encode())
+    digest.update(str(getattr(weather.index, "tz", None)).encode())
+    digest.update(pd.util.hash_pandas_object(weather, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def file_fingerprint(path, chunk_size=1024 * 1024):
+    """
+    Creates a fingerprint of the content of a file (e.g. a weather file).
+
+    Parameters
+    ----------
+    path: str
+        Path of the file.
+    chunk_size: int
+        Number of bytes which are read at once.
+
+    Returns
+    -------
+    str
+        sha256 hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_fingerprint(model, weather):
+    """
+    Creates the fingerprint of a model run.
+
+    Parameters
+    ----------
+    model: pvlib.modelchain.ModelChain
+        ModelChain object.
+    weather: pd.DataFrame
+        Weather DataFrame which is passed to `ModelChain.run_model`.
+
+    Returns
+    -------
+    str
+        sha256 hex digest.
+    """
+    import pvlib
+
+    system = model.system
+
+    arrays = []
+    for array in system.arrays:
+        arrays.append({"module_parameters": array.module_parameters,
+                       "temperature_model_parameters": array.temperature_model_parameters,
+                       "mount": mount_description(array.mount),
+                       "albedo": array.albedo,
+                       "modules_per_string": array.modules_per_string,
+                       "strings": array.strings,
+                       "module_type": array.module_type,
+                       })
+
+    description = {
+        "weather": weather_fingerprint(weather),
+        "arrays": arrays,
+        "inverter_parameters": system.inverter_parameters,
+        "losses_parameters": system.losses_parameters,
+        "location": location_description(model.location),
+        "options": {option: option_name(getattr(model, option, None)) for option in MODEL_OPTIONS},
+        "pvlib": pvlib.__version__,
+    }
+
+    text = json.dumps(description, sort_keys=True, default=_json_default)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def location_description(location):
+    """
+    Returns the class and the coordinates of a location for the fingerprint.
+
+    The class is part of the location (e.g. `CachedLocation` calculates the solar position differently).
+    """
+    return [type(location).__qualname__, location.latitude, location.longitude, str(location.tz), location.altitude]
+
+
+def mount_description(mount):
+    """
+    Returns the type and the fields of a mount (e.g. `FixedMount`, `SingleAxisTrackerMount`) for the fingerprint.
+    """
+    if dataclasses.is_dataclass(mount):
+        fields = dataclasses.asdict(mount)
+    else:
+        fields = {key: value for key, value in vars(mount).items() if not key.startswith("_")}
+    return {"type": type(mount).__name__, **fields}
+
+
+def run_model_cached(model, weather, cache_dir=PATH_CACHE, max_bytes=CACHE_MAX_BYTES):
+    """
+    Runs the model or uses the stored results of a run with the same fingerprint.
+
+    Parameters
+    ----------
+    model: pvlib.modelchain.ModelChain
+        ModelChain object.
+    weather: pd.DataFrame
+        Weather DataFrame which is passed to `ModelChain.run_model`.
+    cache_dir: str
+        Directory of the cache. It is created if it does not exist.
+    max_bytes: int
+        Maximum size of the cache directory in bytes.
+
+    Returns
+    -------
+    pvlib.modelchain.ModelChain
+        The ModelChain object with the results.
+    """
+    path = os.path.join(cache_dir, f"{model_fingerprint(model, weather)}.pkl")
+
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            model.results = pickle.load(file)
+        os.utime(path)  # mark as recently used
+        return model
+
+    model.run_model(weather=weather)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path_tmp = f"{path}.{os.getpid()}.tmp"
+    with open(path_tmp, "wb") as file:
+        pickle.dump(model.results, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path_tmp, path)
+
+    evict(cache_dir, max_bytes)
+
+    return model
+
+
+def evict(cache_dir=PATH_CACHE, max_bytes=CACHE_MAX_BYTES):
+    """
+    Removes the least recently used results until the cache directory is smaller than `max_bytes`.
+
+    Parameters
+    ----------
+    cache_dir: str
+        Directory of the cache.
+    max_bytes: int
+        Maximum size of the cache directory in bytes.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and entry.name.endswith(".pkl"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+
+def option_name(option):
+    """
+    Returns the name of a ModelChain option (the options are stored as methods or partial functions).
+    """
+    if option is None or isinstance(option, str):
+        return option
+    function = getattr(option, "func", option)
+    return getattr(function, "__name__", repr(function))
+
+
+def _json_default(obj):
+    """
+    Converts the parameter objects (pandas, numpy) to json serializable objects.
+    """
+    if isinstance(obj, (pd.Series, pd.DataFrame)):
+        return obj.to_dict()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return repr(obj)
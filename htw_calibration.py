@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains functions to calibrate the losses of the pv-systems with the measured ac power.
+
+The pvwatts losses act as one multiplicative derate factor on the dc output (power and voltage, like the losses of
+the ModelChain), so the single losses (soiling, shading, mismatch, ...) can not be separated with the ac power. One derate factor per system is
+fitted, the "losses" are the equivalent pvwatts losses of it. The fit needs the Sandia inverter model.
+The model runs only once per system without losses (cached, see `htw_cache`) and the derate factor
+is fitted with vectorized least squares on the inverter model:
+
+    ac = sandia(derate * p_dc, derate * v_dc)
+
+1. A closed-form least squares fit (ac_measured ~ derate * ac_without_losses) gives a start value.
+2. The sum of squared errors is evaluated for a grid of derate factors around the start value in one
+   array operation and the minimum is refined with a parabola through the neighbouring grid points.
+
+The stand-in of the measured ac power (`create_measured_ac`) is written to `PATH_MEASURED_AC_STANDIN` and only used
+with `MEASURED_AC_STANDIN`.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from config import PATH_MEASURED_AC, PATH_MEASURED_AC_STANDIN, MEASURED_AC_STANDIN
+import htw_cache
+import htw_export
+import htw_resample
+
+# Relative noise of the stand-in measurements (standard deviation, see `create_measured_ac`)
+STANDIN_NOISE = 0.03
+
+
+def read_measured_ac(path=PATH_MEASURED_AC, freq="h", tz=None, label="center"):
+    """
+    Reads the measured ac power of the inverters.
+
+    Parameters
+    ----------
+    path: str
+        Path of the csv file (";" separated) with a "timestamp" column and one column per inverter in W.
+    freq: str or None
+        Resample frequency (e.g. "h"). If None, the data is not resampled.
+    tz: str, optional
+        Time zone of naive time stamps (e.g. "Europe/Berlin"). The index is converted to UTC.
+        If None, naive time stamps stay naive (UTC).
+    label: str
+        Position of the time stamps in the resampled bins: "start" or "center" (like the weather of the models,
+        see `htw_weather.load_weather`).
+
+    Returns
+    -------
+    pd.DataFrame
+        Measured ac power in W with datetime index, one column per inverter.
+    """
+    df = pd.read_csv(path, sep=";")
+    df = df.set_index("timestamp")
+    df.index = pd.to_datetime(df.index)
+    df = df.apply(pd.to_numeric, errors="coerce")
+    if tz is not None and df.index.tz is None:
+        df = align_timezone(df, "UTC", tz=tz)
+
+    if freq is not None:
+        df = df.resample(freq).mean()
+        df.index = df.index + pd.Timedelta(htw_resample.label_offset(label, htw_resample.bin_width(freq)), unit="ns")
+
+    return df
+
+
+def align_timezone(df, target, tz=None):
+    """
+    Converts the datetime index of a DataFrame to the time zone of the weather (e.g. measured ac power).
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        DataFrame with datetime index.
+    target: pd.DatetimeIndex, str or None
+        Index of the weather or its time zone. None: naive time stamps (UTC).
+    tz: str, optional
+        Time zone of naive time stamps of `df`. If None, naive time stamps are UTC.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with the index in the time zone of `target`.
+    """
+    if isinstance(target, pd.DatetimeIndex):
+        target = target.tz
+    if df.index.tz is None and tz is None:
+        if target is None:
+            return df
+    elif target is not None and str(df.index.tz) == str(target):
+        return df
+
+    index = pd.DatetimeIndex(htw_resample.to_epochs(df.index, tz=tz), tz="UTC")
+    index = index.tz_localize(None) if target is None else index.tz_convert(target)
+    index.name = df.index.name
+    return df.set_axis(index, axis=0)
+
+
+def preloss_dc(model, weather):
+    """
+    Runs the model without losses and returns the dc power and voltage at the inverter input.
+
+    The losses model (also a custom function) and the results of the model are restored afterwards.
+
+    Parameters
+    ----------
+    model: pvlib.modelchain.ModelChain
+        ModelChain object.
+    weather: pd.DataFrame
+        Weather DataFrame which is passed to `ModelChain.run_model`.
+
+    Returns
+    -------
+    pd.DataFrame
+        "p_dc" in W and "v_dc" in V without losses and the "cell_temperature" in °C.
+    """
+    results = model.results
+    losses_model = model.losses_model
+
+    model.results = type(results)()
+    model.losses_model = "no_loss"
+    try:
+        htw_cache.run_model_cached(model, weather)
+        dc = htw_export.results_to_frame(model)
+    finally:
+        # The setter would wrap a custom losses function again, so the stored method is restored
+        model._losses_model = losses_model
+        model.results = results
+
+    return dc[["p_dc", "v_dc", "cell_temperature"]]
+
+
+def fit_derate(p_dc, v_dc, measured_ac, inverter_parameters, span=0.1, steps=201):
+    """
+    Fits the derate factor of the dc output (power and voltage) to the measured ac power.
+
+    Parameters
+    ----------
+    p_dc: np.ndarray
+        DC power without losses in W.
+    v_dc: np.ndarray
+        DC voltage in V.
+    measured_ac: np.ndarray
+        Measured ac power in W (same time steps as `p_dc`).
+    inverter_parameters: dict
+        Sandia inverter parameters (e.g. from `htw_inverter.inv1`).
+    span: float
+        Half width of the derate grid around the start value.
+    steps: int
+        Number of grid points.
+
+    Returns
+    -------
+    dict
+        "derate": fitted derate factor,
+        "losses": equivalent pvwatts losses in %,
+        "rmse": root mean squared error of the ac power in W,
+        "count": number of time steps which are used for the fit.
+    """
+    from pvlib import inverter
+
+    from htw_inverter import SANDIA_PARAMETERS
+
+    missing = [key for key in SANDIA_PARAMETERS if key not in inverter_parameters]
+    if missing:
+        raise ValueError(f"The derate fit needs the parameters of the Sandia inverter model, missing: {missing}")
+
+    p_dc = np.asarray(p_dc, dtype=np.float64)
+    v_dc = np.asarray(v_dc, dtype=np.float64)
+    measured_ac = np.asarray(measured_ac, dtype=np.float64)
+
+    # Only daytime values with measurements are used (the night consumption holds no information)
+    valid = np.isfinite(p_dc) & np.isfinite(v_dc) & np.isfinite(measured_ac) & (p_dc > 0)
+    p_dc, v_dc, measured_ac = p_dc[valid], v_dc[valid], measured_ac[valid]
+    if not valid.any():
+        raise ValueError("There are no time steps with dc power and measured ac power.")
+
+    # 1. Start value: closed-form least squares of the measured ac on the ac without losses
+    ac_preloss = inverter.sandia(v_dc, p_dc, inverter_parameters)
+    derate_start = np.dot(ac_preloss, measured_ac) / np.dot(ac_preloss, ac_preloss)
+
+    # 2. Sum of squared errors for the derate grid (one row per derate factor)
+    derates = np.linspace(derate_start - span, derate_start + span, steps)
+    derates = derates[derates > 0]
+    ac = inverter.sandia(derates[:, np.newaxis] * v_dc[np.newaxis, :], derates[:, np.newaxis] * p_dc[np.newaxis, :],
+                         inverter_parameters)
+    sse = np.sum((ac - measured_ac[np.newaxis, :]) ** 2, axis=1)
+
+    # Refine the minimum with a parabola through the neighbouring grid points
+    i = int(np.argmin(sse))
+    derate = derates[i]
+    if 0 < i < len(derates) - 1:
+        denominator = sse[i - 1] - 2 * sse[i] + sse[i + 1]
+        if denominator > 0:
+            derate += 0.5 * (derates[1] - derates[0]) * (sse[i - 1] - sse[i + 1]) / denominator
+
+    residual = inverter.sandia(derate * v_dc, derate * p_dc, inverter_parameters) - measured_ac
+
+    return {"derate": derate,
+            "losses": 100 * (1 - derate),
+            "rmse": np.sqrt(np.mean(residual ** 2)),
+            "count": int(valid.sum()),
+            }
+
+
+def calibrate_models(models, weather, measured):
+    """
+    Calibrates the losses of all models with the measured ac power.
+
+    Parameters
+    ----------
+    models: list[pvlib.modelchain.ModelChain]
+        ModelChain objects. The model name has to be a column of `measured`.
+    weather: pd.DataFrame
+        Weather DataFrame which is passed to `ModelChain.run_model`.
+    measured: pd.DataFrame
+        Measured ac power in W (e.g. from `read_measured_ac`), with the same time steps as the weather
+        (naive time stamps are UTC, they are converted to the time zone of the weather).
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per system: fitted "derate", "losses" in %, "rmse" in W, "count"
+        and the "losses_pvwatts" in % of the current losses parameters.
+    """
+    from pvlib import pvsystem
+
+    for model in models:
+        if htw_cache.option_name(model.ac_model) != "sandia_inverter":
+            raise ValueError(f"The calibration needs the Sandia inverter model (ac_model='sandia'), "
+                             f"model {model.name} uses {htw_cache.option_name(model.ac_model)}.")
+
+    measured = align_timezone(measured, weather.index)
+
+    results = {}
+    for model in models:
+        dc = preloss_dc(model, weather)
+        measured_ac = measured[model.name].reindex(dc.index)
+        result = fit_derate(dc.p_dc.to_numpy(), dc.v_dc.to_numpy(), measured_ac.to_numpy(),
+                            model.system.inverter_parameters)
+        result["losses_pvwatts"] = pvsystem.pvwatts_losses(**model.system.losses_parameters)
+        results[model.name] = result
+
+    return pd.DataFrame(results).T
+
+
+def create_measured_ac(models, weather, path=PATH_MEASURED_AC_STANDIN, derates=None, noise=STANDIN_NOISE, seed=0):
+    """
+    Writes a synthetic stand-in of the measured ac power (format of the monitoring export).
+
+    The ac power of the models is calculated with known derate factors and a relative noise, so the calibration
+    can be checked against the derate factors.
+
+    Parameters
+    ----------
+    models: list[pvlib.modelchain.ModelChain]
+        ModelChain objects (Sandia inverter model).
+    weather: pd.DataFrame
+        Weather DataFrame which is passed to `ModelChain.run_model`.
+    path: str
+        Path of the csv file (format of `read_measured_ac`, not the path of the monitoring export).
+    derates: dict, optional
+        Derate factor per model name. Default: random factors between 0.85 and 0.95.
+    noise: float
+        Relative noise of the ac power (standard deviation).
+    seed: int, optional
+        Seed of the random numbers.
+
+    Returns
+    -------
+    pd.Series
+        Derate factors of the stand-in per model name.
+    """
+    from pvlib import inverter
+
+    rng = np.random.default_rng(seed)
+    if derates is None:
+        derates = dict(zip([model.name for model in models], rng.uniform(0.85, 0.95, len(models))))
+
+    measured = pd.DataFrame(index=weather.index)
+    for model in models:
+        dc = preloss_dc(model, weather)
+        derate = derates[model.name]
+        ac = inverter.sandia(derate * dc.v_dc, derate * dc.p_dc, model.system.inverter_parameters)
+        measured[model.name] = ac * (1 + noise * rng.standard_normal(len(ac)))
+
+    measured.index.name = "timestamp"
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    measured.round(1).to_csv(path, sep=";")
+    return pd.Series(derates, name="derate")
+
+
+if __name__ == "__main__":
+    from htw_weather import load_weather
+    from main import setup_models
+
+    models_htw = setup_models()
+    weather_htw = load_weather("htw")
+
+    # Synthetic stand-in with known derate factors (only with MEASURED_AC_STANDIN, not the monitoring export)
+    derates_standin = None
+    path_measured = PATH_MEASURED_AC
+    if MEASURED_AC_STANDIN:
+        derates_standin = create_measured_ac(models_htw, weather_htw)
+        path_measured = PATH_MEASURED_AC_STANDIN
+        print(f"Synthetic stand-in of the measured ac power: {PATH_MEASURED_AC_STANDIN}\n")
+    elif not os.path.exists(PATH_MEASURED_AC):
+        raise FileNotFoundError(f"The measured ac power {PATH_MEASURED_AC} is not available "
+                                f"(set MEASURED_AC_STANDIN in config.py for a synthetic stand-in).")
+
+    # Calibrate all inverters with the htw weather-data
+    calibration = calibrate_models(models_htw, weather_htw, read_measured_ac(path_measured))
+    if derates_standin is not None:
+        calibration["derate_standin"] = derates_standin
+
+    print(f"{' Calibrated losses ':#^50}")
+    print(calibration)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains precalculated clear-sky tables per location.
+
+The Ineichen clear-sky model needs the Linke turbidity, which is read from a large h5 file of pvlib and
+interpolated for every time step. Here the monthly Linke turbidity of a location is read once and stored in the
+cache directory. With it, the clear-sky irradiation (ghi, dni, dhi) is calculated once for a reference (leap) year
+as table day-of-year x time-of-day (UTC) and also stored in the cache directory.
+
+The clear-sky irradiation of any time steps is interpolated from the table (linear in time-of-day), so weather QC,
+decomposition and forecasts get the clear-sky reference and the clear-sky index without calculating it again.
+The QC of the weather sources (`htw_reconciliation.align_sources`) flags the irradiation above the clear-sky limit
+(`qc_flags`).
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from config import PATH_CACHE
+
+# Reference year of the tables (leap year, so every day-of-year is in the table)
+REFERENCE_YEAR = 2016
+
+# Columns of the tables
+CLEARSKY_COLUMNS = ["ghi", "dni", "dhi"]
+
+# Limit of the QC: ghi > QC_FACTOR * clear-sky ghi + QC_OFFSET (W/m²) is implausible
+QC_FACTOR = 1.2
+QC_OFFSET = 50.
+
+
+def linke_turbidity(latitude, longitude, cache_dir=PATH_CACHE):
+    """
+    Returns the monthly Linke turbidity of a location (read once from pvlib, then from the cache directory).
+
+    Parameters
+    ----------
+    latitude: float
+        Latitude
+    longitude: float
+        Longitude
+    cache_dir: str
+        Directory of the cache.
+
+    Returns
+    -------
+    np.ndarray
+        Linke turbidity of the months January to December.
+    """
+    path = os.path.join(cache_dir, f"linke_turbidity_{latitude:.4f}_{longitude:.4f}.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as file:
+            return np.array(json.load(file))
+
+    from pvlib import clearsky
+
+    times = pd.date_range(f"{REFERENCE_YEAR}-01-01", periods=12, freq="MS") + pd.Timedelta(days=14)
+    values = clearsky.lookup_linke_turbidity(times, latitude, longitude, interp_turbidity=False)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump([float(value) for value in values], file)
+
+    return values.to_numpy(dtype=np.float64)
+
+
+def daily_linke_turbidity(monthly):
+    """
+    Interpolates the monthly Linke turbidity to the days of the reference year (values in the middle of the month).
+
+    Parameters
+    ----------
+    monthly: np.ndarray
+        Linke turbidity of the months January to December.
+
+    Returns
+    -------
+    np.ndarray
+        Linke turbidity of the 366 days.
+    """
+    days = pd.date_range(f"{REFERENCE_YEAR}-01-01", f"{REFERENCE_YEAR}-12-31", freq="D")
+    month_starts = pd.date_range(f"{REFERENCE_YEAR}-01-01", periods=12, freq="MS")
+    middles = (month_starts.dayofyear + month_starts.days_in_month / 2).to_numpy(dtype=np.float64)
+
+    # Periodic: December before January and January after December
+    x = np.concatenate([[middles[-1] - 366], middles, [middles[0] + 366]])
+    y = np.concatenate([[monthly[-1]], monthly, [monthly[0]]])
+    return np.interp(days.dayofyear.to_numpy(dtype=np.float64), x, y)
+
+
+def clearsky_table(location, freq_minutes=15, cache_dir=PATH_CACHE):
+    """
+    Returns the clear-sky table of a location (calculated once, then read from the cache directory).
+
+    Parameters
+    ----------
+    location: pvlib.location.Location
+        Location
+    freq_minutes: int
+        Time step of the table in minutes (has to divide 1440).
+    cache_dir: str
+        Directory of the cache.
+
+    Returns
+    -------
+    dict
+        "ghi", "dni", "dhi": clear-sky irradiation in W/m², arrays (366 days, time steps per day) in UTC.
+        "freq_minutes": time step of the table.
+    """
+    if 1440 % freq_minutes != 0:
+        raise ValueError(f"The time step of the table has to divide a day: {freq_minutes} min")
+
+    path = os.path.join(cache_dir, f"clearsky_{location.latitude:.4f}_{location.longitude:.4f}_"
+                                   f"{location.altitude:.0f}_{freq_minutes}min.npz")
+    if os.path.exists(path):
+        with np.load(path) as data:
+            table = {column: data[column] for column in CLEARSKY_COLUMNS}
+        table["freq_minutes"] = freq_minutes
+        return table
+
+    steps = 1440 // freq_minutes
+    times = pd.date_range(f"{REFERENCE_YEAR}-01-01", periods=366 * steps, freq=f"{freq_minutes}min", tz="UTC")
+    turbidity = np.repeat(daily_linke_turbidity(linke_turbidity(location.latitude, location.longitude,
+                                                                cache_dir=cache_dir)), steps)
+
+    clearsky = location.get_clearsky(times, model="ineichen", linke_turbidity=pd.Series(turbidity, index=times))
+    table = {column: clearsky[column].to_numpy(dtype=np.float64).reshape(366, steps)
+             for column in CLEARSKY_COLUMNS}
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(path, **table)
+
+    table["freq_minutes"] = freq_minutes
+    return table
+
+
+def get_clearsky(times, table):
+    """
+    Interpolates the clear-sky irradiation of the times from the table.
+
+    Parameters
+    ----------
+    times: pd.DatetimeIndex
+        Time steps (UTC, if not localized).
+    table: dict
+        Clear-sky table from `clearsky_table`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Clear-sky "ghi", "dni" and "dhi" in W/m² with the index `times`.
+    """
+    times = pd.DatetimeIndex(times)
+    times_utc = times.tz_localize("UTC") if times.tz is None else times.tz_convert("UTC")
+    steps = table["ghi"].shape[1]
+
+    # Day of the (leap) reference year: from March on, non-leap years are shifted by one day
+    day = times_utc.dayofyear.to_numpy() - 1
+    day = day + ((~times_utc.is_leap_year) & (day >= 59))
+
+    # Linear interpolation between the time steps of the table (the last step of a day uses the next day)
+    position = (times_utc.hour.to_numpy() * 60 + times_utc.minute.to_numpy()
+                + times_utc.second.to_numpy() / 60) / table["freq_minutes"]
+    step = np.floor(position).astype(np.int64)
+    weight = position - step
+
+    step_next = step + 1
+    day_next = day.copy()
+    wrap = step_next >= steps
+    step_next[wrap] = 0
+    day_next[wrap] = (day[wrap] + 1) % 366
+
+    clearsky = {column: table[column][day, step] * (1 - weight) + table[column][day_next, step_next] * weight
+                for column in CLEARSKY_COLUMNS}
+    return pd.DataFrame(clearsky, index=times)
+
+
+def clearsky_index(ghi, clearsky_ghi, max_clearsky_index=2.0):
+    """
+    Calculates the clear-sky index (ghi / clear-sky ghi).
+
+    Parameters
+    ----------
+    ghi: pd.Series or np.ndarray
+        Global horizontal irradiation in W/m².
+    clearsky_ghi: pd.Series or np.ndarray
+        Clear-sky global horizontal irradiation in W/m² (e.g. from `get_clearsky`).
+    max_clearsky_index: float
+        Upper limit of the clear-sky index.
+
+    Returns
+    -------
+    pd.Series or np.ndarray
+        Clear-sky index (0 if the clear-sky ghi is 0).
+    """
+    from pvlib import irradiance
+
+    return irradiance.clearsky_index(ghi, clearsky_ghi, max_clearsky_index=max_clearsky_index)
+
+
+def qc_flags(ghi, clearsky_ghi, factor=QC_FACTOR, offset=QC_OFFSET):
+    """
+    Flags the global horizontal irradiation above the clear-sky limit.
+
+    Parameters
+    ----------
+    ghi: np.ndarray
+        Global horizontal irradiation in W/m².
+    clearsky_ghi: np.ndarray
+        Clear-sky global horizontal irradiation in W/m² (e.g. from `get_clearsky`).
+    factor: float
+        Factor of the clear-sky ghi.
+    offset: float
+        Offset of the limit in W/m².
+
+    Returns
+    -------
+    np.ndarray
+        True for implausible values (False for missing values).
+    """
+    ghi = np.asarray(ghi, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        return ghi > factor * np.asarray(clearsky_ghi, dtype=np.float64) + offset
+
+
+def add_clearsky(weather, table):
+    """
+    Adds the clear-sky irradiation and the clear-sky index to a weather DataFrame.
+
+    Parameters
+    ----------
+    weather: pd.DataFrame
+        Weather with datetime index and the column "ghi".
+    table: dict
+        Clear-sky table from `clearsky_table`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Weather with the additional columns "ghi_clear", "dni_clear", "dhi_clear" and "clearsky_index".
+    """
+    clearsky = get_clearsky(weather.index, table)
+
+    weather = weather.copy()
+    for column in CLEARSKY_COLUMNS:
+        weather[f"{column}_clear"] = clearsky[column].to_numpy()
+    weather["clearsky_index"] = clearsky_index(weather["ghi"].to_numpy(), weather["ghi_clear"].to_numpy())
+    return weather
+
+
+if __name__ == "__main__":
+    from htw_weather import load_weather
+    from main import setup_location
+
+    table_htw = clearsky_table(setup_location())
+
+    # Weather QC: time steps with a ghi above the clear-sky ghi
+    for source in ["htw", "fred"]:
+        weather_source = add_clearsky(load_weather(source), table_htw)
+        above = qc_flags(weather_source.ghi, weather_source.ghi_clear)
+        print(f"{source}: {above.sum()} hours with ghi > {QC_FACTOR} * clear-sky ghi + {QC_OFFSET:.0f} W/m², "
+              f"mean clear-sky index (day): {weather_source.clearsky_index[weather_source.ghi_clear > 0].mean():.2f}")
@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains the array core of the model chain (weather -> geometry -> POA -> dc -> ac -> monthly energy).
+
+The weather is converted once to int64 UTC epochs and one contiguous float64 array (variables x time steps). The
+pv-systems are converted once to parameter arrays (`CoreFleet`). All stages then work on numpy arrays in chunks of
+time steps, so the memory depends on the chunk size and not on the length of the weather:
+
+    geometry:   solar position (NREL SPA, `pvlib.spa.solar_position_numpy`), extraterrestrial irradiation, airmass
+    poa:        POA irradiation and angle of incidence of the distinct orientations (orientations x time steps)
+    dc:         effective irradiation, cell temperature and the CEC single diode model of the distinct dc groups
+                (orientation, aoi, temperature and module parameters), only for time steps with irradiation
+    ac:         Sandia inverter model of all inverters (`htw_inverter.sandia`, `sandia_multi` for several arrays)
+    energy:     monthly ac energy (sums of the chunks), optionally the ac power of all time steps
+
+pandas is only used at the boundary (`weather_arrays`, `core_frames`). The model chain is the one of
+`main.setup_model` (haydavies, physical aoi model, no spectral losses, sapm cell temperature, CEC, Sandia, pvwatts
+losses). The solar position is calculated like `htw_location.CachedLocation` (12 °C, pressure of the altitude,
+delta_t of the year), so the results are the same as with `ModelChain.run_model` and a `CachedLocation`
+(see `_max_power_point`).
+"""
+
+import numpy as np
+import pandas as pd
+
+from config import CEC_PARAMETERS, IAM_PARAMETERS
+import htw_inverter
+import htw_resample
+from htw_weather import WEATHER_COLUMNS
+
+# Time steps per chunk (one year of hourly values)
+CHUNK_SIZE = 8760
+
+# Default parameters of the physical aoi model (`pvlib.iam.physical`), if the module parameters do not contain them
+IAM_DEFAULTS = {"n": 1.526, "K": 4.0, "L": 0.002}
+
+# Parameters of the sapm cell temperature model
+TEMPERATURE_PARAMETERS = ["a", "b", "deltaT"]
+
+
+def weather_arrays(weather, columns=None):
+    """
+    Converts a weather DataFrame to epochs and one contiguous array (boundary of the core).
+
+    Parameters
+    ----------
+    weather: pd.DataFrame
+        Weather with datetime index (UTC, if not localized).
+    columns: list[str], optional
+        Columns. Default: `WEATHER_COLUMNS`.
+
+    Returns
+    -------
+    epochs: np.ndarray
+        UTC epochs in ns (int64).
+    values: np.ndarray
+        Weather values, array (columns, time steps).
+    """
+    if columns is None:
+        columns = WEATHER_COLUMNS
+
+    values = np.empty((len(columns), len(weather)), dtype=np.float64)
+    for i, column in enumerate(columns):
+        values[i, :] = weather[column].to_numpy(dtype=np.float64)
+    return htw_resample.to_epochs(weather.index), values
+
+
+def solar_geometry(epochs, latitude, longitude, altitude=0., airmass_model=None, temperature=12., delta_t=None):
+    """
+    Calculates the geometry of the sun for epochs (like `htw_irradiance.get_geometry` without pandas).
+
+    Parameters
+    ----------
+    epochs: np.ndarray
+        UTC epochs in ns.
+    latitude, longitude: float
+        Location in degree.
+    altitude: float
+        Altitude in m (pressure of the standard atmosphere).
+    airmass_model: str, optional
+        Model of `pvlib.atmosphere.get_relative_airmass`. If None, the airmass is not calculated.
+    temperature: float
+        Air temperature of the refraction correction in °C.
+    delta_t: float, optional
+        Difference between terrestrial time and UT1 in s. Default: `pvlib.spa.calculate_deltat` of the year and
+        month of every time step (like `htw_location.CachedLocation`).
+
+    Returns
+    -------
+    dict
+        "apparent_zenith", "zenith", "azimuth" in degree, "dni_extra" in W/m² and "airmass_relative" (or None).
+    """
+    from pvlib import atmosphere, irradiance, spa
+
+    pressure = atmosphere.alt2pres(altitude) / 100  # in hPa
+    if delta_t is None:
+        months = epochs.view("M8[ns]").astype("M8[M]").astype(np.int64)
+        delta_t = spa.calculate_deltat(1970 + months // 12, months % 12 + 1)
+    apparent_zenith, zenith, _, _, azimuth, _ = spa.solar_position_numpy(epochs / 1e9, latitude, longitude,
+                                                                         altitude, pressure, temperature,
+                                                                         delta_t, 0.5667, 1)
+
+    # Day of the year (UTC)
+    days = epochs.view("M8[ns]").astype("M8[D]")
+    day_of_year = (days - days.astype("M8[Y]")).astype(np.int64) + 1
+
+    airmass = None
+    if airmass_model is not None:
+        airmass = atmosphere.get_relative_airmass(apparent_zenith, model=airmass_model)
+
+    return {"apparent_zenith": apparent_zenith,
+            "zenith": zenith,
+            "azimuth": azimuth,
+            "dni_extra": irradiance.get_extra_radiation(day_of_year),
+            "airmass_relative": airmass,
+            }
+
+
+class CoreFleet:
+    """
+    Parameters of pv-systems as arrays.
+
+    The arrays of all systems are reduced to distinct dc groups (orientation, aoi, temperature and CEC module
+    parameters), the dc model is evaluated once per group and scaled with the modules per string and the strings
+    of every array.
+
+    Parameters
+    ----------
+    pv_systems: list[pvlib.pvsystem.PVSystem]
+        PVSystem objects with fixed mounts, CEC module parameters, sapm temperature model parameters
+        and Sandia inverter parameters (e.g. `main.setup_systems()`).
+    """
+
+    def __init__(self, pv_systems):
+        from pvlib import pvsystem
+
+        self.names = [pv_system.name for pv_system in pv_systems]
+
+        orientations = []
+        rows = []
+        system_index = []
+        modules_per_string = []
+        strings = []
+        for i, pv_system in enumerate(pv_systems):
+            for array in pv_system.arrays:
+                key = (array.mount.surface_tilt, array.mount.surface_azimuth, array.albedo)
+                if key not in orientations:
+                    orientations.append(key)
+                parameters = array.module_parameters
+                rows.append([orientations.index(key)]
+                            + [float(parameters.get(name, IAM_DEFAULTS[name])) for name in IAM_PARAMETERS]
+                            + [float(parameters.get("FD", 1.))]
+                            + [float(array.temperature_model_parameters[name]) for name in TEMPERATURE_PARAMETERS]
+                            + [float(parameters[name]) for name in CEC_PARAMETERS])
+                system_index.append(i)
+                modules_per_string.append(array.modules_per_string)
+                strings.append(array.strings)
+
+        # Orientations as column vectors (orientations, 1)
+        self.surface_tilt, self.surface_azimuth, self.albedo = (np.array(values, dtype=np.float64)[:, np.newaxis]
+                                                                for values in zip(*orientations))
+
+        # Distinct dc groups
+        groups, group_index = np.unique(np.array(rows, dtype=np.float64), axis=0, return_inverse=True)
+        self.group_index = group_index.ravel()
+        self.orientation_index = groups[:, 0].astype(np.int64)
+        columns = iter(range(1, groups.shape[1]))
+        self.iam = {name: groups[:, next(columns)][:, np.newaxis] for name in IAM_PARAMETERS}
+        self.fd = groups[:, next(columns)][:, np.newaxis]
+        self.temperature = {name: groups[:, next(columns)][:, np.newaxis] for name in TEMPERATURE_PARAMETERS}
+        self.cec = {name: groups[:, next(columns)] for name in CEC_PARAMETERS}
+
+        # Arrays: system, scaling of the module values and pvwatts losses (power and voltage, like ModelChain)
+        self.system_index = np.array(system_index, dtype=np.int64)
+        derate = np.array([(100 - pvsystem.pvwatts_losses(**(pv_system.losses_parameters or {}))) / 100
+                           for pv_system in pv_systems])
+        self.voltage_scale = (np.array(modules_per_string, dtype=np.float64) * derate[self.system_index])[:, np.newaxis]
+        self.power_scale = self.voltage_scale * np.array(strings, dtype=np.float64)[:, np.newaxis]
+
+        self.inverters = htw_inverter.stack_parameters([pv_system.inverter_parameters for pv_system in pv_systems])
+        self.single_array = np.array_equal(self.system_index, np.arange(len(pv_systems)))
+
+    @property
+    def group_count(self):
+        """
+        Number of distinct dc groups.
+        """
+        return len(self.orientation_index)
+
+
+def _max_power_point(cec, effective_irradiance, cell_temperature):
+    """
+    CEC single diode model of the dc groups (maximum power point) for the time steps with irradiation.
+
+    The maximum power point is found with the newton method (`pvlib.pvsystem.max_power_point`), which is much
+    faster for many time steps than the lambertw method of ModelChain (difference of the annual yield < 1e-6 kWh).
+
+    Parameters
+    ----------
+    cec: dict
+        CEC parameters, arrays (groups,).
+    effective_irradiance, cell_temperature: np.ndarray
+        Arrays (groups, time steps).
+
+    Returns
+    -------
+    p_mp, v_mp: np.ndarray
+        Power in W and voltage in V of one module, arrays (groups, time steps). 0 without irradiation,
+        NaN for missing weather values.
+    """
+    from pvlib import pvsystem
+
+    p_mp = np.where(np.isnan(effective_irradiance), np.nan, 0.)
+    v_mp = p_mp.copy()
+
+    daylight = effective_irradiance > 0
+    rows = np.nonzero(daylight)[0]
+    if rows.size:
+        params = pvsystem.calcparams_cec(effective_irradiance[daylight], cell_temperature[daylight],
+                                         **{name: values[rows] for name, values in cec.items()})
+        out = pvsystem.max_power_point(*params, method="newton")
+        p_mp[daylight] = out["p_mp"]
+        v_mp[daylight] = out["v_mp"]
+    return p_mp, v_mp
+
+
+def core_ac(fleet, geometry, ghi, dni, dhi, temp_air, wind_speed, model="haydavies", engine="auto"):
+    """
+    Calculates the ac power of the pv-systems for the geometry of the sun (stages poa, dc and ac of one chunk).
+
+    Parameters
+    ----------
+    fleet: CoreFleet
+        Parameters of the pv-systems.
+    geometry: dict
+        "apparent_zenith", "azimuth" in degree, "dni_extra" in W/m² and "airmass_relative" (see `solar_geometry`).
+    ghi, dni, dhi: np.ndarray
+        Irradiation in W/m² (time steps,).
+    temp_air, wind_speed: np.ndarray or float
+        Air temperature in °C and wind speed in m/s.
+    model: str
+        Transposition model.
+    engine: str
+        Engine of the inverter model of single array systems (see `htw_inverter.sandia`).
+
+    Returns
+    -------
+    np.ndarray
+        ac power in W, array (systems, time steps).
+    """
+    from pvlib import iam, irradiance, temperature
+
+    # POA irradiation of the distinct orientations (orientations x time steps)
+    poa = irradiance.get_total_irradiance(fleet.surface_tilt, fleet.surface_azimuth,
+                                          geometry["apparent_zenith"], geometry["azimuth"],
+                                          dni, ghi, dhi,
+                                          dni_extra=geometry["dni_extra"],
+                                          airmass=geometry["airmass_relative"],
+                                          albedo=fleet.albedo, model=model)
+    aoi = irradiance.aoi(fleet.surface_tilt, fleet.surface_azimuth,
+                         geometry["apparent_zenith"], geometry["azimuth"])
+
+    # Effective irradiation, cell temperature and dc power of the dc groups (groups x time steps)
+    shape = (len(fleet.surface_tilt), len(ghi))
+    orientation = fleet.orientation_index
+    effective_irradiance = (np.broadcast_to(poa["poa_direct"], shape)[orientation]
+                            * iam.physical(aoi[orientation], **fleet.iam)
+                            + fleet.fd * np.broadcast_to(poa["poa_diffuse"], shape)[orientation])
+    cell_temperature = temperature.sapm_cell(np.broadcast_to(poa["poa_global"], shape)[orientation],
+                                             temp_air, wind_speed, **fleet.temperature)
+    p_mp, v_mp = _max_power_point(fleet.cec, effective_irradiance, cell_temperature)
+
+    # dc power of the arrays and ac power of the inverters (systems x time steps)
+    p_dc = p_mp[fleet.group_index] * fleet.power_scale
+    v_dc = v_mp[fleet.group_index] * fleet.voltage_scale
+    if fleet.single_array:
+        return htw_inverter.sandia(p_dc, v_dc, fleet.inverters, engine=engine)
+    return htw_inverter.sandia_multi(p_dc, v_dc, fleet.inverters, fleet.system_index, len(fleet.names))
+
+
+def run_core(fleet, epochs, values, location, model="haydavies", chunk_size=CHUNK_SIZE, keep_ac=False,
+             engine="auto"):
+    """
+    Runs the array core for all pv-systems.
+
+    Parameters
+    ----------
+    fleet: CoreFleet
+        Parameters of the pv-systems.
+    epochs: np.ndarray
+        UTC epochs in ns of the weather (regular time steps).
+    values: np.ndarray
+        Weather values, array (`WEATHER_COLUMNS`, time steps), see `weather_arrays`.
+    location: pvlib.location.Location
+        Location (latitude, longitude, altitude).
+    model: str
+        Transposition model.
+    chunk_size: int
+        Time steps per chunk.
+    keep_ac: bool
+        If True, the ac power of all time steps is returned too.
+    engine: str
+        Engine of the inverter model of single array systems (see `htw_inverter.sandia`).
+
+    Returns
+    -------
+    dict
+        "monthly": ac energy in kWh, array (systems, months), "months": UTC epochs of the month starts in ns,
+        "ac": ac power in W, array (systems, time steps) or None.
+    """
+    ghi, dni, dhi, temp_air, wind_speed = values
+    step_hours = htw_resample.time_step(epochs) / 3.6e12
+    system_count = len(fleet.names)
+
+    # Months of the time steps (months since 1970, UTC)
+    months = epochs.view("M8[ns]").astype("M8[M]").astype(np.int64)
+    first_month = int(months.min())
+    month_index = months - first_month
+    monthly = np.zeros((system_count, int(month_index.max()) + 1))
+    ac_all = np.empty((system_count, len(epochs))) if keep_ac else None
+
+    for start in range(0, len(epochs), chunk_size):
+        block = slice(start, start + chunk_size)
+
+        # Geometry of the sun, ac power of the systems (systems x time steps)
+        geometry = solar_geometry(epochs[block], location.latitude, location.longitude, location.altitude,
+                                  airmass_model="kastenyoung1989" if model == "perez" else None)
+        ac = core_ac(fleet, geometry, ghi[block], dni[block], dhi[block], temp_air[block], wind_speed[block],
+                     model=model, engine=engine)
+
+        # Monthly energy: one-hot matrix of the months of the chunk (time steps x months)
+        chunk_months = month_index[block]
+        low = int(chunk_months.min())
+        one_hot = np.zeros((len(chunk_months), int(chunk_months.max()) - low + 1))
+        one_hot[np.arange(len(chunk_months)), chunk_months - low] = step_hours / 1000
+        monthly[:, low:low + one_hot.shape[1]] += np.nan_to_num(ac) @ one_hot
+
+        if keep_ac:
+            ac_all[:, block] = ac
+
+    month_starts = np.arange(first_month, first_month + monthly.shape[1]).astype("M8[M]").astype("M8[ns]")
+    return {"monthly": monthly, "months": month_starts.astype(np.int64), "ac": ac_all}
+
+
+def core_frames(fleet, result, epochs=None):
+    """
+    Creates the DataFrames of the results (boundary of the core).
+
+    Parameters
+    ----------
+    fleet: CoreFleet
+        Parameters of the pv-systems.
+    result: dict
+        Result of `run_core`.
+    epochs: np.ndarray, optional
+        UTC epochs of the weather (only needed for the ac power).
+
+    Returns
+    -------
+    dict
+        "monthly": ac energy in kWh (one row per month, one column per system),
+        "ac": ac power in W (UTC index, one column per system) or None.
+    """
+    months = pd.DatetimeIndex(result["months"]).to_period("M")
+    frames = {"monthly": pd.DataFrame(result["monthly"].T, index=months, columns=fleet.names),
+              "ac": None}
+    if result["ac"] is not None:
+        frames["ac"] = pd.DataFrame(result["ac"].T, index=pd.DatetimeIndex(epochs, tz="UTC"), columns=fleet.names,
+                                    copy=False)
+    return frames
+
+
+def run_pandas(pv_systems, weather, location):
+    """
+    Runs the pv-systems with `ModelChain.run_model` and the monthly resampling of `main.py` (reference).
+
+    Parameters
+    ----------
+    pv_systems: list[pvlib.pvsystem.PVSystem]
+        PVSystem objects.
+    weather: pd.DataFrame
+        Weather DataFrame.
+    location: pvlib.location.Location
+        Location.
+
+    Returns
+    -------
+    pd.DataFrame
+        ac energy in kWh, one row per month, one column per system.
+    """
+    from main import setup_model
+
+    monthly = {}
+    for pv_system in pv_systems:
+        model = setup_model(pv_system.name, pv_system, location)
+        model.run_model(weather)
+        monthly[pv_system.name] = model.results.ac.resample("ME").sum() / 1000
+    return pd.DataFrame(monthly)
+
+
+def benchmark_systems(count):
+    """
+    Creates system definitions for benchmarks: the systems of `main.SYSTEMS` with different orientations.
+
+    Parameters
+    ----------
+    count: int
+        Number of systems.
+
+    Returns
+    -------
+    list[dict]
+        System definitions for `main.setup_systems`.
+    """
+    from main import SYSTEMS
+
+    tilts = [14.57, 10, 20, 30, 35]
+    azimuths = [215, 180, 135, 250]
+
+    systems = []
+    for i in range(count):
+        base = SYSTEMS[i % len(SYSTEMS)]
+        variant = i // len(SYSTEMS)
+        arrays = [dict(array, surface_tilt=tilts[variant % len(tilts)],
+                       surface_azimuth=azimuths[(variant // len(tilts)) % len(azimuths)])
+                  for array in base["arrays"]]
+        systems.append(dict(base, name=f"{base['name']}_{variant + 1:02d}", arrays=arrays))
+    return systems
+
+
+def repeat_years(epochs, values, years):
+    """
+    Repeats the weather of one year for several years (regular time steps continue after the first year).
+
+    Parameters
+    ----------
+    epochs: np.ndarray
+        UTC epochs in ns of one year.
+    values: np.ndarray
+        Weather values, array (columns, time steps).
+    years: int
+        Number of years.
+
+    Returns
+    -------
+    epochs: np.ndarray
+        UTC epochs in ns.
+    values: np.ndarray
+        Weather values, array (columns, time steps * years).
+    """
+    step = htw_resample.time_step(epochs)
+    return (epochs[0] + np.arange(len(epochs) * years, dtype=np.int64) * step,
+            np.ascontiguousarray(np.tile(values, (1, years))))
+
+
+def _benchmark_worker(pipeline, years, count, results):
+    """
+    Runs one pipeline in a new process and measures the runtime, the traced memory and the peak RSS.
+    """
+    import resource
+    import time
+    import tracemalloc
+
+    from htw_weather import load_weather
+    from main import setup_location, setup_systems
+
+    epochs, values = repeat_years(*weather_arrays(load_weather("fred")), years)
+    pv_systems = setup_systems(systems=benchmark_systems(count))
+    location = setup_location(cached=True)
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    tracemalloc.start()
+    time_start = time.perf_counter()
+    if pipeline == "core":
+        # numpy engine of the inverter model: the compilation of the numba kernel would be part of the peak RSS
+        fleet = CoreFleet(pv_systems)
+        monthly = core_frames(fleet, run_core(fleet, epochs, values, location, engine="numpy"))["monthly"]
+    else:
+        weather = pd.DataFrame(values.T, index=pd.DatetimeIndex(epochs, tz="UTC"), columns=WEATHER_COLUMNS)
+        monthly = run_pandas(pv_systems, weather, location)
+    runtime = time.perf_counter() - time_start
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    results.put({"pipeline": pipeline,
+                 "runtime in s": runtime,
+                 "traced peak in MB": traced_peak / 1e6,
+                 "peak RSS in MB": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3,
+                 "RSS before run in MB": rss_start / 1e3,
+                 "total yield in MWh": float(monthly.to_numpy().sum()) / 1000,
+                 })
+
+
+def benchmark(years=10, count=100, pipelines=("core", "pandas")):
+    """
+    Compares the pipelines, every pipeline runs in a new process (peak RSS of the process).
+
+    Parameters
+    ----------
+    years: int
+        Number of years (the weather of openFRED 2015 is repeated).
+    count: int
+        Number of pv-systems (see `benchmark_systems`).
+    pipelines: tuple[str]
+        "core" (`run_core`) and/or "pandas" (`run_pandas`).
+
+    Returns
+    -------
+    pd.DataFrame
+        Runtime (with tracemalloc), peak of the traced memory and peak RSS per pipeline.
+    """
+    import multiprocessing
+
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    for pipeline in pipelines:
+        results = context.Queue()
+        process = context.Process(target=_benchmark_worker, args=(pipeline, years, count, results))
+        process.start()
+        rows.append(results.get())
+        process.join()
+    return pd.DataFrame(rows).set_index("pipeline")
+
+
+if __name__ == "__main__":
+    import time
+
+    from htw_weather import load_weather
+    from main import setup_location, setup_systems
+
+    # Same results as the ModelChain (one year, systems of main.py)
+    weather_fred = load_weather("fred")
+    location_htw = setup_location(cached=True)
+    systems_htw = setup_systems()
+
+    time_start = time.perf_counter()
+    fleet_htw = CoreFleet(systems_htw)
+    core = core_frames(fleet_htw, run_core(fleet_htw, *weather_arrays(weather_fred), location_htw))["monthly"]
+    print(f"Runtime core: {time.perf_counter() - time_start:.2f} s")
+
+    time_start = time.perf_counter()
+    reference = run_pandas(systems_htw, weather_fred, location_htw)
+    print(f"Runtime ModelChain: {time.perf_counter() - time_start:.2f} s")
+    print(f"Max. difference of the monthly yield: {np.abs(core.to_numpy() - reference.to_numpy()).max():.2e} kWh\n")
+    print(core.sum().round(1).rename("annual_yield"), "\n")
+
+    # 10 years, 100 systems (every pipeline in a new process)
+    pd.set_option("display.width", 160)
+    pd.set_option("display.max_columns", None)
+    print(f"{' Benchmark (10 years, 100 systems) ':#^80}")
+    print(benchmark(years=10, count=100).round(1))
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains functions to export and read the results of the models.
+
+The hourly results (ac, dc, cell temperature) and the aggregated energy of every system are stored as
+Parquet dataset, partitioned by weather source, system, year and month
+(hive style: source=htw/system=wr1/year=2015/month=1/...).
+New results can be appended, so full-resolution results of many runs can be kept without re-simulation.
+"""
+
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Partition columns of the datasets
+PARTITION_COLUMNS = ["source", "system", "year", "month"]
+
+# Write modes of `write_results` (behaviour of pyarrow for existing files)
+WRITE_MODES = {"append": "overwrite_or_ignore",
+               "overwrite": "delete_matching",
+               }
+
+
+def results_to_frame(model):
+    """
+    Collects the time series results of a model in one DataFrame.
+
+    Parameters
+    ----------
+    model: pvlib.modelchain.ModelChain
+        ModelChain object after `run_model`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Results with the columns "ac" (W), "p_dc" (W), "v_dc" (V) and "cell_temperature" (°C).
+    """
+    results = model.results
+    p_dc, v_dc = dc_power(results.dc)
+
+    cell_temperature = results.cell_temperature
+    if isinstance(cell_temperature, tuple):
+        cell_temperature = pd.concat(cell_temperature, axis=1).mean(axis=1)
+
+    return pd.DataFrame({"ac": results.ac,
+                         "p_dc": p_dc,
+                         "v_dc": v_dc,
+                         "cell_temperature": cell_temperature,
+                         })
+
+
+def dc_power(dc):
+    """
+    Returns the dc power and voltage of the dc results of a model.
+
+    Parameters
+    ----------
+    dc: pd.DataFrame or pd.Series or tuple
+        `ModelChain.results.dc`. For multiple arrays the power is summed and the voltage is power weighted.
+
+    Returns
+    -------
+    p_dc: pd.Series
+        DC power in W.
+    v_dc: pd.Series
+        DC voltage in V (NaN if the dc model has no voltage).
+    """
+    if not isinstance(dc, tuple):
+        dc = (dc,)
+
+    powers = []
+    voltages = []
+    for dc_array in dc:
+        if isinstance(dc_array, pd.DataFrame):
+            powers.append(dc_array["p_mp"])
+            voltages.append(dc_array["v_mp"] if "v_mp" in dc_array else dc_array["p_mp"] * np.nan)
+        else:
+            powers.append(dc_array)
+            voltages.append(dc_array * np.nan)
+
+    p_dc = sum(powers)
+    if len(dc) == 1:
+        return p_dc, voltages[0]
+
+    v_dc = sum(p * v for p, v in zip(powers, voltages)) / p_dc.where(p_dc > 0)
+    return p_dc, v_dc
+
+
+def aggregate_results(df, freq="ME"):
+    """
+    Aggregates hourly results to energy values.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Hourly results from `results_to_frame`.
+    freq: str
+        Resample frequency (e.g. "D" or "ME").
+
+    Returns
+    -------
+    pd.DataFrame
+        Energy in kWh ("ac_energy", "dc_energy") and the mean cell temperature in °C.
+    """
+    aggregated = pd.DataFrame({"ac_energy": df["ac"].resample(freq).sum() / 1000,
+                               "dc_energy": df["p_dc"].resample(freq).sum() / 1000,
+                               "cell_temperature": df["cell_temperature"].resample(freq).mean(),
+                               })
+    return aggregated
+
+
+def write_results(models, path, source, freq=None, mode="append", compression="zstd"):
+    """
+    Writes the results of the models to a partitioned Parquet dataset.
+
+    Parameters
+    ----------
+    models: list[pvlib.modelchain.ModelChain]
+        ModelChain objects after `run_model`. The model name is used as system name.
+    path: str
+        Directory of the dataset.
+    source: str
+        Name of the weather source (e.g. "htw" or "fred"), used as first partition level.
+    freq: str or None
+        If None, the hourly results are written. Otherwise, the results are aggregated with this frequency.
+    mode: str
+        "append": add new files to the dataset (writing the same run twice duplicates its rows).
+        "overwrite": replace the partitions (source/system/year/month) which are written.
+    compression: str
+        Parquet compression codec (e.g. "zstd", "snappy" or "gzip").
+    """
+    if mode not in WRITE_MODES:
+        raise ValueError(f"Unknown write mode: {mode} (use {list(WRITE_MODES)})")
+
+    frames = []
+    for model in models:
+        df = results_to_frame(model)
+        if freq is not None:
+            df = aggregate_results(df, freq=freq)
+        df["source"] = source
+        df["system"] = model.name
+        frames.append(df)
+
+    df = pd.concat(frames)
+    df.index.name = "timestamp"
+    df["year"] = df.index.year
+    df["month"] = df.index.month
+    df = df.reset_index()
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    parquet_format = ds.ParquetFileFormat()
+    ds.write_dataset(pa.Table.from_pandas(df, preserve_index=False),
+                     base_dir=path,
+                     format=parquet_format,
+                     file_options=parquet_format.make_write_options(compression=compression),
+                     partitioning=PARTITION_COLUMNS,
+                     partitioning_flavor="hive",
+                     basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                     existing_data_behavior=WRITE_MODES[mode],
+                     )
+
+
+def read_results(path, systems=None, sources=None, years=None, months=None, columns=None):
+    """
+    Reads results from a partitioned Parquet dataset.
+
+    Only the partitions and columns which are requested are read.
+
+    Parameters
+    ----------
+    path: str
+        Directory of the dataset.
+    systems: list[str], optional
+        System names to read, e.g. ["wr1", "wr2"].
+    sources: list[str], optional
+        Weather sources to read, e.g. ["htw"].
+    years: list[int], optional
+        Years to read.
+    months: list[int], optional
+        Months to read (1 - 12).
+    columns: list[str], optional
+        Value columns to read, e.g. ["ac"]. The columns "system" and "source" are always read.
+
+    Returns
+    -------
+    pd.DataFrame
+        Results with the timestamp as index.
+    """
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+
+    expression = None
+    for column, values in [("system", systems), ("source", sources), ("year", years), ("month", months)]:
+        if values is not None:
+            condition = ds.field(column).isin(list(values))
+            expression = condition if expression is None else expression & condition
+
+    if columns is not None:
+        columns = ["timestamp", "system", "source"] + [column for column in columns
+                                                      if column not in ["timestamp", "system", "source"]]
+
+    df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+    df = df.set_index("timestamp").sort_index()
+
+    return df
+
+
+if __name__ == "__main__":
+    from config import PATH_EXPORT
+
+    # Read the hourly ac power of the first inverter (written by main.py)
+    print(read_results(fr"{PATH_EXPORT}hourly", systems=["wr1"], columns=["ac"]))
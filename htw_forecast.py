@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains a forecast service for the ac power of the pv-systems (nowcasting).
+
+The service is a long-lived process which keeps the fitted modules and inverters, the ModelChain objects and the
+solar position table (`htw_location.CachedLocation`) in memory. It receives short weather forecasts
+(e.g. 48 hourly steps) over a local HTTP interface and returns the ac power forecast of every inverter.
+
+For short forecasts the pandas overhead of `ModelChain.run_model` dominates (mostly the single diode model on
+Series). Therefore the service evaluates the model chain of `main.setup_model` with the numpy stages of the array
+core (`evaluate_model`, `htw_core.core_ac`). Before the first forecast with `evaluate_model` it is checked that it
+gives the same results as `ModelChain.run_model` (with the check weather or with the first forecast), otherwise
+the service uses `ModelChain.run_model`.
+
+Request (POST /forecast, json):
+    {"timestamp": ["2015-06-01T00:00:00+00:00", ...], "ghi": [...], "temp_air": [...], "wind_speed": [...]}
+    "dni" and "dhi" are optional, without them the diffuse irradiation is calculated (Erbs).
+
+Response (json):
+    {"timestamp": [...], "wr1": [...], ..., "wr5": [...]}  ac power in W
+"""
+
+import json
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from config import FORECAST_HOST, FORECAST_PORT, PATH_FRED_WEATHER
+from htw_weather import WEATHER_COLUMNS, convert_column_names, prepare_weather
+
+
+class ForecastService:
+    """
+    Keeps the models warm and calculates the ac power forecasts.
+    """
+
+    def __init__(self, models=None, warm_start=None, warm_end=None, check_weather=None):
+        """
+        Parameters
+        ----------
+        models: list[pvlib.modelchain.ModelChain], optional
+            Models with a `htw_location.CachedLocation`. Default: all systems of `main.SYSTEMS`.
+        warm_start, warm_end: str or pd.Timestamp, optional
+            Period of the solar position table which is calculated in advance (UTC, hourly).
+        check_weather: pd.DataFrame, optional
+            Weather (with dni and dhi) to check `evaluate_model` against `ModelChain.run_model`.
+            If None, the first forecast is checked.
+        """
+        import htw_core
+
+        if models is None:
+            from main import setup_location, setup_models
+
+            models = setup_models(location=setup_location(cached=True))
+
+        self.models = models
+        self.location = models[0].location
+        self._lock = threading.Lock()  # the ModelChain objects keep their results, one forecast at a time
+
+        if warm_start is not None and hasattr(self.location, "warm"):
+            for method in {model.solar_position_method for model in models}:
+                self.location.warm(warm_start, warm_end, method=method)
+
+        # Parameter arrays of the pv-systems for `evaluate_model`
+        self.fleets = {model.name: htw_core.CoreFleet([model.system]) for model in models}
+
+        # None: `evaluate_model` is not checked yet
+        self.fast = None if check_weather is None else self.check(check_weather)
+
+    def forecast(self, weather):
+        """
+        Calculates the ac power forecast of all models.
+
+        Parameters
+        ----------
+        weather: pd.DataFrame
+            Weather forecast with datetime index and the columns "ghi", "temp_air", "wind_speed"
+            and optionally "dni" and "dhi".
+
+        Returns
+        -------
+        pd.DataFrame
+            ac power in W, one column per model.
+        """
+        if "dni" not in weather or "dhi" not in weather:
+            weather = self.decompose(weather)
+
+        weather = prepare_weather(weather, freq=None)
+
+        if self.fast is None:
+            with self._lock:
+                if self.fast is None:
+                    self.fast = self.check(weather)
+
+        forecast = {}
+        if self.fast:
+            for model in self.models:
+                solar_position = self.location.get_solarposition(weather.index, method=model.solar_position_method)
+                forecast[model.name] = evaluate_model(model, weather, solar_position, self.fleets[model.name])
+            return pd.DataFrame(forecast, index=weather.index)
+
+        with self._lock:
+            for model in self.models:
+                model.run_model(weather=weather)
+                forecast[model.name] = model.results.ac
+
+        return pd.DataFrame(forecast)
+
+    def check(self, weather, tolerance=0.01):
+        """
+        Checks that `evaluate_model` gives the same ac power as `ModelChain.run_model` for all models.
+
+        Parameters
+        ----------
+        weather: pd.DataFrame
+            Weather with the columns "ghi", "dni", "dhi", "temp_air" and "wind_speed".
+        tolerance: float
+            Maximum absolute difference in W.
+
+        Returns
+        -------
+        bool
+            True, if the differences of all models are within the tolerance.
+        """
+        weather = prepare_weather(weather, freq=None)
+        for model in self.models:
+            model.run_model(weather=weather)
+            solar_position = self.location.get_solarposition(weather.index, method=model.solar_position_method)
+            ac = evaluate_model(model, weather, solar_position, self.fleets[model.name])
+            if not np.allclose(ac, model.results.ac.to_numpy(), rtol=0, atol=tolerance, equal_nan=True):
+                return False
+        return True
+
+    def decompose(self, weather):
+        """
+        Calculates dni and dhi from ghi (Erbs) with the solar position table.
+
+        Parameters
+        ----------
+        weather: pd.DataFrame
+            Weather with datetime index and the column "ghi".
+
+        Returns
+        -------
+        pd.DataFrame
+            Weather with the additional columns "dni" and "dhi".
+        """
+        from pvlib import irradiance
+
+        solar_position = self.location.get_solarposition(weather.index, method=self.models[0].solar_position_method)
+        irradiation = irradiance.erbs(ghi=weather.ghi, zenith=solar_position.zenith,
+                                      datetime_or_doy=weather.index.dayofyear)
+
+        weather = weather.copy()
+        weather["dni"] = irradiation["dni"]
+        weather["dhi"] = irradiation["dhi"]
+        return weather
+
+
+def evaluate_model(model, weather, solar_position, fleet=None):
+    """
+    Calculates the ac power of a model with numpy arrays.
+
+    The stages poa, dc and ac of the array core (`htw_core.core_ac`) are evaluated with the solar position of the
+    location and the transposition and airmass model of the ModelChain.
+
+    Parameters
+    ----------
+    model: pvlib.modelchain.ModelChain
+        ModelChain object (configured like `main.setup_model`).
+    weather: pd.DataFrame
+        Weather with the columns "ghi", "dni", "dhi" and optionally "temp_air" and "wind_speed".
+    solar_position: pd.DataFrame
+        Solar position of the weather index.
+    fleet: htw_core.CoreFleet, optional
+        Parameters of the pv-system of the model. Default: created from `model.system`.
+
+    Returns
+    -------
+    np.ndarray
+        ac power in W.
+    """
+    from pvlib import atmosphere, irradiance
+
+    import htw_core
+
+    if fleet is None:
+        fleet = htw_core.CoreFleet([model.system])
+
+    apparent_zenith = solar_position["apparent_zenith"].to_numpy()
+    if model.airmass_model in atmosphere.APPARENT_ZENITH_MODELS:
+        airmass = atmosphere.get_relative_airmass(apparent_zenith, model=model.airmass_model)
+    else:
+        airmass = atmosphere.get_relative_airmass(solar_position["zenith"].to_numpy(), model=model.airmass_model)
+    geometry = {"apparent_zenith": apparent_zenith,
+                "azimuth": solar_position["azimuth"].to_numpy(),
+                "dni_extra": irradiance.get_extra_radiation(weather.index).to_numpy(),
+                "airmass_relative": airmass,
+                }
+
+    # Short forecasts: the numpy engine of the inverter model (no compilation of the numba kernel)
+    return htw_core.core_ac(fleet, geometry,
+                            weather["ghi"].to_numpy(dtype=np.float64),
+                            weather["dni"].to_numpy(dtype=np.float64),
+                            weather["dhi"].to_numpy(dtype=np.float64),
+                            weather["temp_air"].to_numpy(dtype=np.float64) if "temp_air" in weather else 20.,
+                            weather["wind_speed"].to_numpy(dtype=np.float64) if "wind_speed" in weather else 0.,
+                            model=model.transposition_model, engine="numpy")[0]
+
+
+def weather_from_json(data):
+    """
+    Creates the weather DataFrame of a forecast request.
+
+    Parameters
+    ----------
+    data: dict
+        Request with "timestamp" and the weather columns as lists.
+
+    Returns
+    -------
+    pd.DataFrame
+        Weather with datetime index.
+    """
+    index = pd.DatetimeIndex(pd.to_datetime(data["timestamp"], utc=True), name="timestamp")
+    columns = {column: np.asarray(data[column], dtype=np.float64) for column in WEATHER_COLUMNS if column in data}
+    return pd.DataFrame(columns, index=index)
+
+
+def forecast_to_json(forecast):
+    """
+    Converts the forecast DataFrame to the response of a forecast request.
+
+    Parameters
+    ----------
+    forecast: pd.DataFrame
+        ac power forecast from `ForecastService.forecast`.
+
+    Returns
+    -------
+    dict
+        "timestamp" (ISO strings) and one list per model (NaN as None).
+    """
+    data = {"timestamp": [timestamp.isoformat() for timestamp in forecast.index]}
+    for column in forecast.columns:
+        data[column] = [None if np.isnan(value) else value for value in forecast[column].to_numpy(dtype=float)]
+    return data
+
+
+def create_server(service, host=FORECAST_HOST, port=FORECAST_PORT):
+    """
+    Creates the HTTP server of the forecast service.
+
+    Parameters
+    ----------
+    service: ForecastService
+        Service with the warm models.
+    host: str
+        Host name.
+    port: int
+        Port (0: a free port is used).
+
+    Returns
+    -------
+    http.server.ThreadingHTTPServer
+        Server, start it with `serve_forever()`.
+    """
+
+    class ForecastHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok", "models": [model.name for model in service.models]})
+            else:
+                self._send(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/forecast":
+                self._send(404, {"error": f"unknown path {self.path}"})
+                return
+            try:
+                data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                forecast = service.forecast(weather_from_json(data))
+            except (KeyError, ValueError, TypeError) as error:
+                self._send(400, {"error": str(error)})
+                return
+            self._send(200, forecast_to_json(forecast))
+
+        def _send(self, status, data):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # no console output per request
+
+    return ThreadingHTTPServer((host, port), ForecastHandler)
+
+
+def request_forecast(weather, url=f"http://{FORECAST_HOST}:{FORECAST_PORT}/forecast", timeout=10):
+    """
+    Sends a weather forecast to the forecast service and returns the ac power forecast.
+
+    Parameters
+    ----------
+    weather: pd.DataFrame
+        Weather forecast with datetime index (see `ForecastService.forecast`).
+    url: str
+        URL of the service.
+    timeout: float
+        Timeout in s.
+
+    Returns
+    -------
+    pd.DataFrame
+        ac power in W, one column per model.
+    """
+    data = {"timestamp": [timestamp.isoformat() for timestamp in weather.index]}
+    for column in weather.columns:
+        data[column] = weather[column].astype(float).tolist()
+
+    request = urllib.request.Request(url, data=json.dumps(data).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        result = json.loads(response.read())
+
+    index = pd.DatetimeIndex(pd.to_datetime(result.pop("timestamp")), name="timestamp")
+    return pd.DataFrame(result, index=index, dtype=float)
+
+
+def forecast_feed(start, steps=48, path=PATH_FRED_WEATHER):
+    """
+    Stand-in for a weather forecast feed: a window of the openFRED weather-data.
+
+    Parameters
+    ----------
+    start: str or pd.Timestamp
+        First time step of the forecast (UTC).
+    steps: int
+        Number of hourly time steps.
+    path: str
+        Path of the openFRED weather file.
+
+    Returns
+    -------
+    pd.DataFrame
+        Hourly weather with the columns "ghi", "temp_air" and "wind_speed" (no dni and dhi, like a forecast).
+    """
+    df = pd.read_csv(path, sep=",")
+    df = convert_column_names(df, time="time", ghi="ghi", wind_speed="wind_speed", temp_air="temp_air")
+    weather = df[["ghi", "temp_air", "wind_speed"]].resample("h").mean()
+
+    start = pd.Timestamp(start)
+    start = start.tz_localize("UTC") if start.tz is None else start
+    return weather[weather.index >= start].iloc[:steps]
+
+
+if __name__ == "__main__":
+    import time
+
+    from htw_weather import load_weather
+
+    # Start the service with warm models and solar position table (checked with one month of openFRED data)
+    forecast_service = ForecastService(warm_start="2015-01-01", warm_end="2016-01-01",
+                                       check_weather=load_weather("fred").loc["2015-06"])
+    print(f"Fast evaluation: {forecast_service.fast}")
+    server = create_server(forecast_service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Forecast service: http://{FORECAST_HOST}:{server.server_address[1]}/forecast")
+
+    # Request forecasts of the stand-in feed
+    feed = forecast_feed("2015-06-01", steps=48)
+    for _ in range(3):
+        time_start = time.perf_counter()
+        result = request_forecast(feed, url=f"http://{FORECAST_HOST}:{server.server_address[1]}/forecast")
+        print(f"Latency: {1000 * (time.perf_counter() - time_start):.1f} ms")
+
+    print(result.round(1))
+    server.shutdown()
@@ -3,20 +3,35 @@
 
 """
 This script contains the pv-inverter of the htw pv-system.
+
+Besides the pvlib parameters, it contains a kernel for the Sandia inverter model which evaluates the dc power and
+voltage of many inverters at once (numba, if installed, otherwise numpy) and an interpolation of the
+efficiency tables (eta at the measuring points of the voltage levels) as alternative to the Sandia model.
+`sandia` and `sandia_multi` (inverters with several arrays) are the Sandia model of all scripts, with `clip=False`
+they return the ac power without the limit "Paco" (clipping losses).
 """
 
+from functools import lru_cache
+
 import numpy as np
-from pvlib import inverter
 
+# Parameters of the Sandia inverter model which are used by the kernel
+SANDIA_PARAMETERS = ["Paco", "Pdco", "Vdco", "Pso", "C0", "C1", "C2", "C3", "Pnt"]
 
-def inv1():
+# Time steps per block of the numpy kernel
+KERNEL_BLOCK_SIZE = 16384
+
+
+@lru_cache(maxsize=None)
+def inv1_data():
     """
-    Import the Inverter Danfoss DLX 2.9 to pvlib
+    Efficiency data of the Inverter Danfoss DLX 2.9
 
     Returns
     -------
     Dictionary
-        inverter dictionary, type: sandia model
+        ac power, dc power, dc voltage and voltage level of the measuring points, p_ac_0 and p_nt
+        (input of `pvlib.inverter.fit_sandia`, do not modify the returned object).
     """
     # inverter efficiency at different power points (source: PV*SOL)
     eta_min = [0, 0.953, 0.959, 0.963, 0.9612, 0.959]  # P/P_max = 0, 0.2, 0.3, 0.5, 0.75, 1; U = 210V
@@ -50,20 +65,33 @@ def inv1():
         "p_nt": 1.  # power consumed while inverter is not delivering AC power
     }
 
-    # call method that creates sandia inverter model
-    inverter_1 = inverter.fit_sandia(sma_sb_data["ac_power"], sma_sb_data["dc_power"], sma_sb_data["dc_voltage"],
-                                     sma_sb_data["dc_voltage_level"], sma_sb_data["p_ac_0"], sma_sb_data["p_nt"])
-    return inverter_1
+    return sma_sb_data
 
 
-def inv2():
+@lru_cache(maxsize=None)
+def inv1():
     """
-    Import the Inverter SMA SUNNY BOY 3000HF to pvlib
+    Import the Inverter Danfoss DLX 2.9 to pvlib
 
     Returns
     -------
     Dictionary
         inverter dictionary, type: sandia model
+        The parameters are fitted once and cached (do not modify the returned object).
+    """
+    return fit_inverter(inv1_data())
+
+
+@lru_cache(maxsize=None)
+def inv2_data():
+    """
+    Efficiency data of the Inverter SMA SUNNY BOY 3000HF
+
+    Returns
+    -------
+    Dictionary
+        ac power, dc power, dc voltage and voltage level of the measuring points, p_ac_0 and p_nt
+        (input of `pvlib.inverter.fit_sandia`, do not modify the returned object).
     """
     # inverter efficiency at different power points (source: SMA WirkungDerat-TI-de-36 | Version 3.6)
     eta_min = [0, 0.942, 0.95, 0.951, 0.94, 0.932]  # P/P_max = 0, 0.2, 0.3, 0.5, 0.75, 1; U = 210V
@@ -97,12 +125,340 @@ def inv2():
         "p_nt": 1.
     }
 
+    return sma_sb_data
+
+
+@lru_cache(maxsize=None)
+def inv2():
+    """
+    Import the Inverter SMA SUNNY BOY 3000HF to pvlib
+
+    Returns
+    -------
+    Dictionary
+        inverter dictionary, type: sandia model
+        The parameters are fitted once and cached (do not modify the returned object).
+    """
+    return fit_inverter(inv2_data())
+
+
+def fit_inverter(data):
+    """
+    Fits the parameters of the Sandia inverter model to the efficiency data.
+
+    Parameters
+    ----------
+    data: dict
+        Efficiency data (e.g. from `inv1_data`).
+
+    Returns
+    -------
+    Dictionary
+        inverter dictionary, type: sandia model
+    """
     # call method that creates sandia inverter model
-    inverter_2 = inverter.fit_sandia(sma_sb_data["ac_power"], sma_sb_data["dc_power"], sma_sb_data["dc_voltage"],
-                                     sma_sb_data["dc_voltage_level"], sma_sb_data["p_ac_0"], sma_sb_data["p_nt"])
-    return inverter_2
+    from pvlib import inverter
+
+    return inverter.fit_sandia(data["ac_power"], data["dc_power"], data["dc_voltage"],
+                               data["dc_voltage_level"], data["p_ac_0"], data["p_nt"])
+
+
+def stack_parameters(inverters):
+    """
+    Stacks the Sandia parameters of several inverters for `sandia`.
+
+    Parameters
+    ----------
+    inverters: list[dict]
+        Sandia parameters (e.g. `[inv1(), inv2()]`).
+
+    Returns
+    -------
+    dict
+        Parameter name: array (inverters, 1).
+    """
+    return {key: np.array([float(inverter[key]) for inverter in inverters])[:, np.newaxis]
+            for key in SANDIA_PARAMETERS}
+
+
+def sandia(p_dc, v_dc, parameters, engine="auto", clip=True):
+    """
+    Calculates the ac power of many inverters with the Sandia inverter model (like `pvlib.inverter.sandia`).
+
+    Parameters
+    ----------
+    p_dc: np.ndarray
+        dc power in W, array (inverters, time steps) or (time steps,).
+    v_dc: np.ndarray
+        dc voltage in V, same shape as `p_dc`.
+    parameters: dict
+        Stacked parameters from `stack_parameters` (or the parameters of one inverter).
+    engine: str
+        "numba", "numpy" or "auto" (numba, if it is installed).
+    clip: bool
+        If False, the ac power is not limited to "Paco".
+
+    Returns
+    -------
+    np.ndarray
+        ac power in W, array (inverters, time steps). Limited to "Paco", "-Pnt" if the dc power is below "Pso".
+    """
+    parameters = {key: np.atleast_2d(np.asarray(parameters[key], dtype=np.float64))
+                  for key in SANDIA_PARAMETERS}
+    p_dc = np.asarray(p_dc, dtype=np.float64)
+    v_dc = np.asarray(v_dc, dtype=np.float64)
+
+    kernel = _numba_kernel() if engine in ["auto", "numba"] else None
+    if engine == "numba" and kernel is None:
+        raise ImportError("The numba engine of the inverter kernel needs numba (pip install numba).")
+
+    shape = np.broadcast_shapes(p_dc.shape, v_dc.shape, parameters["Paco"].shape)
+    p_dc = np.broadcast_to(p_dc, shape)
+    v_dc = np.broadcast_to(v_dc, shape)
+    out = np.empty(shape, dtype=np.float64)
+
+    if kernel is not None:
+        table = np.hstack([np.broadcast_to(parameters[key], (shape[0], 1)) for key in SANDIA_PARAMETERS])
+        kernel(np.ascontiguousarray(p_dc), np.ascontiguousarray(v_dc), np.ascontiguousarray(table), clip, out)
+        return out
+
+    # Blocks of time steps, so the temporary arrays of numpy stay in the cpu cache
+    for start in range(0, shape[1], KERNEL_BLOCK_SIZE):
+        block = slice(start, start + KERNEL_BLOCK_SIZE)
+        out[:, block] = _sandia_limits(_sandia_numpy(p_dc[:, block], v_dc[:, block], parameters), p_dc[:, block],
+                                       parameters, clip)
+    return out
+
+
+def sandia_multi(p_dc, v_dc, parameters, system_index, system_count=None, clip=True):
+    """
+    Calculates the ac power of inverters with several arrays (like `pvlib.inverter.sandia_multi`).
+
+    The efficiency is calculated with the total dc power of the inverter and the voltage of every array,
+    the arrays are weighted with their dc power.
+
+    Parameters
+    ----------
+    p_dc: np.ndarray
+        dc power in W, array (arrays, time steps).
+    v_dc: np.ndarray
+        dc voltage in V, same shape as `p_dc`.
+    parameters: dict
+        Stacked parameters from `stack_parameters`, one row per inverter.
+    system_index: np.ndarray
+        Inverter of every array (arrays,).
+    system_count: int, optional
+        Number of inverters. Default: number of rows of the parameters.
+    clip: bool
+        If False, the ac power is not limited to "Paco".
+
+    Returns
+    -------
+    np.ndarray
+        ac power in W, array (inverters, time steps).
+    """
+    parameters = {key: np.atleast_2d(np.asarray(parameters[key], dtype=np.float64))
+                  for key in SANDIA_PARAMETERS}
+    p_dc = np.atleast_2d(np.asarray(p_dc, dtype=np.float64))
+    v_dc = np.atleast_2d(np.asarray(v_dc, dtype=np.float64))
+    system_index = np.asarray(system_index, dtype=np.int64)
+    if system_count is None:
+        system_count = parameters["Paco"].shape[0]
+
+    p_total = np.zeros((system_count, p_dc.shape[1]))
+    np.add.at(p_total, system_index, p_dc)
+    p_system = p_total[system_index]
+    array_parameters = {key: np.broadcast_to(values, (system_count, 1))[system_index]
+                        for key, values in parameters.items()}
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ac_array = _sandia_numpy(p_system, v_dc, array_parameters)
+        weight = np.where(p_system > 0, p_dc / p_system, 0.)
+
+    ac = np.zeros_like(p_total)
+    np.add.at(ac, system_index, weight * ac_array)
+    return _sandia_limits(ac, p_total, parameters, clip)
+
+
+def _sandia_numpy(p_dc, v_dc, parameters):
+    """
+    Sandia inverter model with numpy without the limits (broadcast of the parameters (inverters, 1) and the time
+    steps).
+    """
+    dv = v_dc - parameters["Vdco"]
+    a = parameters["Pdco"] * (1 + parameters["C1"] * dv)
+    b = parameters["Pso"] * (1 + parameters["C2"] * dv)
+    c = parameters["C0"] * (1 + parameters["C3"] * dv)
+
+    a -= b
+    b = p_dc - b
+    ac = (parameters["Paco"] / a - c * a) * b
+    ac += c * b * b
+    return ac
+
+
+def _sandia_limits(ac, p_dc, parameters, clip=True):
+    """
+    Limits of the Sandia inverter model: "Paco" (if `clip`) and "-Pnt" if the dc power is below "Pso".
+    """
+    if clip:
+        np.minimum(ac, parameters["Paco"], out=ac)
+    return np.where(p_dc < parameters["Pso"], -np.abs(parameters["Pnt"]), ac)
+
+
+@lru_cache(maxsize=None)
+def _numba_kernel():
+    """
+    Compiles the Sandia inverter model with numba (None, if numba is not installed).
+    """
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit(parallel=True)
+    def kernel(p_dc, v_dc, table, clip, out):
+        for i in range(p_dc.shape[0]):
+            paco, pdco, vdco, pso, c0, c1, c2, c3, pnt = table[i]
+            for j in numba.prange(p_dc.shape[1]):
+                p = p_dc[i, j]
+                dv = v_dc[i, j] - vdco
+                a = pdco * (1 + c1 * dv)
+                b = pso * (1 + c2 * dv)
+                c = c0 * (1 + c3 * dv)
+                ac = (paco / (a - b) - c * (a - b)) * (p - b) + c * (p - b) ** 2
+                if clip and ac > paco:
+                    ac = paco
+                if p < pso:
+                    ac = -abs(pnt)
+                out[i, j] = ac
+
+    return kernel
+
+
+def efficiency_table(data):
+    """
+    Creates the efficiency table of an inverter from the efficiency data.
+
+    Parameters
+    ----------
+    data: dict
+        Efficiency data (e.g. from `inv1_data`).
+
+    Returns
+    -------
+    dict
+        "v_dc": voltage levels in V (levels,), "p_dc": dc power of the measuring points in W (levels, points),
+        "eta": efficiency (levels, points), "p_ac_0" and "p_nt" in W.
+    """
+    dc_voltage = np.asarray(data["dc_voltage"], dtype=np.float64)
+    dc_power = np.asarray(data["dc_power"], dtype=np.float64)
+    ac_power = np.asarray(data["ac_power"], dtype=np.float64)
+
+    levels = np.unique(dc_voltage)
+    p_points = []
+    eta = []
+    for level in levels:
+        mask = dc_voltage == level
+        order = np.argsort(dc_power[mask])
+        p_level = dc_power[mask][order]
+        p_points.append(p_level)
+        eta.append(np.divide(ac_power[mask][order], p_level, out=np.zeros_like(p_level), where=p_level > 0))
+
+    return {"v_dc": levels,
+            "p_dc": np.array(p_points),
+            "eta": np.array(eta),
+            "p_ac_0": float(data["p_ac_0"]),
+            "p_nt": float(data["p_nt"]),
+            }
+
+
+def table_ac(p_dc, v_dc, tables):
+    """
+    Calculates the ac power of many inverters with the efficiency tables.
+
+    The efficiency is interpolated linearly between the measuring points of every voltage level and then linearly
+    between the voltage levels (constant outside of the measured power and voltage range).
+
+    Parameters
+    ----------
+    p_dc: np.ndarray
+        dc power in W, array (inverters, time steps) or (time steps,).
+    v_dc: np.ndarray
+        dc voltage in V, same shape as `p_dc`.
+    tables: list[dict]
+        Efficiency tables from `efficiency_table` (one per inverter).
+
+    Returns
+    -------
+    np.ndarray
+        ac power in W, array (inverters, time steps). Limited to "p_ac_0", "-p_nt" without dc power.
+    """
+    shape = np.broadcast_shapes(np.shape(p_dc), np.shape(v_dc), (len(tables), 1))
+    p_dc = np.broadcast_to(np.asarray(p_dc, dtype=np.float64), shape)
+    v_dc = np.broadcast_to(np.asarray(v_dc, dtype=np.float64), shape)
+
+    ac = np.empty(shape, dtype=np.float64)
+    for i, table in enumerate(tables):
+        for start in range(0, shape[1], KERNEL_BLOCK_SIZE):
+            block = slice(start, start + KERNEL_BLOCK_SIZE)
+            ac[i, block] = _table_ac(p_dc[i, block], v_dc[i, block], table)
+
+    return ac
+
+
+def _table_ac(p_dc, v_dc, table):
+    """
+    Efficiency table interpolation of one inverter (time steps,).
+    """
+    levels = table["v_dc"]
+
+    # Efficiency of every voltage level at the dc power
+    eta_levels = np.array([np.interp(p_dc, table["p_dc"][k], table["eta"][k]) for k in range(len(levels))])
+
+    # Interpolation between the neighbouring voltage levels
+    k = np.clip(np.searchsorted(levels, v_dc, side="right") - 1, 0, len(levels) - 2)
+    weight = np.clip((v_dc - levels[k]) / (levels[k + 1] - levels[k]), 0., 1.)
+    columns = np.arange(len(p_dc))
+    eta = eta_levels[k, columns] * (1 - weight) + eta_levels[k + 1, columns] * weight
+
+    ac = np.minimum(p_dc * eta, table["p_ac_0"])
+    ac[~(p_dc > 0)] = -abs(table["p_nt"])
+    ac[np.isnan(p_dc) | np.isnan(v_dc)] = np.nan
+    return ac
 
 
 if __name__ == "__main__":
+    import time
+
+    from pvlib import inverter
+
     print(inv1())
     print(inv2())
+
+    # Benchmark: dc power and voltage of 5 inverters (SonnJA) with 2 million time steps each
+    inverters = [inv1(), inv1(), inv1(), inv2(), inv2()]
+    rng = np.random.default_rng(0)
+    p_bench = rng.uniform(0, 3500, (len(inverters), 2_000_000))
+    v_bench = rng.uniform(200, 550, (len(inverters), 2_000_000))
+
+    parameters_bench = stack_parameters(inverters)
+    tables_bench = [efficiency_table(inv1_data())] * 3 + [efficiency_table(inv2_data())] * 2
+    sandia(p_bench, v_bench, parameters_bench)  # compile and start the numba kernel
+
+    runs = {"pvlib": lambda: np.array([inverter.sandia(v, p, inv) for p, v, inv in zip(p_bench, v_bench, inverters)]),
+            "numpy": lambda: sandia(p_bench, v_bench, parameters_bench, engine="numpy"),
+            "table": lambda: table_ac(p_bench, v_bench, tables_bench)}
+    if _numba_kernel() is not None:
+        runs["numba"] = lambda: sandia(p_bench, v_bench, parameters_bench, engine="numba")
+
+    ac_pvlib = None
+    for engine, run in runs.items():
+        runtime = np.inf
+        for _ in range(3):
+            time_start = time.perf_counter()
+            ac_bench = run()
+            runtime = min(runtime, time.perf_counter() - time_start)
+        ac_pvlib = ac_bench if ac_pvlib is None else ac_pvlib
+        print(f"{engine:>6}: {p_bench.size / runtime / 1e6:6.1f} million points/s, "
+              f"max. difference to pvlib: {np.max(np.abs(ac_bench - ac_pvlib)):.2e} W")
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains the transposition of the irradiation to the plane of array (POA) as separate stage.
+
+The geometry (solar position, extraterrestrial irradiation, airmass) is calculated once per location and time index.
+The POA irradiation of one or many surfaces is calculated with it in one broadcast numpy operation
+(surfaces x time steps). The result can be used with `ModelChain.run_model_from_poa`, so systems with the same
+orientation share the POA irradiation. `ModelChain.run_model_from_poa` calculates the solar position of every
+system again, only a `htw_location.CachedLocation` takes it from its table (shared geometry for all systems).
+
+Transposition models: "isotropic", "klucher", "haydavies", "reindl", "king", "perez".
+"""
+
+import numpy as np
+import pandas as pd
+
+# Columns of the POA irradiation which are used by `ModelChain.run_model_from_poa`
+POA_COLUMNS = ["poa_global", "poa_direct", "poa_diffuse"]
+
+
+def get_geometry(location, times, solar_position_method="nrel_numpy", airmass_model="kastenyoung1989"):
+    """
+    Calculates the geometry of the sun for a location like `ModelChain.prepare_inputs`.
+
+    Parameters
+    ----------
+    location: pvlib.location.Location
+        Location (a `htw_location.CachedLocation` keeps the solar positions).
+    times: pd.DatetimeIndex
+        Time steps
+    solar_position_method: str
+        Method of `pvlib.solarposition.get_solarposition`.
+    airmass_model: str
+        Model of `pvlib.atmosphere.get_relative_airmass`.
+
+    Returns
+    -------
+    pd.DataFrame
+        "apparent_zenith", "zenith", "azimuth" in degree, "dni_extra" in W/m² and "airmass_relative".
+    """
+    from pvlib import irradiance
+
+    solar_position = location.get_solarposition(times, method=solar_position_method)
+    airmass = location.get_airmass(solar_position=solar_position, model=airmass_model)
+
+    return pd.DataFrame({"apparent_zenith": solar_position["apparent_zenith"],
+                         "zenith": solar_position["zenith"],
+                         "azimuth": solar_position["azimuth"],
+                         "dni_extra": irradiance.get_extra_radiation(times),
+                         "airmass_relative": airmass["airmass_relative"],
+                         }, index=times)
+
+
+def get_poa_irradiance(surface_tilt, surface_azimuth, geometry, weather, albedo=0.2, model="haydavies"):
+    """
+    Calculates the POA irradiation of one or many surfaces in one broadcast operation.
+
+    Parameters
+    ----------
+    surface_tilt: float or array-like
+        Tilt angles of the surfaces in degree (one value per surface).
+    surface_azimuth: float or array-like
+        Azimuth angles of the surfaces in degree (one value per surface).
+    geometry: pd.DataFrame
+        Geometry from `get_geometry` (same index as the weather).
+    weather: pd.DataFrame
+        Weather with the columns "ghi", "dni" and "dhi".
+    albedo: float or array-like
+        Albedo (one value or one value per surface).
+    model: str
+        Transposition model.
+
+    Returns
+    -------
+    dict
+        "poa_global", "poa_direct", "poa_diffuse", "poa_sky_diffuse", "poa_ground_diffuse" in W/m²,
+        arrays with the shape (surfaces, time steps).
+    """
+    from pvlib import irradiance
+
+    # Surfaces as column vectors, time steps as row vectors -> result (surfaces, time steps)
+    surface_tilt = np.atleast_1d(np.asarray(surface_tilt, dtype=np.float64))[:, np.newaxis]
+    surface_azimuth = np.atleast_1d(np.asarray(surface_azimuth, dtype=np.float64))[:, np.newaxis]
+    albedo = np.asarray(albedo, dtype=np.float64)
+    if albedo.ndim == 1:
+        albedo = albedo[:, np.newaxis]
+
+    poa = irradiance.get_total_irradiance(surface_tilt, surface_azimuth,
+                                          geometry["apparent_zenith"].to_numpy(),
+                                          geometry["azimuth"].to_numpy(),
+                                          weather["dni"].to_numpy(dtype=np.float64),
+                                          weather["ghi"].to_numpy(dtype=np.float64),
+                                          weather["dhi"].to_numpy(dtype=np.float64),
+                                          dni_extra=geometry["dni_extra"].to_numpy(),
+                                          airmass=geometry["airmass_relative"].to_numpy(),
+                                          albedo=albedo,
+                                          model=model)
+
+    shape = np.broadcast_shapes(surface_tilt.shape, surface_azimuth.shape, (1, len(weather)))
+    return {key: np.broadcast_to(value, shape) for key, value in poa.items()}
+
+
+def poa_frames(poa, weather):
+    """
+    Creates the input DataFrames of `ModelChain.run_model_from_poa` (one per surface).
+
+    Parameters
+    ----------
+    poa: dict
+        POA irradiation from `get_poa_irradiance`.
+    weather: pd.DataFrame
+        Weather, the columns "temp_air" and "wind_speed" are added for the cell temperature.
+
+    Returns
+    -------
+    list[pd.DataFrame]
+        "poa_global", "poa_direct", "poa_diffuse" (and "temp_air", "wind_speed") per surface.
+    """
+    frames = []
+    for i in range(poa["poa_global"].shape[0]):
+        frame = pd.DataFrame({column: poa[column][i] for column in POA_COLUMNS}, index=weather.index)
+        for column in ["temp_air", "wind_speed"]:
+            if column in weather:
+                frame[column] = weather[column]
+        frames.append(frame)
+    return frames
+
+
+def orientations(models):
+    """
+    Returns the distinct orientations (tilt, azimuth, albedo) of the arrays of all models.
+
+    Parameters
+    ----------
+    models: list[pvlib.modelchain.ModelChain]
+        ModelChain objects with fixed mounts.
+
+    Returns
+    -------
+    list[tuple]
+        Distinct (surface_tilt, surface_azimuth, albedo).
+    """
+    keys = []
+    for model in models:
+        for array in model.system.arrays:
+            key = (array.mount.surface_tilt, array.mount.surface_azimuth, array.albedo)
+            if key not in keys:
+                keys.append(key)
+    return keys
+
+
+def run_models_from_poa(models, weather, model="haydavies"):
+    """
+    Runs the models with a shared transposition stage.
+
+    The geometry is calculated once (all models have to use the same location, solar position and airmass model,
+    otherwise a ValueError is raised) and the POA irradiation is calculated once per distinct orientation for all
+    orientations together.
+    `ModelChain.run_model_from_poa` calculates the solar position of every model again; with a
+    `htw_location.CachedLocation` (e.g. `main.setup_location(cached=True)`) the models reuse the solar positions
+    of the shared geometry.
+
+    Parameters
+    ----------
+    models: list[pvlib.modelchain.ModelChain]
+        ModelChain objects with fixed mounts.
+    weather: pd.DataFrame
+        Weather with the columns "ghi", "dni", "dhi" and optionally "temp_air" and "wind_speed".
+    model: str
+        Transposition model.
+
+    Returns
+    -------
+    list[pvlib.modelchain.ModelChain]
+        The ModelChain objects with the results.
+    """
+    from htw_cache import location_description
+
+    # The shared geometry is only valid for models with the same location, solar position and airmass model
+    first = models[0]
+    for mc in models[1:]:
+        settings = {"location": (location_description(mc.location), location_description(first.location)),
+                    "solar_position_method": (mc.solar_position_method, first.solar_position_method),
+                    "airmass_model": (mc.airmass_model, first.airmass_model)}
+        for name, (value, value_first) in settings.items():
+            if value != value_first:
+                raise ValueError(f"The shared geometry needs the same {name} for all models: "
+                                 f"{mc.name} uses {value}, {first.name} uses {value_first}.")
+
+    geometry = get_geometry(first.location, weather.index,
+                            solar_position_method=first.solar_position_method,
+                            airmass_model=first.airmass_model)
+
+    keys = orientations(models)
+    tilts, azimuths, albedos = (np.array(values, dtype=np.float64) for values in zip(*keys))
+    poa = get_poa_irradiance(tilts, azimuths, geometry, weather, albedo=albedos, model=model)
+    frames = dict(zip(keys, poa_frames(poa, weather)))
+
+    for mc in models:
+        data = tuple(frames[(array.mount.surface_tilt, array.mount.surface_azimuth, array.albedo)]
+                     for array in mc.system.arrays)
+        mc.run_model_from_poa(data if len(data) > 1 else data[0])
+
+    return models
+
+
+if __name__ == "__main__":
+    import time
+
+    from htw_weather import load_weather
+    from main import setup_location, setup_models
+
+    weather_fred = load_weather("fred")
+    models = setup_models(location=setup_location(cached=True))
+
+    time_start = time.perf_counter()
+    run_models_from_poa(models, weather_fred, model="perez")
+    print(f"Runtime (shared transposition, perez): {time.perf_counter() - time_start:.2f} s")
+
+    print(pd.DataFrame({mc.name: [round(mc.results.ac.sum() / 1000, 1)] for mc in models}, index=["annual_yield"]).T)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains the lifetime simulation (25 - 30 years) of the pv-systems with module degradation.
+
+Every model runs once without losses for a typical year (cached, see `htw_calibration.preloss_dc`). The weather of
+this year is used for every year of the lifetime; only the dc power is scaled with the losses and the linear
+degradation of the module technology:
+
+    p_dc(year) = p_dc_0 * (1 - losses / 100) * (1 - rate / 100 * year)
+
+The inverter is evaluated for all years at once (years x time steps, `htw_inverter.sandia`), so the
+efficiency at lower power is taken into account.
+The pvwatts losses "age" (default 0) are used for all years; the degradation comes on top.
+"""
+
+import numpy as np
+import pandas as pd
+
+import htw_calibration
+import htw_inverter
+from htw_subhourly import time_step_hours
+
+# Degradation rates in %/year (median rates after the initial degradation, which is part of the "lid" losses)
+# Jordan, D. C., Kurtz, S. R. (2013): Photovoltaic Degradation Rates - an Analytical Review
+DEGRADATION_RATES = {"a-Si": 0.96,
+                     "mono-Si": 0.47,
+                     "multi-Si": 0.61,
+                     }
+
+# Technology of the modules of the htw pv-system (the CEC "Technology" of modul4 is not correct)
+MODULE_TECHNOLOGIES = {"Schott_ASI_105": "a-Si",
+                       "Aleo_Solar_S19y285": "mono-Si",
+                       "Aleo_Solar_S18_240": "mono-Si",
+                       "Aleo_Solar_S19_245": "mono-Si",
+                       }
+
+
+def module_technology(array):
+    """
+    Returns the technology of the modules of an array (key of `DEGRADATION_RATES`).
+
+    Parameters
+    ----------
+    array: pvlib.pvsystem.Array
+        pv-array
+
+    Returns
+    -------
+    str
+        "a-Si", "mono-Si" or "multi-Si".
+    """
+    if array.module in MODULE_TECHNOLOGIES:
+        return MODULE_TECHNOLOGIES[array.module]
+
+    technology = str(array.module_parameters.get("Technology", "")).lower()
+    if "a-si" in technology or "amorph" in technology:
+        return "a-Si"
+    if "multi" in technology or "poly" in technology:
+        return "multi-Si"
+    if "mono" in technology:
+        return "mono-Si"
+    raise ValueError(f"Unknown module technology of the array {array.name}: {technology}")
+
+
+def degradation_rate(system, rates=None):
+    """
+    Returns the degradation rate of a pv-system (mean of the arrays, weighted with the number of modules).
+
+    Parameters
+    ----------
+    system: pvlib.pvsystem.PVSystem
+        pv-system
+    rates: dict, optional
+        Degradation rates in %/year per technology. Default: `DEGRADATION_RATES`.
+
+    Returns
+    -------
+    float
+        Degradation rate in %/year.
+    """
+    if rates is None:
+        rates = DEGRADATION_RATES
+
+    modules = np.array([array.modules_per_string * array.strings for array in system.arrays], dtype=np.float64)
+    array_rates = np.array([rates[module_technology(array)] for array in system.arrays])
+    return float(np.dot(modules, array_rates) / modules.sum())
+
+
+def degradation_factors(years, rate):
+    """
+    Returns the linear degradation factors of the years.
+
+    Parameters
+    ----------
+    years: int
+        Number of years.
+    rate: float
+        Degradation rate in %/year.
+
+    Returns
+    -------
+    np.ndarray
+        Factors of the dc power (first year: 1), never below 0.
+    """
+    return np.maximum(1 - rate / 100 * np.arange(years), 0.)
+
+
+def lifetime_yields(models, weather, years=25, start_year=None, rates=None):
+    """
+    Calculates the annual ac energy of the models for the lifetime.
+
+    Parameters
+    ----------
+    models: list[pvlib.modelchain.ModelChain]
+        ModelChain objects (pvwatts losses, Sandia inverter model).
+    weather: pd.DataFrame
+        Weather of the typical year.
+    years: int
+        Lifetime in years.
+    start_year: int, optional
+        First year of operation. Default: year of the weather.
+    rates: dict, optional
+        Degradation rates in %/year per technology. Default: `DEGRADATION_RATES`.
+
+    Returns
+    -------
+    pd.DataFrame
+        ac energy in kWh, one row per year, one column per system.
+    """
+    from pvlib import pvsystem
+
+    if start_year is None:
+        start_year = int(weather.index[0].year)
+    step_hours = time_step_hours(weather.index)
+
+    yields = {}
+    for model in models:
+        dc = htw_calibration.preloss_dc(model, weather).fillna(0.)
+        derate = 1 - pvsystem.pvwatts_losses(**model.system.losses_parameters) / 100
+        factors = degradation_factors(years, degradation_rate(model.system, rates=rates))[:, np.newaxis]
+
+        # Years x time steps: the voltage is scaled with the losses like in ModelChain (pvwatts losses)
+        p_dc = dc["p_dc"].to_numpy(dtype=np.float64)[np.newaxis, :] * derate * factors
+        v_dc = dc["v_dc"].to_numpy(dtype=np.float64)[np.newaxis, :] * derate
+        ac = htw_inverter.sandia(p_dc, v_dc, htw_inverter.stack_parameters([model.system.inverter_parameters]))
+
+        yields[model.name] = ac.sum(axis=1) * step_hours / 1000
+
+    return pd.DataFrame(yields, index=pd.Index(np.arange(start_year, start_year + years), name="year"))
+
+
+if __name__ == "__main__":
+    import time
+
+    from htw_weather import load_weather
+    from main import setup_models
+
+    models = setup_models()
+    weather_fred = load_weather("fred")
+
+    time_start = time.perf_counter()
+    lifetime = lifetime_yields(models, weather_fred, years=30)
+    print(f"Runtime (5 systems, 30 years): {time.perf_counter() - time_start:.2f} s\n")
+
+    print(f"{' Degradation rates ':#^50}")
+    print(pd.Series({model.name: degradation_rate(model.system) for model in models}, name="rate in %/year"), "\n")
+
+    print(f"{' Annual yield (FRED typical year) ':#^50}")
+    print(lifetime.iloc[[0, 9, 19, 24, 29]].round(1), "\n")
+
+    print(f"{' Lifetime yield (30 years) ':#^50}")
+    print((lifetime.sum() / 1000).round(2).rename("MWh"))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains a location which keeps the calculated solar positions.
+
+`ModelChain` calculates the solar position on every run. With `CachedLocation` the positions of time steps which
+were already calculated are taken from a table (one table per solar position method), so repeated runs
+(forecasts, model comparisons, ...) do not calculate the solar position again.
+
+The table is calculated with the default temperature (12 °C) and the pressure of the altitude, the air temperature
+of the weather data is not used for the refraction correction (difference of the apparent zenith < 0.1°).
+The NREL SPA uses the delta_t of the year and month (`pvlib.spa.calculate_deltat`, the default of pvlib < 0.11 is
+67 s for all years).
+"""
+
+import pandas as pd
+from pvlib import atmosphere, solarposition
+from pvlib.location import Location
+
+
+class CachedLocation(Location):
+    """
+    `pvlib.location.Location` with a table of the calculated solar positions.
+    """
+
+    def __init__(self, latitude, longitude, tz='UTC', altitude=None, name=None):
+        super().__init__(latitude, longitude, tz=tz, altitude=altitude, name=name)
+        self.solar_position_tables = {}
+
+    def get_solarposition(self, times, pressure=None, temperature=12, **kwargs):
+        """
+        Returns the solar position of the times, calculated positions are taken from the table.
+
+        Parameters
+        ----------
+        times: pd.DatetimeIndex
+            Must be localized or UTC will be assumed.
+        pressure, temperature:
+            Not used (see module description).
+        kwargs:
+            passed to `pvlib.solarposition.get_solarposition` (e.g. method).
+
+        Returns
+        -------
+        pd.DataFrame
+            Solar position with the index `times`.
+        """
+        key = tuple(sorted(kwargs.items()))
+        times = pd.DatetimeIndex(times)
+        times_utc = times.tz_localize("UTC") if times.tz is None else times.tz_convert("UTC")
+
+        table = self.solar_position_tables.get(key)
+        if table is None:
+            missing = times_utc.unique()
+        else:
+            missing = times_utc.unique().difference(table.index)
+
+        if len(missing) > 0:
+            table = self._add_to_table(key, missing, kwargs)
+
+        solar_position = table.reindex(times_utc)
+        solar_position.index = times
+        return solar_position
+
+    def warm(self, start, end, freq="h", **kwargs):
+        """
+        Calculates the solar positions of a period in advance.
+
+        Parameters
+        ----------
+        start, end: str or pd.Timestamp
+            Period (UTC, if not localized).
+        freq: str
+            Time step of the table (e.g. "h" or "15min").
+        kwargs:
+            passed to `pvlib.solarposition.get_solarposition` (e.g. method).
+        """
+        times = pd.date_range(start, end, freq=freq, tz=None if pd.Timestamp(start).tz else "UTC")
+        self.get_solarposition(times, **kwargs)
+
+    def _add_to_table(self, key, times_utc, kwargs):
+        """
+        Calculates the solar positions of the times and adds them to the table.
+        """
+        if kwargs.get("method", "nrel_numpy") == "nrel_numpy":
+            kwargs = {"delta_t": None, **kwargs}
+
+        solar_position = solarposition.get_solarposition(times_utc,
+                                                         latitude=self.latitude,
+                                                         longitude=self.longitude,
+                                                         altitude=self.altitude,
+                                                         pressure=atmosphere.alt2pres(self.altitude),
+                                                         **kwargs)
+
+        table = self.solar_position_tables.get(key)
+        if table is not None:
+            solar_position = pd.concat([table, solar_position]).sort_index()
+        self.solar_position_tables[key] = solar_position
+
+        return solar_position
+
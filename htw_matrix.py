@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains the comparison of the ModelChain options (model matrix) for the htw pv-systems.
+
+The alternatives of `main.setup_model` (transposition, solar position, airmass, dc, ac, temperature and dc ohmic
+model) are enumerated as combinations (all combinations or one option at a time). A combination is split into
+stages, every stage depends only on some of the options:
+
+    geometry:    source, solar_position_method, airmass_model
+    poa:         geometry, transposition_model (the airmass is only used by "perez")
+    systems:     temperature_model (temperature model parameters of the arrays)
+    model:       all options (`ModelChain.run_model_from_poa`)
+
+The results of the stages are kept, so e.g. one solar position is used for all transposition models and one POA
+irradiation for all dc, ac and temperature models. Only the last stage is run per combination.
+Combinations which can not be run (e.g. "pvwatts" dc model without "pdc0") are kept with the error message.
+
+The clear sky model is only used by ModelChain, if one of ghi, dni and dhi is missing. The weather of HTW and
+openFRED has all three columns, so the clear sky model does not change the results.
+"""
+
+import copy
+import itertools
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# Options of `main.setup_model` (baseline of the comparison)
+BASELINE = {"clearsky_model": "ineichen",
+            "transposition_model": "haydavies",
+            "solar_position_method": "nrel_numpy",
+            "airmass_model": "kastenyoung1989",
+            "dc_model": "cec",
+            "ac_model": "sandia",
+            "aoi_model": "physical",
+            "spectral_model": "no_loss",
+            "temperature_model": "sapm",
+            "dc_ohmic_model": "no_loss",
+            "losses_model": "pvwatts",
+            }
+
+# Alternatives per option
+OPTIONS = {"transposition_model": ["haydavies", "isotropic", "klucher", "reindl", "perez"],
+           "solar_position_method": ["nrel_numpy", "ephemeris"],
+           "airmass_model": ["kastenyoung1989", "kasten1966"],
+           "dc_model": ["cec", "desoto"],
+           "ac_model": ["sandia"],
+           "temperature_model": ["sapm", "pvsyst", "faiman"],
+           "dc_ohmic_model": ["no_loss"],
+           }
+
+# Temperature model parameters of the arrays per temperature model (None: parameters of `main.TEMPERATURE_MODEL`)
+TEMPERATURE_PARAMETERS = {"sapm": None,
+                          "pvsyst": ("pvsyst", "freestanding"),
+                          "faiman": {"u0": 25.0, "u1": 6.84},  # default parameters of `pvlib.temperature.faiman`
+                          }
+
+
+def combinations(options=None, mode="product", baseline=None):
+    """
+    Enumerates combinations of the ModelChain options.
+
+    Parameters
+    ----------
+    options: dict, optional
+        Alternatives per option. Default: `OPTIONS`.
+    mode: str
+        "product" (all combinations) or "one_at_a_time" (the baseline and every alternative alone).
+    baseline: dict, optional
+        Options of the baseline. Default: `BASELINE`.
+
+    Returns
+    -------
+    list[dict]
+        Complete options of every combination, the baseline is always the first one.
+    """
+    if options is None:
+        options = OPTIONS
+    if baseline is None:
+        baseline = BASELINE
+
+    combos = [dict(baseline)]
+    if mode == "product":
+        keys = list(options)
+        for values in itertools.product(*(options[key] for key in keys)):
+            combos.append({**baseline, **dict(zip(keys, values))})
+    elif mode == "one_at_a_time":
+        for key, values in options.items():
+            combos.extend({**baseline, key: value} for value in values)
+    else:
+        raise ValueError(f"Unknown mode: {mode} (use 'product' or 'one_at_a_time')")
+
+    # Remove duplicates (e.g. the baseline in the product), keep the order
+    unique = []
+    for combo in combos:
+        if combo not in unique:
+            unique.append(combo)
+    return unique
+
+
+def combination_label(combo, baseline=None):
+    """
+    Returns a short name of a combination (the options which differ from the baseline).
+
+    Parameters
+    ----------
+    combo: dict
+        Options of the combination.
+    baseline: dict, optional
+        Options of the baseline. Default: `BASELINE`.
+
+    Returns
+    -------
+    str
+        e.g. "transposition=perez, temperature=pvsyst" or "baseline".
+    """
+    if baseline is None:
+        baseline = BASELINE
+    changes = [f"{key.replace('_model', '').replace('_method', '')}={value}"
+               for key, value in combo.items() if baseline.get(key) != value]
+    return ", ".join(changes) if changes else "baseline"
+
+
+class MatrixRunner:
+    """
+    Runs combinations of ModelChain options with shared (memoized) stages.
+
+    Parameters
+    ----------
+    weathers: dict
+        Weather DataFrames per source (e.g. {"htw": ..., "fred": ...}) with the columns "ghi", "dni", "dhi",
+        "temp_air" and "wind_speed".
+    location: pvlib.location.Location, optional
+        Location. Default: `main.setup_location(cached=True)`.
+    systems: list[dict], optional
+        System definitions. Default: `main.SYSTEMS`.
+    """
+
+    def __init__(self, weathers, location=None, systems=None):
+        import main
+
+        self.weathers = weathers
+        self.location = main.setup_location(cached=True) if location is None else location
+        self.systems = systems
+        self.stages = {"geometry": {}, "poa": {}, "systems": {}}
+        self.computations = Counter()
+        self.hits = Counter()
+
+    def _stage(self, stage, key, function):
+        """
+        Returns the result of a stage, it is only calculated on the first request of the key.
+        """
+        results = self.stages[stage]
+        if key in results:
+            self.hits[stage] += 1
+        else:
+            results[key] = function()
+            self.computations[stage] += 1
+        return results[key]
+
+    def geometry(self, source, solar_position_method, airmass_model):
+        """
+        Returns the geometry of the sun for the time steps of a source (see `htw_irradiance.get_geometry`).
+        """
+        from htw_irradiance import get_geometry
+
+        return self._stage("geometry", (source, solar_position_method, airmass_model),
+                           lambda: get_geometry(self.location, self.weathers[source].index,
+                                                solar_position_method=solar_position_method,
+                                                airmass_model=airmass_model))
+
+    def poa(self, source, solar_position_method, airmass_model, transposition_model, keys):
+        """
+        Returns the input DataFrames of `ModelChain.run_model_from_poa` per orientation.
+
+        Parameters
+        ----------
+        source: str
+            Weather source.
+        solar_position_method, airmass_model, transposition_model: str
+            ModelChain options.
+        keys: list[tuple]
+            Orientations (surface_tilt, surface_azimuth, albedo), see `htw_irradiance.orientations`.
+
+        Returns
+        -------
+        dict
+            DataFrame with "poa_global", "poa_direct", "poa_diffuse", "temp_air" and "wind_speed" per orientation.
+        """
+        from htw_irradiance import get_poa_irradiance, poa_frames
+
+        # Only the perez model uses the airmass, the other models share the POA irradiation
+        airmass_key = airmass_model if transposition_model == "perez" else None
+
+        def calculate():
+            weather = self.weathers[source]
+            geometry = self.geometry(source, solar_position_method, airmass_model)
+            tilts, azimuths, albedos = (np.array(values, dtype=np.float64) for values in zip(*keys))
+            poa = get_poa_irradiance(tilts, azimuths, geometry, weather, albedo=albedos, model=transposition_model)
+            return dict(zip(keys, poa_frames(poa, weather)))
+
+        return self._stage("poa", (source, solar_position_method, airmass_key, transposition_model, tuple(keys)),
+                           calculate)
+
+    def pv_systems(self, temperature_model):
+        """
+        Returns the pv-systems with the temperature model parameters of a temperature model.
+
+        Parameters
+        ----------
+        temperature_model: str
+            Key of `TEMPERATURE_PARAMETERS`.
+
+        Returns
+        -------
+        list[pvlib.pvsystem.PVSystem]
+            PVSystem objects
+        """
+        import main
+
+        def calculate():
+            from pvlib import temperature
+
+            base = self._stage("systems", "base", lambda: main.setup_systems(systems=self.systems))
+            if TEMPERATURE_PARAMETERS.get(temperature_model) is None:
+                return base
+
+            parameters = TEMPERATURE_PARAMETERS[temperature_model]
+            if isinstance(parameters, tuple):
+                parameters = temperature.TEMPERATURE_MODEL_PARAMETERS[parameters[0]][parameters[1]]
+            pv_systems = copy.deepcopy(base)
+            for pv_system in pv_systems:
+                for array in pv_system.arrays:
+                    array.temperature_model_parameters = dict(parameters)
+            return pv_systems
+
+        return self._stage("systems", temperature_model, calculate)
+
+    def run_combination(self, combo, source):
+        """
+        Runs all pv-systems with the options of one combination.
+
+        Parameters
+        ----------
+        combo: dict
+            ModelChain options (see `combinations`).
+        source: str
+            Weather source.
+
+        Returns
+        -------
+        list[dict]
+            One row per pv-system: "system", "annual_yield" in kWh and "error" (None, if the run was successful).
+        """
+        from pvlib.modelchain import ModelChain
+        from htw_irradiance import orientations
+
+        rows = []
+        try:
+            pv_systems = self.pv_systems(combo["temperature_model"])
+        except (KeyError, ValueError) as error:
+            return [{"system": None, "annual_yield": np.nan, "error": f"{type(error).__name__}: {error}"}]
+
+        for pv_system in pv_systems:
+            row = {"system": pv_system.name, "annual_yield": np.nan, "error": None}
+            try:
+                mc = ModelChain(system=pv_system, location=self.location, name=pv_system.name, **combo)
+                keys = orientations([mc])
+                frames = self.poa(source, combo["solar_position_method"], combo["airmass_model"],
+                                  combo["transposition_model"], keys)
+                data = tuple(frames[(array.mount.surface_tilt, array.mount.surface_azimuth, array.albedo)]
+                             for array in pv_system.arrays)
+                mc.run_model_from_poa(data if len(data) > 1 else data[0])
+                row["annual_yield"] = float(mc.results.ac.sum()) / 1000
+            except Exception as error:  # every failing combination is kept with its message
+                row["error"] = f"{type(error).__name__}: {error}"
+            rows.append(row)
+        return rows
+
+    def run(self, combos, sources=None):
+        """
+        Runs combinations for weather sources.
+
+        Parameters
+        ----------
+        combos: list[dict]
+            Combinations (see `combinations`).
+        sources: list[str], optional
+            Weather sources. Default: all sources of the runner.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per combination, source and pv-system: the options, "label", "source", "system",
+            "annual_yield" in kWh and "error".
+        """
+        if sources is None:
+            sources = list(self.weathers)
+
+        rows = []
+        for combo in combos:
+            label = combination_label(combo)
+            for source in sources:
+                for row in self.run_combination(combo, source):
+                    rows.append({**combo, "label": label, "source": source, **row})
+        return pd.DataFrame(rows)
+
+    def statistics(self):
+        """
+        Returns the number of calculations and of reused results per stage.
+
+        Returns
+        -------
+        pd.DataFrame
+            "computed" and "reused" per stage.
+        """
+        stages = list(self.stages)
+        return pd.DataFrame({"computed": [self.computations[stage] for stage in stages],
+                             "reused": [self.hits[stage] for stage in stages]}, index=stages)
+
+
+def comparison_table(results):
+    """
+    Creates the comparison table of the annual yields.
+
+    Parameters
+    ----------
+    results: pd.DataFrame
+        Results of `MatrixRunner.run`.
+
+    Returns
+    -------
+    yields: pd.DataFrame
+        Annual yield in kWh, one row per combination (label), columns (source, system) and (source, "total").
+    deviation: pd.DataFrame
+        Deviation of the total annual yield from the baseline in % per source.
+    """
+    # The deviations need the baseline of all systems
+    baseline = results[results["label"] == "baseline"]
+    if baseline.empty:
+        raise ValueError("The results contain no baseline combination.")
+    failed = baseline[baseline["error"].notna()]
+    if not failed.empty:
+        messages = "; ".join(f"{row.source}/{row.system}: {row.error}" for row in failed.itertuples())
+        raise ValueError(f"The baseline failed, the deviations can not be calculated ({messages})")
+
+    valid = results[results["error"].isna()]
+    yields = valid.pivot_table(index="label", columns=["source", "system"], values="annual_yield",
+                               aggfunc="sum", sort=False)
+
+    # Total only of combinations which ran for all systems of a source
+    sources = list(yields.columns.get_level_values("source").unique())
+    for source in sources:
+        yields[(source, "total")] = yields[source].sum(axis=1, min_count=yields[source].shape[1])
+    yields = yields[[column for source in sources for column in yields.columns if column[0] == source]]
+
+    deviation = pd.DataFrame({source: (yields[(source, "total")] / yields.loc["baseline", (source, "total")] - 1) * 100
+                              for source in sources})
+    return yields, deviation
+
+
+if __name__ == "__main__":
+    import time
+
+    from htw_weather import load_weather
+
+    runner = MatrixRunner({"htw": load_weather("htw"), "fred": load_weather("fred")})
+
+    # All combinations of transposition and temperature model, every other option alone
+    combos = combinations({"transposition_model": OPTIONS["transposition_model"],
+                           "temperature_model": OPTIONS["temperature_model"]}, mode="product")
+    combos += [combo for combo in combinations({"solar_position_method": ["ephemeris"],
+                                                "airmass_model": ["kasten1966"],
+                                                "dc_model": ["desoto", "pvwatts"],
+                                                "ac_model": ["pvwatts"],
+                                                "dc_ohmic_model": ["dc_ohms_from_percent"]},
+                                               mode="one_at_a_time") if combo not in combos]
+
+    time_start = time.perf_counter()
+    matrix = runner.run(combos)
+    print(f"Runtime ({len(combos)} combinations, 2 sources): {time.perf_counter() - time_start:.1f} s\n")
+    print(runner.statistics(), "\n")
+
+    pd.set_option("display.width", 160)
+    pd.set_option("display.max_columns", None)
+    pd.set_option("display.max_colwidth", 60)
+    annual_yields, deviations = comparison_table(matrix)
+
+    print(f"{' Annual yield in kWh ':#^80}")
+    print(annual_yields.round(1), "\n")
+
+    print(f"{' Deviation of the total from the baseline in % ':#^80}")
+    print(deviations.round(2), "\n")
+
+    print(f"{' Failed combinations ':#^80}")
+    print(matrix.loc[matrix["error"].notna(), ["label", "error"]].drop_duplicates().to_string(index=False))
@@ -5,8 +5,9 @@
 This script contains the pv-modules of the htw pv-system.
 """
 
+from functools import lru_cache
+
 import pandas as pd
-from pvlib import pvsystem, ivtools
 
 
 def create_modules_df():
@@ -53,6 +54,7 @@ def create_modules_df():
     return modules
 
 
+@lru_cache(maxsize=None)
 def modul1():
     """
     Creates a pandas dataframe of modul 1 (Schott ASI 105) of the htw pv-system.
@@ -61,6 +63,7 @@ def modul1():
     -------
     DataFrame
         Contains the module parameters due to CEC convention.
+        The parameters are fitted once and cached (do not modify the returned object).
     """
     # Typical manufacturer data-sheet parameters:
     celltype = "amorphous"  # 'monoSi', 'multiSi', 'polySi', 'cis', 'cigs', 'cdte', 'amorphous'
@@ -83,6 +86,8 @@ def modul1():
     cells_in_series = 72
     temp_ref = 25
 
+    from pvlib import ivtools
+
     cec_params = ivtools.sdm.fit_cec_sam(
                 celltype=celltype,
                 v_mp=v_mp,
@@ -129,6 +134,22 @@ def modul1():
     return modules["Schott_ASI_105"]
 
 
+@lru_cache(maxsize=None)
+def cec_modules():
+    """
+    Loads the CEC module database (California Energy Commission) of pvlib.
+
+    Returns
+    -------
+    DataFrame
+        CEC module parameters, one column per module.
+        The database is loaded once and cached (do not modify the returned object).
+    """
+    from pvlib import pvsystem
+
+    return pvsystem.retrieve_sam('CECMod')
+
+
 def modul2():
     """
     Creates a pandas dataframe of modul 2 (Aleo Solar S19 285) of the htw pv-system.
@@ -138,10 +159,11 @@ def modul2():
     DataFrame
         Contains the module parameters due to CEC convention.
     """
-    module_2 = pvsystem.retrieve_sam('CECMod')["Aleo_Solar_S19y285"]
+    module_2 = cec_modules()["Aleo_Solar_S19y285"]
     return module_2
 
 
+@lru_cache(maxsize=None)
 def modul3():
     """
     Creates a pandas dataframe of modul 3 (Aleo Solar S18 240) of the htw pv-system.
@@ -150,6 +172,7 @@ def modul3():
     -------
     DataFrame
         Contains the module parameters due to CEC convention.
+        The parameters are fitted once and cached (do not modify the returned object).
     """
     # Typical manufacturer data-sheet parameters:
     celltype = "monoSi"  # 'monoSi', 'multiSi', 'polySi', 'cis', 'cigs', 'cdte', 'amorphous'
@@ -172,6 +195,8 @@ def modul3():
     cells_in_series = 60
     temp_ref = 25
 
+    from pvlib import ivtools
+
     cec_params = ivtools.sdm.fit_cec_sam(
                 celltype=celltype,
                 v_mp=v_mp,
@@ -218,6 +243,7 @@ def modul3():
     return modules["Aleo_Solar_S18_240"]
 
 
+@lru_cache(maxsize=None)
 def modul4():
     """
     Creates a pandas dataframe of modul 3 (Aleo Solar S19 245) of the htw pv-system.
@@ -226,6 +252,7 @@ def modul4():
     -------
     DataFrame
         Contains the module parameters due to CEC convention.
+        The parameters are fitted once and cached (do not modify the returned object).
     """
     # Typical manufacturer data-sheet parameters:
     celltype = "amorphous"  # 'monoSi', 'multiSi', 'polySi', 'cis', 'cigs', 'cdte', 'amorphous'
@@ -248,6 +275,8 @@ def modul4():
     cells_in_series = 60
     temp_ref = 25
 
+    from pvlib import ivtools
+
     cec_params = ivtools.sdm.fit_cec_sam(
                 celltype=celltype,
                 v_mp=v_mp,
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains the reconciliation of the weather sources HTW (weather station) and openFRED.
+
+Both files are read and resampled once (`htw_resample`, time stamps: centers of 30 min intervals) and aligned on one
+UTC index. The aligned frame contains the means of both sources and the number of missing values per time step
+(gaps, for HTW also the filled values of the station; irradiation above the clear-sky limit of `htw_clearsky` is
+counted as missing too), it is kept in the cache directory (fingerprints of the
+weather files). The aligned frame is labelled with the bin starts, the weather for the models (`load_sources`) with
+the bin centers.
+
+The comparison only uses time steps without gaps in both sources:
+
+    error_statistics:           bias, RMSE and correlation of hourly values, daily and monthly sums (means)
+    distribution_comparison:    quantiles and Kolmogorov-Smirnov distance of the hourly values
+    monthly_hourly_bias:        mean bias per month and hour of the day
+
+The bias correction of openFRED uses the same month x hour cells: the irradiation (ghi, dni, dhi) is scaled with
+the ratio of the irradiation sums (HTW / openFRED), the air temperature and the wind speed are shifted by the mean
+difference. Cells with too few values use the factor (offset) of the month.
+The correction is fitted with the station data of 2015, it is meant for other periods of openFRED without station
+data (for 2015 itself the corrected values are fitted in-sample).
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from config import PATH_CACHE, PATH_HTW_WEATHER, PATH_FRED_WEATHER, HTW_WEATHER_TZ, WEATHER_START, WEATHER_END
+from config import HTW_LAT, HTW_LON
+import htw_clearsky
+import htw_resample
+from htw_weather import WEATHER_COLUMNS, calculate_diffuse_irradiation, convert_column_names
+
+# Sources of the aligned frame
+SOURCES = ["htw", "fred"]
+
+# Irradiation columns (sums per period, corrected with a factor); the other columns are means (offset)
+IRRADIANCE_COLUMNS = ["ghi", "dni", "dhi"]
+
+# Minimum number of values of a month x hour cell for its own correction factor
+MIN_COUNT = 10
+
+# Limits of the correction factors of the irradiation
+FACTOR_LIMITS = (0.5, 2.0)
+
+# Periods of the statistics (hourly values, daily and monthly sums)
+LEVELS = {"h": "hourly", "D": "daily", "ME": "monthly"}
+
+
+def read_sources():
+    """
+    Reads the weather files of both sources like `htw_weather.load_weather` (without resampling).
+
+    Returns
+    -------
+    dict
+        "htw" and "fred": DataFrames with the columns of `WEATHER_COLUMNS` (HTW also "filled": 1 for filled values).
+    """
+    df_htw = pd.read_csv(PATH_HTW_WEATHER, sep=";")  # (mview!)
+    df_htw = convert_column_names(df_htw, time="timestamp", ghi="g_hor_si", wind_speed="v_wind", temp_air="t_luft",
+                                  tz=HTW_WEATHER_TZ)
+    df_htw = calculate_diffuse_irradiation(df_htw, parameter_name="ghi", lat=HTW_LAT, lon=HTW_LON)
+    if "is_filled" in df_htw:
+        df_htw["filled"] = (df_htw["is_filled"] == "t").astype(np.float64)
+
+    df_fred = pd.read_csv(PATH_FRED_WEATHER, sep=",")
+    df_fred = convert_column_names(df_fred, time="time", ghi="ghi", wind_speed="wind_speed", temp_air="temp_air")
+
+    return {"htw": df_htw, "fred": df_fred}
+
+
+def align_sources(sources=None, freq="h", start=WEATHER_START, end=WEATHER_END, clearsky=None):
+    """
+    Resamples both sources to one UTC index.
+
+    The irradiation of time steps with a mean ghi above the clear-sky limit (`htw_clearsky.qc_flags` at the center
+    of the time step) is counted as missing, so it is not used by the statistics and the correction.
+
+    Parameters
+    ----------
+    sources: dict, optional
+        DataFrames of the sources from `read_sources`. Default: the weather files are read.
+    freq: str
+        Frequency of the common index (e.g. "h").
+    start, end: str
+        Period (UTC, end excluded).
+    clearsky: dict, optional
+        Clear-sky table of the location (`htw_clearsky.clearsky_table`). Default: table of the HTW location.
+
+    Returns
+    -------
+    pd.DataFrame
+        Columns (source, variable): means of "htw" and "fred" and the number of missing values of "htw_gaps"
+        and "fred_gaps" per time step (filled values of the station and irradiation above the clear-sky limit
+        are counted as missing).
+    """
+    if sources is None:
+        sources = read_sources()
+    if clearsky is None:
+        from main import setup_location
+
+        clearsky = htw_clearsky.clearsky_table(setup_location())
+
+    parts = {}
+    for source in SOURCES:
+        df = sources[source]
+        means, gaps = htw_resample.resample(df, freq=freq, convention="center", start=start, end=end,
+                                            columns=WEATHER_COLUMNS + (["filled"] if "filled" in df else []))
+        expected = htw_resample.expected_count(freq, htw_resample.time_step(htw_resample.to_epochs(df.index)))
+        if "filled" in means:
+            # Filled values of the station are no measurements (number of values * share of filled values)
+            filled = np.rint(means.pop("filled").fillna(0.) * (expected - gaps.pop("filled")))
+            gaps = gaps.add(filled, axis=0)
+
+        # QC: all values of the irradiation above the clear-sky limit are missing
+        centers = means.index + pd.Timedelta(htw_resample.label_offset("center", htw_resample.bin_width(freq)),
+                                             unit="ns")
+        flags = htw_clearsky.qc_flags(means["ghi"].to_numpy(),
+                                      htw_clearsky.get_clearsky(centers, clearsky)["ghi"].to_numpy())
+        for column in IRRADIANCE_COLUMNS:
+            gaps[column] = np.where(flags, expected, gaps[column])
+
+        # Common UTC index (naive time stamps are UTC)
+        if means.index.tz is None:
+            means.index = means.index.tz_localize("UTC")
+            gaps.index = means.index
+        parts[source] = means
+        parts[f"{source}_gaps"] = gaps.astype(np.int64)
+
+    aligned = pd.concat(parts, axis=1, names=["source", "variable"], join="outer")
+    return aligned
+
+
+def aligned_fingerprint(freq, start, end):
+    """
+    Creates the fingerprint of the aligned frame (weather files, time zone, period and frequency).
+
+    Returns
+    -------
+    str
+        sha256 hex digest.
+    """
+    from htw_cache import file_fingerprint
+
+    description = {"htw": file_fingerprint(PATH_HTW_WEATHER),
+                   "fred": file_fingerprint(PATH_FRED_WEATHER),
+                   "htw_tz": HTW_WEATHER_TZ,
+                   "location": [HTW_LAT, HTW_LON],
+                   "freq": freq, "start": start, "end": end,
+                   "clearsky_qc": [htw_clearsky.QC_FACTOR, htw_clearsky.QC_OFFSET],
+                   }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+def load_aligned(freq="h", start=WEATHER_START, end=WEATHER_END, cache_dir=PATH_CACHE):
+    """
+    Returns the aligned frame (calculated once, then read from the cache directory).
+
+    Parameters
+    ----------
+    freq: str
+        Frequency of the common index.
+    start, end: str
+        Period (UTC, end excluded).
+    cache_dir: str
+        Directory of the cache.
+
+    Returns
+    -------
+    pd.DataFrame
+        Aligned frame (see `align_sources`).
+    """
+    path = os.path.join(cache_dir, f"aligned_{aligned_fingerprint(freq, start, end)[:16]}.pkl")
+    if os.path.exists(path):
+        return pd.read_pickle(path)
+
+    aligned = align_sources(freq=freq, start=start, end=end)
+    os.makedirs(cache_dir, exist_ok=True)
+    aligned.to_pickle(path)
+    return aligned
+
+
+def valid_mask(aligned, variable):
+    """
+    Returns the time steps without gaps in both sources.
+
+    Parameters
+    ----------
+    aligned: pd.DataFrame
+        Aligned frame.
+    variable: str
+        Weather column.
+
+    Returns
+    -------
+    np.ndarray
+        Boolean array (time steps).
+    """
+    valid = np.ones(len(aligned), dtype=bool)
+    for source in SOURCES:
+        valid &= np.isfinite(aligned[(source, variable)].to_numpy(dtype=np.float64))
+        valid &= aligned[(f"{source}_gaps", variable)].to_numpy() == 0
+    return valid
+
+
+def period_codes(index, level):
+    """
+    Returns the period of every time step as integer (hours, days or months since 1970, UTC).
+
+    Parameters
+    ----------
+    index: pd.DatetimeIndex
+        Time steps.
+    level: str
+        "h", "D" or "ME".
+
+    Returns
+    -------
+    np.ndarray
+        Period codes (int64).
+    """
+    epochs = htw_resample.to_epochs(index)
+    if level == "ME":
+        return epochs.view("M8[ns]").astype("M8[M]").astype(np.int64)
+    return np.floor_divide(epochs, htw_resample.bin_width(level))
+
+
+def ks_statistic(a, b):
+    """
+    Returns the Kolmogorov-Smirnov distance of two samples (maximum difference of the empirical distributions).
+
+    Parameters
+    ----------
+    a, b: np.ndarray
+        Samples.
+
+    Returns
+    -------
+    float
+        Distance (0 - 1).
+    """
+    a = np.sort(a)
+    b = np.sort(b)
+    values = np.concatenate([a, b])
+    cdf_a = np.searchsorted(a, values, side="right") / len(a)
+    cdf_b = np.searchsorted(b, values, side="right") / len(b)
+    return float(np.max(np.abs(cdf_a - cdf_b)))
+
+
+def error_statistics(aligned, variables=None, levels=None):
+    """
+    Compares openFRED with the station per variable and period length (only time steps without gaps).
+
+    The irradiation is summed per period (Wh/m²), the other variables are averaged.
+
+    Parameters
+    ----------
+    aligned: pd.DataFrame
+        Aligned frame.
+    variables: list[str], optional
+        Weather columns. Default: `WEATHER_COLUMNS`.
+    levels: list[str], optional
+        Period lengths ("h", "D", "ME"). Default: all of `LEVELS`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Index (variable, level): "count" (periods), "htw" and "fred" (mean of the periods), "bias" (fred - htw),
+        "rmse", "relative_bias" and "relative_rmse" in % of the station mean, "correlation" and "ks_statistic".
+    """
+    if variables is None:
+        variables = WEATHER_COLUMNS
+    if levels is None:
+        levels = list(LEVELS)
+
+    rows = {}
+    for variable in variables:
+        valid = valid_mask(aligned, variable)
+        htw = aligned[("htw", variable)].to_numpy(dtype=np.float64)[valid]
+        fred = aligned[("fred", variable)].to_numpy(dtype=np.float64)[valid]
+
+        for level in levels:
+            # Sums (irradiation) or means of the valid time steps per period
+            _, index = np.unique(period_codes(aligned.index[valid], level), return_inverse=True)
+            counts = np.bincount(index)
+            htw_period = np.bincount(index, weights=htw)
+            fred_period = np.bincount(index, weights=fred)
+            if variable not in IRRADIANCE_COLUMNS:
+                htw_period /= counts
+                fred_period /= counts
+
+            error = fred_period - htw_period
+            htw_mean = htw_period.mean()
+            rows[(variable, LEVELS[level])] = {
+                "count": len(counts),
+                "htw": htw_mean,
+                "fred": fred_period.mean(),
+                "bias": error.mean(),
+                "rmse": np.sqrt(np.mean(error ** 2)),
+                "relative_bias": error.mean() / htw_mean * 100 if htw_mean else np.nan,
+                "relative_rmse": np.sqrt(np.mean(error ** 2)) / htw_mean * 100 if htw_mean else np.nan,
+                "correlation": np.corrcoef(htw_period, fred_period)[0, 1] if len(counts) > 1 else np.nan,
+                "ks_statistic": ks_statistic(htw_period, fred_period),
+            }
+
+    statistics = pd.DataFrame.from_dict(rows, orient="index")
+    statistics.index.names = ["variable", "level"]
+    return statistics
+
+
+def distribution_comparison(aligned, variable="ghi", quantiles=None, daylight=True):
+    """
+    Compares the distributions of the hourly values of both sources (only time steps without gaps).
+
+    Parameters
+    ----------
+    aligned: pd.DataFrame
+        Aligned frame.
+    variable: str
+        Weather column.
+    quantiles: array-like, optional
+        Quantiles (0 - 1). Default: 0, 0.1, ..., 1.
+    daylight: bool
+        If True, only time steps with irradiation (ghi > 0) in one of the sources are compared.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per quantile: "htw", "fred" and the difference "fred - htw".
+    """
+    if quantiles is None:
+        quantiles = np.linspace(0, 1, 11)
+
+    valid = valid_mask(aligned, variable)
+    if daylight:
+        valid &= np.maximum(aligned[("htw", "ghi")].to_numpy(), aligned[("fred", "ghi")].to_numpy()) > 0
+
+    values = np.vstack([aligned[(source, variable)].to_numpy(dtype=np.float64)[valid] for source in SOURCES])
+    result = pd.DataFrame(np.quantile(values, quantiles, axis=1), index=pd.Index(quantiles, name="quantile"),
+                          columns=SOURCES)
+    result["fred - htw"] = result["fred"] - result["htw"]
+    return result
+
+
+def _month_hour_sums(aligned, variable):
+    """
+    Sums and counts of the valid time steps per month x hour cell (months 0 - 11, hours 0 - 23, UTC).
+    """
+    valid = valid_mask(aligned, variable)
+    cells = (aligned.index.month.to_numpy() - 1) * 24 + aligned.index.hour.to_numpy()
+    cells = cells[valid]
+
+    counts = np.bincount(cells, minlength=12 * 24).reshape(12, 24)
+    sums = {source: np.bincount(cells, weights=aligned[(source, variable)].to_numpy(dtype=np.float64)[valid],
+                                minlength=12 * 24).reshape(12, 24)
+            for source in SOURCES}
+    return sums, counts
+
+
+def monthly_hourly_bias(aligned, variable="ghi"):
+    """
+    Returns the mean bias (fred - htw) per month and hour of the day (UTC).
+
+    Parameters
+    ----------
+    aligned: pd.DataFrame
+        Aligned frame.
+    variable: str
+        Weather column.
+
+    Returns
+    -------
+    pd.DataFrame
+        Mean bias, one row per month (1 - 12), one column per hour (0 - 23). NaN for cells without values.
+    """
+    sums, counts = _month_hour_sums(aligned, variable)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bias = (sums["fred"] - sums["htw"]) / counts
+    return pd.DataFrame(bias, index=pd.Index(range(1, 13), name="month"), columns=pd.Index(range(24), name="hour"))
+
+
+def fit_correction(aligned, min_count=MIN_COUNT, factor_limits=FACTOR_LIMITS):
+    """
+    Fits the month x hour correction of openFRED against the station.
+
+    Parameters
+    ----------
+    aligned: pd.DataFrame
+        Aligned frame.
+    min_count: int
+        Minimum number of values (and irradiation > 0) of a cell for its own factor or offset.
+    factor_limits: tuple[float]
+        Minimum and maximum factor of the irradiation.
+
+    Returns
+    -------
+    dict
+        "factor": factor of the irradiation, "temp_air" and "wind_speed": offsets, arrays (12 months, 24 hours).
+    """
+    correction = {}
+
+    sums, counts = _month_hour_sums(aligned, "ghi")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        month_factor = sums["htw"].sum(axis=1) / sums["fred"].sum(axis=1)
+        factor = sums["htw"] / sums["fred"]
+    month_factor = np.where(np.isfinite(month_factor), month_factor, 1.)
+    own = (counts >= min_count) & (sums["fred"] > 0) & np.isfinite(factor)
+    correction["factor"] = np.clip(np.where(own, factor, month_factor[:, np.newaxis]), *factor_limits)
+
+    for variable in ["temp_air", "wind_speed"]:
+        sums, counts = _month_hour_sums(aligned, variable)
+        difference = sums["htw"] - sums["fred"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            month_offset = difference.sum(axis=1) / counts.sum(axis=1)
+            offset = difference / counts
+        month_offset = np.where(np.isfinite(month_offset), month_offset, 0.)
+        correction[variable] = np.where(counts >= min_count, offset, month_offset[:, np.newaxis])
+
+    return correction
+
+
+def apply_correction(weather, correction):
+    """
+    Applies the month x hour correction to openFRED weather.
+
+    Parameters
+    ----------
+    weather: pd.DataFrame
+        openFRED weather with UTC datetime index.
+    correction: dict
+        Correction from `fit_correction`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Corrected copy of the weather.
+    """
+    months = weather.index.month.to_numpy() - 1
+    hours = weather.index.hour.to_numpy()
+
+    corrected = weather.copy()
+    for column in IRRADIANCE_COLUMNS:
+        if column in corrected:
+            corrected[column] = corrected[column].to_numpy() * correction["factor"][months, hours]
+    if "temp_air" in corrected:
+        corrected["temp_air"] = corrected["temp_air"].to_numpy() + correction["temp_air"][months, hours]
+    if "wind_speed" in corrected:
+        corrected["wind_speed"] = np.maximum(corrected["wind_speed"].to_numpy()
+                                             + correction["wind_speed"][months, hours], 0.)
+    return corrected
+
+
+def load_sources(corrected=False, freq="h", cache_dir=PATH_CACHE, label="center"):
+    """
+    Returns the weather of both sources for the models (from the cached aligned frame, no parsing).
+
+    Parameters
+    ----------
+    corrected: bool
+        If True, openFRED is corrected against the station (`fit_correction`).
+    freq: str
+        Frequency of the weather.
+    cache_dir: str
+        Directory of the cache.
+    label: str
+        Position of the time stamps in the bins: "start" (like the aligned frame) or "center" (input of the models,
+        the index is shifted by half a bin).
+
+    Returns
+    -------
+    weather_htw, weather_fred: pd.DataFrame
+        Weather DataFrames like `htw_weather.load_weather` (HTW with naive UTC index, if `HTW_WEATHER_TZ` is None).
+    """
+    aligned = load_aligned(freq=freq, cache_dir=cache_dir)
+
+    weather_htw = aligned["htw"].copy()
+    weather_fred = aligned["fred"].copy()
+    for weather in [weather_htw, weather_fred]:
+        weather.columns.name = None
+        weather.index.name = "timestamp"
+    if HTW_WEATHER_TZ is None:
+        weather_htw.index = weather_htw.index.tz_localize(None)
+
+    if corrected:
+        weather_fred = apply_correction(weather_fred, fit_correction(aligned))
+
+    # The aligned frame is labelled with the bin starts (month x hour cells of the statistics)
+    offset = pd.Timedelta(htw_resample.label_offset(label, htw_resample.bin_width(freq)), unit="ns")
+    for weather in [weather_htw, weather_fred]:
+        weather.index = weather.index + offset
+    return weather_htw, weather_fred
+
+
+if __name__ == "__main__":
+    import time
+
+    time_start = time.perf_counter()
+    aligned_sources = align_sources()
+    print(f"Reading and aligning: {time.perf_counter() - time_start:.2f} s")
+
+    # The first call stores the aligned frame in the cache directory
+    load_aligned()
+    time_start = time.perf_counter()
+    load_sources()
+    print(f"Weather of both sources from the cache: {time.perf_counter() - time_start:.3f} s\n")
+
+    pd.set_option("display.width", 160)
+    pd.set_option("display.max_columns", None)
+
+    print(f"{' openFRED vs. HTW ':#^80}")
+    print(error_statistics(aligned_sources).round(2), "\n")
+
+    print(f"{' Distribution of the hourly ghi (daylight) ':#^80}")
+    print(distribution_comparison(aligned_sources).round(1), "\n")
+
+    print(f"{' Mean bias of ghi per month and hour in W/m² (UTC, 4 - 17 h) ':#^80}")
+    print(monthly_hourly_bias(aligned_sources).loc[:, 4:17].round(0), "\n")
+
+    # Corrected openFRED (in-sample) in the aligned frame
+    correction_fred = fit_correction(aligned_sources)
+    aligned_corrected = aligned_sources.copy()
+    corrected_fred = apply_correction(aligned_sources["fred"], correction_fred)
+    for column in corrected_fred:
+        aligned_corrected[("fred", column)] = corrected_fred[column]
+
+    print(f"{' Corrected openFRED vs. HTW (irradiation, in-sample) ':#^80}")
+    print(error_statistics(aligned_corrected, variables=IRRADIANCE_COLUMNS).round(2))
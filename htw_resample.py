@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains the resampling of the weather-data with integer time stamps.
+
+The time stamps are converted once to int64 UTC epochs (ns). Naive local time stamps are localized with their time
+zone first, so the changes of the daylight saving time do not create duplicated or missing hours.
+The time stamps of the sources mark different points of the measuring interval (start, center or end, e.g.
+openFRED: center of 30 min intervals at :15 and :45). They are shifted to the interval start, then every value
+is assigned to the bin `interval start // bin width` and the means are calculated with `np.bincount`.
+The number of values per bin is returned too, so gaps in the data can be found.
+
+The bins are labelled with their start (like `pd.DataFrame.resample`) or with their center (`label="center"`).
+The mean of a bin represents the whole interval, so the models (solar position of the time stamp) need the
+center labels: with start labels the solar geometry of hourly means is 30 min early.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Position of the time stamp in the measuring interval (fraction of the interval)
+CONVENTIONS = {"start": 0.,
+               "center": 0.5,
+               "end": 1.,
+               }
+
+
+def to_epochs(times, tz=None, ambiguous="infer", nonexistent="shift_forward"):
+    """
+    Converts time stamps to int64 UTC epochs.
+
+    Parameters
+    ----------
+    times: pd.DatetimeIndex or array-like
+        Time stamps (naive or localized).
+    tz: str, optional
+        Time zone of naive time stamps (e.g. "Europe/Berlin"). If None, naive time stamps are UTC.
+    ambiguous: str
+        Handling of the repeated hour at the end of the daylight saving time (see `pd.DatetimeIndex.tz_localize`).
+    nonexistent: str
+        Handling of the missing hour at the start of the daylight saving time.
+
+    Returns
+    -------
+    np.ndarray
+        UTC epochs in ns (int64).
+    """
+    times = pd.DatetimeIndex(times)
+    if times.tz is None and tz is not None:
+        times = times.tz_localize(tz, ambiguous=ambiguous, nonexistent=nonexistent)
+    return times.asi8
+
+
+def time_step(epochs):
+    """
+    Returns the time step of the epochs (median of the differences, so single gaps do not change it).
+
+    Parameters
+    ----------
+    epochs: np.ndarray
+        Epochs in ns.
+
+    Returns
+    -------
+    int
+        Time step in ns.
+    """
+    if len(epochs) < 2:
+        raise ValueError("At least two time stamps are needed to get the time step.")
+    return int(np.median(np.diff(epochs)))
+
+
+def interval_starts(epochs, convention="start", step=None):
+    """
+    Shifts the epochs to the start of their measuring interval.
+
+    Parameters
+    ----------
+    epochs: np.ndarray
+        Epochs in ns.
+    convention: str
+        Position of the time stamps in the interval: "start", "center" or "end".
+    step: int, optional
+        Length of the interval in ns. Default: time step of the epochs.
+
+    Returns
+    -------
+    np.ndarray
+        Epochs of the interval starts in ns.
+    """
+    if convention not in CONVENTIONS:
+        raise ValueError(f"Unknown time stamp convention: {convention} (use {list(CONVENTIONS)})")
+    if convention == "start":
+        return epochs
+
+    if step is None:
+        step = time_step(epochs)
+    return epochs - int(CONVENTIONS[convention] * step)
+
+
+def label_offset(label, width):
+    """
+    Returns the offset of the bin labels from the bin starts.
+
+    Parameters
+    ----------
+    label: str
+        Position of the labels in the bins: "start", "center" or "end".
+    width: int
+        Width of the bins in ns.
+
+    Returns
+    -------
+    int
+        Offset in ns.
+    """
+    if label not in CONVENTIONS:
+        raise ValueError(f"Unknown bin label: {label} (use {list(CONVENTIONS)})")
+    return int(CONVENTIONS[label] * width)
+
+
+def is_fixed_frequency(freq):
+    """
+    Returns True, if the bins of the frequency have a fixed width (e.g. "h", "15min" or "D", not "MS" or "ME").
+    """
+    return isinstance(pd.tseries.frequencies.to_offset(freq), pd.offsets.Tick)
+
+
+def bin_width(freq):
+    """
+    Returns the width of the bins of a fixed frequency in ns.
+
+    Parameters
+    ----------
+    freq: str
+        Fixed frequency (e.g. "h", "15min" or "D").
+
+    Returns
+    -------
+    int
+        Width in ns.
+    """
+    if not is_fixed_frequency(freq):
+        raise ValueError(f"The integer bins need a fixed frequency (e.g. 'h', '15min' or 'D'), '{freq}' is a "
+                         f"calendar frequency (use `pd.DataFrame.resample`).")
+    return int(pd.tseries.frequencies.to_offset(freq).nanos)
+
+
+def resample_mean(values, epochs, freq="h", start=None, end=None, label="start"):
+    """
+    Calculates the means of the values in bins of a fixed frequency.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        Values, array (variables, time steps). NaN values are not counted.
+    epochs: np.ndarray
+        Epochs of the interval starts in ns (see `interval_starts`).
+    freq: str
+        Fixed frequency of the bins (e.g. "h").
+    start: int, optional
+        Epoch of the first bin in ns. Default: bin of the first value.
+    end: int, optional
+        Epoch of the end of the last bin in ns (excluded). Default: end of the bin of the last value.
+    label: str
+        Position of the labels in the bins: "start", "center" or "end".
+
+    Returns
+    -------
+    means: np.ndarray
+        Means, array (variables, bins). NaN for bins without values.
+    counts: np.ndarray
+        Number of values per bin, array (variables, bins).
+    labels: np.ndarray
+        Epochs of the bin labels in ns.
+    """
+    width = bin_width(freq)
+    offset = label_offset(label, width)
+    values = np.atleast_2d(values)
+
+    bins = np.floor_divide(epochs, width)
+    first = int(bins.min()) if start is None else -(-int(start) // width)
+    last = int(bins.max()) + 1 if end is None else -(-int(end) // width)
+    count = max(last - first, 0)
+
+    index = bins - first
+    inside = (index >= 0) & (index < count)
+
+    means = np.full((values.shape[0], count), np.nan)
+    counts = np.zeros((values.shape[0], count), dtype=np.int64)
+    for i, row in enumerate(values):
+        valid = inside & np.isfinite(row)
+        counts[i] = np.bincount(index[valid], minlength=count)
+        sums = np.bincount(index[valid], weights=row[valid], minlength=count)
+        np.divide(sums, counts[i], out=means[i], where=counts[i] > 0)
+
+    return means, counts, (first + np.arange(count, dtype=np.int64)) * width + offset
+
+
+def expected_count(freq, step):
+    """
+    Returns the number of values per bin without gaps.
+
+    Parameters
+    ----------
+    freq: str
+        Fixed frequency of the bins (e.g. "h").
+    step: int
+        Time step of the values in ns.
+
+    Returns
+    -------
+    int
+        Number of values per bin.
+    """
+    return max(bin_width(freq) // step, 1)
+
+
+def resample(df, freq="h", convention="start", tz=None, start=None, end=None, columns=None, dtype=np.float64,
+             label="start"):
+    """
+    Resamples a DataFrame to the means of bins of a fixed frequency.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        DataFrame with datetime index.
+    freq: str
+        Fixed frequency of the bins (e.g. "h").
+    convention: str
+        Position of the time stamps in the measuring interval: "start", "center" or "end".
+    tz: str, optional
+        Time zone of naive time stamps. If None, naive time stamps are UTC and the result is naive.
+    start, end: str or pd.Timestamp, optional
+        Period of the result (UTC, if not localized; end excluded).
+    columns: list[str], optional
+        Columns to resample. Default: all columns.
+    dtype: np.dtype
+        Data type of the means.
+    label: str
+        Position of the labels in the bins: "start", "center" (time stamps of the models) or "end".
+
+    Returns
+    -------
+    means: pd.DataFrame
+        Means of the bins, labelled with the bin start (center, end).
+    gaps: pd.DataFrame
+        Number of missing values per bin and column (expected values - values).
+    """
+    if columns is None:
+        columns = list(df.columns)
+
+    epochs = to_epochs(df.index, tz=tz)
+    step = time_step(epochs)
+    starts = interval_starts(epochs, convention=convention, step=step)
+
+    values = np.empty((len(columns), len(df)), dtype=np.float64)
+    for i, column in enumerate(columns):
+        values[i, :] = df[column].to_numpy(dtype=np.float64)
+
+    means, counts, labels = resample_mean(values, starts, freq=freq,
+                                          start=None if start is None else to_epochs([start])[0],
+                                          end=None if end is None else to_epochs([end])[0], label=label)
+
+    index = pd.DatetimeIndex(labels, tz="UTC" if df.index.tz is not None or tz is not None else None)
+    index.name = df.index.name
+    return (pd.DataFrame(means.T.astype(dtype, copy=False), index=index, columns=columns, copy=False),
+            pd.DataFrame(expected_count(freq, step) - counts.T, index=index, columns=columns))
+
+
+if __name__ == "__main__":
+    import time
+
+    from config import PATH_FRED_WEATHER
+    from htw_weather import convert_column_names, WEATHER_COLUMNS
+
+    df_fred = convert_column_names(pd.read_csv(PATH_FRED_WEATHER, sep=","), time="time", ghi="ghi",
+                                   wind_speed="wind_speed", temp_air="temp_air")
+
+    time_start = time.perf_counter()
+    weather_pandas = df_fred[WEATHER_COLUMNS].resample("h").mean()
+    weather_pandas = weather_pandas[weather_pandas.index.year > 2014]
+    time_pandas = time.perf_counter() - time_start
+
+    time_start = time.perf_counter()
+    weather_bins, gaps_bins = resample(df_fred, freq="h", convention="center", columns=WEATHER_COLUMNS,
+                                       start="2015-01-01", end="2016-01-01")
+    time_bins = time.perf_counter() - time_start
+
+    print(f"pandas resample: {time_pandas * 1000:.1f} ms, integer bins: {time_bins * 1000:.1f} ms")
+    print(f"Max. difference: {np.nanmax(np.abs(weather_bins.to_numpy() - weather_pandas.to_numpy())):.2e}")
+    print(f"Hours with gaps: {int((gaps_bins['ghi'] > 0).sum())}")
+
+    # Local time stamps with the change of the daylight saving time (repeated hour 02:00 - 03:00)
+    local = pd.date_range("2015-10-25 00:15", "2015-10-25 04:45", freq="30min", tz="Europe/Berlin")
+    df_local = pd.DataFrame({"ghi": np.arange(len(local), dtype=np.float64)}, index=local.tz_localize(None))
+    print(resample(df_local, freq="h", convention="center", tz="Europe/Berlin")[0])
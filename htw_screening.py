@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains the screening of the CEC module database for the htw pv-system (repowering studies).
+
+The effective irradiation and the cell temperature do not depend on the module (orientation of `main.py`,
+physical aoi model with default parameters, sapm temperature model of `main.TEMPERATURE_MODEL`), so they are
+calculated once. The CEC single diode model (`pvlib.pvsystem.calcparams_cec` and `max_power_point`) is then
+evaluated for chunks of modules as one array operation (modules x daylight time steps). The chunks are distributed
+to worker processes, which get the effective irradiation and the cell temperature once at their start.
+
+The result is the annual dc energy of one module (after the pvwatts losses) and the specific yield (per kWp STC),
+ranked over the whole database.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from config import CEC_PARAMETERS
+
+# Modules per chunk
+CHUNK_SIZE = 256
+
+# Inputs of a worker process (see `_worker_init`)
+_worker_inputs = None
+
+
+def screening_inputs(weather, location=None, surface_tilt=None, surface_azimuth=None, albedo=None):
+    """
+    Calculates the effective irradiation and the cell temperature of the daylight time steps.
+
+    Parameters
+    ----------
+    weather: pd.DataFrame
+        Weather with the columns "ghi", "dni", "dhi", "temp_air" and "wind_speed".
+    location: pvlib.location.Location, optional
+        Location. Default: `main.setup_location()`.
+    surface_tilt, surface_azimuth, albedo: float, optional
+        Orientation. Default: `main.SURFACE_TILT`, `main.SURFACE_AZIMUTH`, `main.ALBEDO`.
+
+    Returns
+    -------
+    dict
+        "effective_irradiance" in W/m², "cell_temperature" in °C (daylight time steps)
+        and the "step_hours" of the time steps.
+    """
+    from pvlib import iam, irradiance, temperature
+
+    import main
+    from htw_irradiance import get_geometry, get_poa_irradiance
+    from htw_subhourly import time_step_hours
+
+    if location is None:
+        location = main.setup_location()
+    surface_tilt = main.SURFACE_TILT if surface_tilt is None else surface_tilt
+    surface_azimuth = main.SURFACE_AZIMUTH if surface_azimuth is None else surface_azimuth
+    albedo = main.ALBEDO if albedo is None else albedo
+
+    geometry = get_geometry(location, weather.index)
+    poa = get_poa_irradiance(surface_tilt, surface_azimuth, geometry, weather, albedo=albedo)
+    aoi = irradiance.aoi(surface_tilt, surface_azimuth, geometry["apparent_zenith"].to_numpy(),
+                         geometry["azimuth"].to_numpy())
+
+    effective_irradiance = poa["poa_direct"][0] * iam.physical(aoi) + poa["poa_diffuse"][0]
+    temperature_parameters = temperature.TEMPERATURE_MODEL_PARAMETERS[main.TEMPERATURE_MODEL[0]][
+        main.TEMPERATURE_MODEL[1]]
+    cell_temperature = temperature.sapm_cell(poa["poa_global"][0], weather["temp_air"].to_numpy(dtype=np.float64),
+                                             weather["wind_speed"].to_numpy(dtype=np.float64),
+                                             **temperature_parameters)
+
+    daylight = np.nan_to_num(effective_irradiance) > 0
+    return {"effective_irradiance": np.ascontiguousarray(effective_irradiance[daylight]),
+            "cell_temperature": np.ascontiguousarray(cell_temperature[daylight]),
+            "step_hours": time_step_hours(weather.index),
+            }
+
+
+def module_energy(parameters, effective_irradiance, cell_temperature, step_hours):
+    """
+    Calculates the annual dc energy of modules (CEC single diode model, maximum power point).
+
+    Parameters
+    ----------
+    parameters: pd.DataFrame
+        CEC parameters (`CEC_PARAMETERS`), one row per module.
+    effective_irradiance: np.ndarray
+        Effective irradiation in W/m² (time steps).
+    cell_temperature: np.ndarray
+        Cell temperature in °C (time steps).
+    step_hours: float
+        Time step in h.
+
+    Returns
+    -------
+    np.ndarray
+        dc energy in kWh per module (NaN, if the model can not be evaluated).
+    """
+    from pvlib import pvsystem
+
+    shape = (len(parameters), len(effective_irradiance))
+    with np.errstate(all="ignore"):
+        params = pvsystem.calcparams_cec(effective_irradiance[np.newaxis, :], cell_temperature[np.newaxis, :],
+                                         **{key: parameters[key].to_numpy(dtype=np.float64)[:, np.newaxis]
+                                            for key in CEC_PARAMETERS})
+        params = [np.broadcast_to(param, shape).ravel() for param in params]
+        p_mp = pvsystem.max_power_point(*params, method="newton")["p_mp"].reshape(shape)
+
+    # Modules with invalid parameters (no solution) get NaN instead of a too small yield
+    p_mp = np.where(np.isfinite(p_mp), np.maximum(p_mp, 0.), np.nan)
+    return p_mp.sum(axis=1) * step_hours / 1000
+
+
+def _worker_init(inputs):
+    """
+    Keeps the inputs once per worker process.
+    """
+    global _worker_inputs
+    _worker_inputs = inputs
+
+
+def _worker_energy(parameters):
+    """
+    Task of a worker: dc energy of a chunk of modules.
+    """
+    if _worker_inputs is None:
+        raise RuntimeError("The worker has no inputs, start it with the initializer `_worker_init`.")
+    return module_energy(parameters, **_worker_inputs)
+
+
+def screen_modules(inputs, modules=None, losses=None, chunk_size=CHUNK_SIZE, max_workers=None):
+    """
+    Calculates the annual and specific yield of modules and ranks them.
+
+    Parameters
+    ----------
+    inputs: dict
+        Inputs from `screening_inputs`.
+    modules: pd.DataFrame, optional
+        CEC module parameters, one column per module. Default: `htw_modules.cec_modules()`.
+    losses: float, optional
+        pvwatts losses in %. Default: `pvlib.pvsystem.pvwatts_losses(**main.PVWATTS_LOSSES)`.
+    chunk_size: int
+        Modules per chunk.
+    max_workers: int, optional
+        Number of worker processes (1: no worker processes). Default: number of cpus.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per module, sorted by the specific yield: "technology", "stc" in W, "area" in m²,
+        "annual_yield" in kWh per module, "specific_yield" in kWh/kWp, "area_yield" in kWh/m²
+        and the ranks "rank_annual" and "rank_specific".
+    """
+    from pvlib import pvsystem
+
+    import htw_modules
+    import main
+
+    if modules is None:
+        modules = htw_modules.cec_modules()
+    if losses is None:
+        losses = pvsystem.pvwatts_losses(**main.PVWATTS_LOSSES)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    parameters = modules.loc[CEC_PARAMETERS].T.apply(pd.to_numeric, errors="coerce")
+    chunks = [parameters.iloc[start:start + chunk_size] for start in range(0, len(parameters), chunk_size)]
+
+    if max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_worker_init, initargs=(inputs,)) as executor:
+            energy = np.concatenate(list(executor.map(_worker_energy, chunks)))
+    else:
+        energy = np.concatenate([module_energy(chunk, **inputs) for chunk in chunks])
+
+    energy = energy * (1 - losses / 100)
+    stc = pd.to_numeric(modules.loc["STC"], errors="coerce").to_numpy(dtype=np.float64)
+    area = pd.to_numeric(modules.loc["A_c"], errors="coerce").to_numpy(dtype=np.float64)
+
+    ranking = pd.DataFrame({"technology": modules.loc["Technology"].to_numpy(),
+                            "stc": stc,
+                            "area": area,
+                            "annual_yield": energy,
+                            "specific_yield": energy / stc * 1000,
+                            "area_yield": energy / area,
+                            }, index=modules.columns)
+    ranking.index.name = "module"
+    ranking = ranking[np.isfinite(ranking["specific_yield"])]
+    ranking["rank_annual"] = ranking["annual_yield"].rank(ascending=False, method="min").astype(int)
+    ranking["rank_specific"] = ranking["specific_yield"].rank(ascending=False, method="min").astype(int)
+    return ranking.sort_values("rank_specific")
+
+
+if __name__ == "__main__":
+    import time
+
+    from htw_weather import load_weather
+
+    # Effective irradiation and cell temperature once (HTW 2015, orientation of main.py)
+    screening = screening_inputs(load_weather("htw"))
+
+    time_start = time.perf_counter()
+    result = screen_modules(screening)
+    print(f"Runtime: {time.perf_counter() - time_start:.0f} s for {len(result)} modules "
+          f"({len(screening['effective_irradiance'])} daylight hours)\n")
+
+    pd.set_option("display.width", 160)
+    pd.set_option("display.max_columns", None)
+    print(f"{' Specific yield (top 10) ':#^80}")
+    print(result.head(10).round(1), "\n")
+
+    print(f"{' Annual yield per module (top 10) ':#^80}")
+    print(result.sort_values("rank_annual").head(10).round(1), "\n")
+
+    print(f"{' Module of wr2 ':#^80}")
+    print(result.loc[["Aleo_Solar_S19y285"]].round(1))
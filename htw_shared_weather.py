@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains functions to share the weather-data between several processes.
+
+The time index and the weather columns are stored once in a shared memory block.
+Worker processes attach to this block and get a DataFrame which is a view on the shared memory (zero-copy),
+so the memory stays flat when the number of workers grows.
+
+Layout of the shared memory block:
+    [ time index (int64, ns since epoch, UTC) | column 1 (float64) | column 2 (float64) | ... ]
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from htw_weather import WEATHER_COLUMNS
+
+# Shared weather of a worker process (see `_worker_init`)
+_worker_shm = None
+_worker_weather = None
+
+
+def create_shared_weather(df, columns=None, name=None):
+    """
+    Copies the weather DataFrame once into a shared memory block.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Weather DataFrame with datetime index (e.g. from `htw_weather.convert_column_names`).
+    columns: list[str], optional
+        Columns to share. Default: all columns of `htw_weather.WEATHER_COLUMNS` which are in the DataFrame.
+    name: str, optional
+        Name of the shared memory block. If None, a unique name is created.
+
+    Returns
+    -------
+    shm: multiprocessing.shared_memory.SharedMemory
+        Shared memory block. The creator has to keep it open and has to call
+        `release_shared_weather(shm, unlink=True)` when all workers are finished.
+    meta: dict
+        Description of the block (name, length, columns, tz). It is small and can be sent to the workers.
+    """
+    if columns is None:
+        columns = [column for column in WEATHER_COLUMNS if column in df.columns]
+
+    index = pd.DatetimeIndex(df.index)
+    tz = None if index.tz is None else str(index.tz)
+    if tz is not None:
+        index = index.tz_convert("UTC")
+
+    length = len(index)
+    size = max(8 * length * (1 + len(columns)), 1)
+    shm = shared_memory.SharedMemory(create=True, size=size, name=name)
+
+    # Write the time index and the columns into the block
+    epochs, values = _block_arrays(shm, length, len(columns))
+    epochs[:] = index.asi8
+    for i, column in enumerate(columns):
+        values[i, :] = df[column].to_numpy(dtype=np.float64)
+
+    meta = {"name": shm.name,
+            "length": length,
+            "columns": list(columns),
+            "tz": tz,
+            }
+
+    return shm, meta
+
+
+def attach_shared_weather(meta):
+    """
+    Attaches to a shared weather block and returns the weather as DataFrame without copying the values.
+
+    Parameters
+    ----------
+    meta: dict
+        Description of the block from `create_shared_weather`.
+
+    Returns
+    -------
+    shm: multiprocessing.shared_memory.SharedMemory
+        Shared memory block. It has to be kept open as long as the DataFrame is used.
+    df: pd.DataFrame
+        Weather DataFrame with datetime index. The values are a read-only view on the shared memory.
+    """
+    shm = shared_memory.SharedMemory(name=meta["name"])
+    df = _block_frame(shm, meta)
+
+    return shm, df
+
+
+def release_shared_weather(shm, unlink=False):
+    """
+    Closes the shared weather block.
+
+    All DataFrames from `attach_shared_weather` have to be deleted before, otherwise the block can not be closed.
+
+    Parameters
+    ----------
+    shm: multiprocessing.shared_memory.SharedMemory
+        Shared memory block.
+    unlink: bool
+        If True, the block is freed. Only the creator should do this.
+    """
+    shm.close()
+    if unlink:
+        shm.unlink()
+
+
+def _block_arrays(shm, length, column_count):
+    """
+    Returns the numpy views of the time index and the columns of a shared memory block.
+    """
+    epochs = np.ndarray((length,), dtype=np.int64, buffer=shm.buf, offset=0)
+    values = np.ndarray((column_count, length), dtype=np.float64, buffer=shm.buf, offset=8 * length)
+    return epochs, values
+
+
+def _block_frame(shm, meta):
+    """
+    Creates a DataFrame which is a view on a shared memory block.
+    """
+    epochs, values = _block_arrays(shm, meta["length"], len(meta["columns"]))
+    values.flags.writeable = False
+
+    index = pd.DatetimeIndex(epochs.view("datetime64[ns]"), name="timestamp").tz_localize("UTC")
+    if meta["tz"] is not None:
+        index = index.tz_convert(meta["tz"])
+
+    # The transposed (column-major) array is stored as a single block by pandas, so there is no copy.
+    return pd.DataFrame(values.T, index=index, columns=meta["columns"], copy=False)
+
+
+def _worker_init(meta):
+    """
+    Attaches a worker process once to the shared weather block.
+    """
+    global _worker_shm, _worker_weather
+    _worker_shm, _worker_weather = attach_shared_weather(meta)
+
+
+def _worker_irradiation(month):
+    """
+    Example task of a worker: monthly global horizontal irradiation in kWh/m².
+    """
+    weather = _worker_weather[_worker_weather.index.month == month]
+    return month, round(weather.ghi.resample("h").mean().sum() / 1000, 1)
+
+
+if __name__ == "__main__":
+    from multiprocessing import Pool
+
+    from config import PATH_FRED_WEATHER
+    from htw_weather import convert_column_names
+
+    df_fred = pd.read_csv(PATH_FRED_WEATHER, sep=",")
+    df_fred = convert_column_names(df_fred, time="time", ghi="ghi", wind_speed="wind_speed", temp_air="temp_air")
+
+    # Share the weather once and let the workers attach to it
+    weather_shm, weather_meta = create_shared_weather(df_fred)
+    try:
+        with Pool(processes=4, initializer=_worker_init, initargs=(weather_meta,)) as pool:
+            for month_number, irradiation in pool.map(_worker_irradiation, range(1, 13)):
+                print(f"Month {month_number:>2}: {irradiation} kWh/m²")
+    finally:
+        release_shared_weather(weather_shm, unlink=True)
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains the streaming evaluation of the weather station measurements (near real-time monitoring).
+
+The measurements are read in batches, from a growing csv file (`tail_csv`, like the mview export of the HTW
+weather station) or from a queue (`queue_batches`, stand-in for a message broker). Every batch is converted like
+`htw_weather.convert_column_names`, dni and dhi are calculated (Erbs) and the warm models of the
+`htw_forecast.ForecastService` calculate the expected ac power. The expected (and, if available, the measured)
+energy is added to rolling daily and monthly sums, which keep only the last days and months.
+
+The cost of a batch depends only on the size of the batch: the solar positions are taken from the table of the
+location (warm the table for the monitoring period) and the sums are updated in place.
+"""
+
+import io
+import os
+import queue
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from config import HTW_WEATHER_TZ, PATH_HTW_WEATHER
+from htw_resample import CONVENTIONS, bin_width, interval_starts, time_step, to_epochs
+from htw_weather import convert_column_names
+
+# Columns of the HTW weather station (mview export)
+HTW_COLUMNS = {"time": "timestamp", "ghi": "g_hor_si", "wind_speed": "v_wind", "temp_air": "t_luft"}
+
+
+def tail_csv(path, sep=";", poll_interval=1.0, max_rows=1000, stop=None):
+    """
+    Reads the new rows of a growing csv file in batches.
+
+    Only complete lines are read, a line which is still written is read with the next batch.
+
+    Parameters
+    ----------
+    path: str
+        Path of the csv file (with header).
+    sep: str
+        Separator of the csv file.
+    poll_interval: float
+        Waiting time in s, if there are no new rows.
+    max_rows: int
+        Maximum number of rows per batch.
+    stop: threading.Event, optional
+        Stops the reading. If None, the reading stops at the end of the file.
+
+    Yields
+    ------
+    pd.DataFrame
+        New rows with the columns of the header.
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        header = file.readline()
+        while not header.endswith("\n"):
+            if stop is None or stop.is_set():
+                return
+            time.sleep(poll_interval)
+            header += file.readline()
+
+        rest = ""
+        while True:
+            lines = []
+            while len(lines) < max_rows:
+                line = file.readline()
+                if not line:
+                    break
+                line = rest + line
+                rest = ""
+                if not line.endswith("\n"):
+                    rest = line  # incomplete line, the rest follows
+                    break
+                lines.append(line)
+
+            if lines:
+                yield pd.read_csv(io.StringIO(header + "".join(lines)), sep=sep)
+            elif stop is None:
+                return
+            elif stop.is_set():
+                return
+            else:
+                time.sleep(poll_interval)
+
+
+def queue_batches(messages, timeout=1.0, stop=None):
+    """
+    Reads batches from a queue (stand-in for a message broker).
+
+    Parameters
+    ----------
+    messages: queue.Queue
+        Queue with DataFrames of rows (raw columns). None ends the stream.
+    timeout: float
+        Waiting time in s for a new message.
+    stop: threading.Event, optional
+        Stops the reading.
+
+    Yields
+    ------
+    pd.DataFrame
+        Rows of a message.
+    """
+    while stop is None or not stop.is_set():
+        try:
+            batch = messages.get(timeout=timeout)
+        except queue.Empty:
+            continue
+        if batch is None:
+            return
+        yield batch
+
+
+class RollingEnergy:
+    """
+    Rolling sums of the energy per period (e.g. days or months), only the last periods are kept.
+
+    The number of valid values is counted per period and system, periods without values are NaN (not 0 Wh).
+
+    Parameters
+    ----------
+    names: list[str]
+        Names of the systems (columns).
+    freq: str
+        "D" (days) or "M" (months).
+    keep: int
+        Number of periods which are kept.
+    """
+
+    def __init__(self, names, freq="D", keep=31):
+        self.names = list(names)
+        self.freq = freq
+        self.keep = keep
+        self.sums = OrderedDict()
+        self.counts = {}
+
+    def add(self, periods, energy):
+        """
+        Adds energy values.
+
+        Parameters
+        ----------
+        periods: pd.PeriodIndex
+            Period of every value.
+        energy: np.ndarray
+            Energy in Wh, array (values, systems). NaN values are not added.
+        """
+        keys, index = np.unique(periods.asi8, return_inverse=True)
+        valid = np.isfinite(energy)
+        sums = np.zeros((len(keys), len(self.names)), dtype=np.float64)
+        counts = np.zeros((len(keys), len(self.names)), dtype=np.int64)
+        np.add.at(sums, index, np.where(valid, energy, 0.))
+        np.add.at(counts, index, valid)
+
+        for key, values, count in zip(keys, sums, counts):
+            period = pd.Period(ordinal=int(key), freq=self.freq)
+            self.sums[period] = self.sums.get(period, 0.) + values
+            self.counts[period] = self.counts.get(period, 0) + count
+
+        # Periods in time order (late batches), only the last periods are kept
+        if list(self.sums) != sorted(self.sums):
+            self.sums = OrderedDict(sorted(self.sums.items()))
+        while len(self.sums) > self.keep:
+            period, _ = self.sums.popitem(last=False)
+            del self.counts[period]
+
+    def frame(self):
+        """
+        Returns the sums.
+
+        Returns
+        -------
+        pd.DataFrame
+            Energy in kWh, one row per period, one column per system (NaN without valid values).
+        """
+        return pd.DataFrame([np.where(self.counts[period] > 0, values / 1000, np.nan)
+                             for period, values in self.sums.items()],
+                            index=pd.PeriodIndex(list(self.sums), freq=self.freq), columns=self.names)
+
+
+class StreamProcessor:
+    """
+    Evaluates the models for batches of station measurements and keeps the rolling energy sums.
+
+    Parameters
+    ----------
+    service: htw_forecast.ForecastService
+        Service with the warm models.
+    step: str
+        Time step of the measurements (length of the measuring intervals).
+    convention: str
+        Position of the time stamps in the measuring interval: "start", "center" or "end".
+    columns: dict
+        Column names of the measurements ("time", "ghi", "wind_speed", "temp_air").
+    tz: str, optional
+        Time zone of naive time stamps (see `htw_weather.convert_column_names`).
+    keep_days: int
+        Number of days of the rolling daily sums.
+    keep_months: int
+        Number of months of the rolling monthly sums.
+    measured_convention: str
+        Position of the time stamps of the measured ac power in its measuring interval: "start", "center" or "end"
+        (e.g. hourly means of `htw_calibration.read_measured_ac`: "center").
+    """
+
+    def __init__(self, service, step="30min", convention="center", columns=None, tz=HTW_WEATHER_TZ,
+                 keep_days=31, keep_months=12, measured_convention="start"):
+        self.service = service
+        self.names = [model.name for model in service.models]
+        self.step = step
+        self.step_hours = bin_width(step) / 3.6e12
+        self.shift = pd.Timedelta(int(CONVENTIONS[convention] * bin_width(step)), unit="ns")
+        self.columns = HTW_COLUMNS if columns is None else columns
+        self.tz = tz
+        self.measured_convention = measured_convention
+
+        self.expected_daily = RollingEnergy(self.names, freq="D", keep=keep_days)
+        self.expected_monthly = RollingEnergy(self.names, freq="M", keep=keep_months)
+        self.measured_daily = RollingEnergy(self.names, freq="D", keep=keep_days)
+        self.measured_monthly = RollingEnergy(self.names, freq="M", keep=keep_months)
+        self.batches = 0
+        self.rows = 0
+        self.last_timestamp = None
+
+    def measured_intervals(self, measured):
+        """
+        Resamples the measured ac power to the measuring intervals of the station.
+
+        Finer measurements are averaged, coarser measurements (e.g. hourly means for 30 min intervals) are used
+        for all intervals they cover.
+
+        Parameters
+        ----------
+        measured: pd.DataFrame
+            Measured ac power in W (datetime index, naive time stamps are UTC), one column per system.
+
+        Returns
+        -------
+        pd.DataFrame
+            Mean measured ac power in W, index: interval starts (naive UTC) with the time step of the station.
+        """
+        epochs = to_epochs(measured.index)
+        step_measured = time_step(epochs)
+        index = pd.DatetimeIndex(interval_starts(epochs, convention=self.measured_convention, step=step_measured))
+
+        intervals = pd.DataFrame(measured.reindex(columns=self.names).to_numpy(dtype=np.float64), index=index,
+                                 columns=self.names).sort_index().resample(self.step).mean()
+        if step_measured > bin_width(self.step):
+            # Intervals up to the end of the last measuring interval
+            intervals = intervals.reindex(pd.date_range(intervals.index[0], index.max() + pd.Timedelta(step_measured),
+                                                        freq=self.step, inclusive="left"))
+            intervals = intervals.ffill(limit=step_measured // bin_width(self.step) - 1)
+        return intervals
+
+    def process(self, batch, measured=None):
+        """
+        Evaluates one batch of measurements.
+
+        Parameters
+        ----------
+        batch: pd.DataFrame
+            Rows of the station (raw column names, see `columns`).
+        measured: pd.DataFrame, optional
+            Measured ac power in W of the time steps of the batch, one column per system
+            (naive time stamps are UTC, see `measured_intervals`).
+
+        Returns
+        -------
+        pd.DataFrame
+            Expected ac power in W, one column per system.
+        """
+        return self._process(batch, None if measured is None else self.measured_intervals(measured))
+
+    def _process(self, batch, intervals=None):
+        """
+        Evaluates one batch with the measured ac power of the measuring intervals (see `measured_intervals`).
+        """
+        weather = convert_column_names(batch, time=self.columns["time"], ghi=self.columns["ghi"],
+                                       wind_speed=self.columns["wind_speed"], temp_air=self.columns["temp_air"],
+                                       tz=self.tz)
+        weather = weather[["ghi", "temp_air", "wind_speed"]].apply(pd.to_numeric, errors="coerce")
+        expected = self.service.forecast(weather)
+
+        # Periods of the measuring intervals (interval start)
+        starts = expected.index - self.shift
+        if starts.tz is not None:
+            starts = starts.tz_convert("UTC").tz_localize(None)
+        days = starts.to_period("D")
+        months = starts.to_period("M")
+
+        energy = expected[self.names].to_numpy(dtype=np.float64) * self.step_hours
+        self.expected_daily.add(days, energy)
+        self.expected_monthly.add(months, energy)
+
+        if intervals is not None:
+            energy = intervals.reindex(index=starts).to_numpy(dtype=np.float64) * self.step_hours
+            self.measured_daily.add(days, energy)
+            self.measured_monthly.add(months, energy)
+
+        self.batches += 1
+        self.rows += len(batch)
+        self.last_timestamp = expected.index.max()
+        return expected
+
+    def run(self, batches, measured=None):
+        """
+        Evaluates all batches of a source.
+
+        Parameters
+        ----------
+        batches: iterable[pd.DataFrame]
+            Batches (e.g. `tail_csv` or `queue_batches`).
+        measured: pd.DataFrame, optional
+            Measured ac power in W (datetime index, naive time stamps are UTC), one column per system.
+        """
+        # Measured ac power of the measuring intervals once (not per batch)
+        intervals = None if measured is None else self.measured_intervals(measured)
+
+        for batch in batches:
+            self._process(batch, intervals)
+
+    def monitor(self, freq="D"):
+        """
+        Compares the expected and the measured energy.
+
+        Parameters
+        ----------
+        freq: str
+            "D" (rolling days) or "M" (rolling months).
+
+        Returns
+        -------
+        pd.DataFrame
+            "expected" and "measured" energy in kWh and the "ratio" (measured / expected)
+            with the index (period, system).
+        """
+        expected = (self.expected_daily if freq == "D" else self.expected_monthly).frame().stack()
+        measured = (self.measured_daily if freq == "D" else self.measured_monthly).frame().stack()
+        measured = measured.reindex(expected.index)
+
+        return pd.DataFrame({"expected": expected,
+                             "measured": measured,
+                             "ratio": measured / expected.where(expected > 0),
+                             })
+
+
+def replay_csv(source, target, rows=48, interval=0.0, sep=";"):
+    """
+    Stand-in for the weather station: appends the rows of a csv file in blocks to a growing csv file.
+
+    Parameters
+    ----------
+    source: str
+        Path of the csv file with the measurements.
+    target: str
+        Path of the growing csv file (is overwritten).
+    rows: int
+        Number of rows per block.
+    interval: float
+        Waiting time between the blocks in s.
+    sep: str
+        Separator of the csv file.
+    """
+    df = pd.read_csv(source, sep=sep)
+
+    with open(target, "w", encoding="utf-8") as file:
+        file.write(sep.join(df.columns) + "\n")
+        file.flush()
+        for start in range(0, len(df), rows):
+            df.iloc[start:start + rows].to_csv(file, sep=sep, header=False, index=False)
+            file.flush()
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    import threading
+
+    from config import PATH_MEASURED_AC
+    from htw_calibration import read_measured_ac
+    from htw_forecast import ForecastService
+    from htw_weather import load_weather
+
+    # Warm models and solar position table of the station time stamps (checked with one month of HTW data)
+    service_htw = ForecastService(check_weather=load_weather("htw").loc["2015-06"])
+    service_htw.location.warm("2015-01-01 00:15", "2015-12-31 23:45", freq="30min",
+                              method=service_htw.models[0].solar_position_method)
+    # Measured ac power of the inverters (if the export of the monitoring is available), hourly means labelled
+    # with the center of the hour, every mean is used for both 30 min intervals of the station
+    measured_ac = read_measured_ac() if os.path.exists(PATH_MEASURED_AC) else None
+    processor = StreamProcessor(service_htw, measured_convention="center")
+
+    # The station writes one day per block into a growing file, the processor tails it
+    path_stream = "stream_htw.csv"
+    stop_stream = threading.Event()
+    writer = threading.Thread(target=replay_csv, args=(PATH_HTW_WEATHER, path_stream), kwargs={"interval": 0.001})
+    open(path_stream, "w").close()
+    writer.start()
+
+    time_start = time.perf_counter()
+    reader = threading.Thread(target=processor.run, args=(tail_csv(path_stream, poll_interval=0.01,
+                                                                   stop=stop_stream), measured_ac))
+    reader.start()
+    writer.join()
+    time.sleep(0.5)
+    stop_stream.set()
+    reader.join()
+    runtime = time.perf_counter() - time_start
+    os.remove(path_stream)
+
+    print(f"{processor.rows} rows in {processor.batches} batches, {1000 * runtime / processor.batches:.1f} ms "
+          f"per batch, last time step: {processor.last_timestamp}")
+    print(processor.expected_monthly.frame().round(1), "\n")
+    print(processor.monitor("D").tail(10).round(2))
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains the simulation of the pv-systems in the native (sub-hourly) resolution of the weather-data.
+
+`main.py` resamples the weather to hourly means before the simulation. Short irradiation peaks are averaged out, so
+the inverter clipping at `p_ac_0` (2900 W / 3000 W, see `htw_inverter`) is underestimated. Here the models run with
+the time steps of the source (HTW and openFRED: 30 min). The weather is stored as float32 and the models run
+in chunks of time steps; the ac energy and the clipping losses of every chunk are added to hourly (float32) and
+monthly (float64) sums, so only one chunk of full-resolution results is kept in memory.
+
+The hourly path labels the mean of 00:15 and 00:45 with 00:30, the center of the hour (`htw_weather.load_weather`),
+the native path uses the solar position of every time step. With the start labels (00:00) the solar geometry of
+the hourly path is 30 min early, which changes the yield more than the resolution.
+
+The native path should stay within `BUDGET` times the runtime and the peak memory of the hourly path.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Time steps per chunk (one year with 15 min time steps)
+CHUNK_SIZE = 35136
+
+# Maximum ratio of the runtime and the peak memory of the native path to the hourly path
+BUDGET = 2.
+
+
+def time_step_hours(times):
+    """
+    Returns the time step of a regular time index in hours.
+
+    Parameters
+    ----------
+    times: pd.DatetimeIndex
+        Time steps
+
+    Returns
+    -------
+    float
+        Time step in h (median of the differences, so single gaps do not change it).
+    """
+    if len(times) < 2:
+        raise ValueError("At least two time steps are needed to get the time step of the weather.")
+    return float(np.median(np.diff(times.asi8))) / 3.6e12
+
+
+def unclipped_ac(dc, inverter_parameters):
+    """
+    Calculates the ac power of the Sandia inverter model without the limit `Paco` (clipping).
+
+    Parameters
+    ----------
+    dc: pd.DataFrame or tuple[pd.DataFrame]
+        `ModelChain.results.dc` with the columns "p_mp" and "v_mp" (one DataFrame per pv-array).
+    inverter_parameters: dict
+        Parameters of the Sandia inverter model.
+
+    Returns
+    -------
+    np.ndarray
+        ac power in W (not limited to `Paco`, `-Pnt` below `Pso`, 0 for missing values).
+    """
+    import htw_inverter
+
+    if not isinstance(dc, tuple):
+        dc = (dc,)
+
+    p_dc = np.array([dc_array["p_mp"].to_numpy(dtype=np.float64) for dc_array in dc])
+    v_dc = np.array([dc_array["v_mp"].to_numpy(dtype=np.float64) for dc_array in dc])
+
+    # Like `pvlib.inverter.sandia_multi`: efficiency at the total power, weighted with the power of every array
+    ac = htw_inverter.sandia_multi(p_dc, v_dc, htw_inverter.stack_parameters([inverter_parameters]),
+                                   np.zeros(len(dc), dtype=np.int64), clip=False)[0]
+    return np.nan_to_num(ac)
+
+
+def clipping_loss(model):
+    """
+    Calculates the clipping losses of the inverter of a model after a run.
+
+    Parameters
+    ----------
+    model: pvlib.modelchain.ModelChain
+        ModelChain object after a run (Sandia inverter model).
+
+    Returns
+    -------
+    np.ndarray
+        Clipped ac power in W (ac power above `Paco`).
+    """
+    paco = model.system.inverter_parameters["Paco"]
+    return np.maximum(unclipped_ac(model.results.dc, model.system.inverter_parameters) - paco, 0.)
+
+
+class EnergyAggregator:
+    """
+    Adds the energy of chunks of time steps to hourly and monthly sums.
+
+    Hourly sums are stored as float32 (one array per chunk), monthly sums as float64.
+    Hours which are split between two chunks are combined when the results are returned.
+
+    Parameters
+    ----------
+    names: list[str]
+        Names of the systems (columns).
+    dtype: np.dtype
+        Data type of the hourly sums.
+    """
+
+    def __init__(self, names, dtype=np.float32):
+        self.names = list(names)
+        self.dtype = dtype
+        self.time_steps = 0
+        self.tz = None
+        self._hours = []
+        self._hourly = {"ac_energy": [], "clipping_loss": []}
+        self._monthly = {"ac_energy": {}, "clipping_loss": {}}
+
+    def add(self, times, **energies):
+        """
+        Adds the energy of one chunk.
+
+        Parameters
+        ----------
+        times: pd.DatetimeIndex
+            Time steps of the chunk.
+        energies: np.ndarray
+            "ac_energy" and "clipping_loss" in Wh, arrays (time steps, systems).
+        """
+        # Hour of every time step as int64 (ns), bins of the hours in the chunk
+        hours, bins = np.unique(times.floor("h").asi8, return_inverse=True)
+        month_keys = pd.DatetimeIndex(hours, tz=times.tz).to_period("M")
+
+        for key, energy in energies.items():
+            hourly = np.empty((len(hours), len(self.names)), dtype=np.float64)
+            for j in range(len(self.names)):
+                hourly[:, j] = np.bincount(bins, weights=energy[:, j], minlength=len(hours))
+            self._hourly[key].append(hourly.astype(self.dtype))
+
+            monthly = self._monthly[key]
+            for month, values in pd.DataFrame(hourly).groupby(month_keys.to_numpy()).sum().iterrows():
+                monthly[month] = monthly.get(month, 0.) + values.to_numpy()
+
+        self._hours.append(hours)
+        self.tz = times.tz
+        self.time_steps += len(times)
+
+    def hourly(self, key="ac_energy"):
+        """
+        Returns the hourly sums.
+
+        Parameters
+        ----------
+        key: str
+            "ac_energy" or "clipping_loss".
+
+        Returns
+        -------
+        pd.DataFrame
+            Energy in Wh per hour, one column per system.
+        """
+        hours = np.concatenate(self._hours)
+        df = pd.DataFrame(np.concatenate(self._hourly[key]), columns=self.names,
+                          index=pd.DatetimeIndex(hours, tz=self.tz))
+        if df.index.has_duplicates:
+            df = df.groupby(level=0).sum()
+        return df
+
+    def monthly(self, key="ac_energy"):
+        """
+        Returns the monthly sums.
+
+        Parameters
+        ----------
+        key: str
+            "ac_energy" or "clipping_loss".
+
+        Returns
+        -------
+        pd.DataFrame
+            Energy in kWh per month, one column per system (index: monthly periods).
+        """
+        monthly = self._monthly[key]
+        return pd.DataFrame([monthly[month] / 1000 for month in sorted(monthly)],
+                            index=pd.PeriodIndex(sorted(monthly), freq="M"), columns=self.names)
+
+
+def run_native(models, weather, chunk_size=CHUNK_SIZE):
+    """
+    Runs the models in the resolution of the weather-data and aggregates the energy.
+
+    Parameters
+    ----------
+    models: list[pvlib.modelchain.ModelChain]
+        ModelChain objects (Sandia inverter model). After the run the results contain the last chunk only.
+    weather: pd.DataFrame
+        Weather in the native resolution (e.g. `htw_weather.load_weather(source, freq=None, dtype=np.float32)`).
+    chunk_size: int
+        Time steps per chunk.
+
+    Returns
+    -------
+    EnergyAggregator
+        Hourly and monthly "ac_energy" and "clipping_loss".
+    """
+    step_hours = time_step_hours(weather.index)
+    aggregator = EnergyAggregator([model.name for model in models])
+
+    for start in range(0, len(weather), chunk_size):
+        chunk = weather.iloc[start:start + chunk_size]
+
+        ac = np.empty((len(chunk), len(models)), dtype=np.float64)
+        clipping = np.empty((len(chunk), len(models)), dtype=np.float64)
+        for j, model in enumerate(models):
+            model.run_model(chunk)
+            ac[:, j] = model.results.ac.to_numpy(dtype=np.float64)
+            clipping[:, j] = clipping_loss(model)
+
+        aggregator.add(chunk.index, ac_energy=ac * step_hours, clipping_loss=clipping * step_hours)
+
+    return aggregator
+
+
+def run_hourly(models, weather):
+    """
+    Runs the models with hourly weather-data (like `main.py`) and aggregates the energy.
+
+    Parameters
+    ----------
+    models: list[pvlib.modelchain.ModelChain]
+        ModelChain objects (Sandia inverter model).
+    weather: pd.DataFrame
+        Hourly weather.
+
+    Returns
+    -------
+    EnergyAggregator
+        Hourly and monthly "ac_energy" and "clipping_loss".
+    """
+    return run_native(models, weather, chunk_size=len(weather))
+
+
+if __name__ == "__main__":
+    import time
+    import tracemalloc
+
+    from htw_weather import load_weather
+    from main import SYSTEMS, setup_location, setup_models
+
+    pd.set_option("display.width", 160)
+    pd.set_option("display.max_columns", None)
+
+    location = setup_location(cached=True)
+
+    # Systems of main.py and oversized pv-arrays (1.5 x modules per string, the inverters reach Paco)
+    systems_oversized = [{**system, "arrays": [{**array, "modules_per_string": round(1.5 * array["modules_per_string"])}
+                                               for array in system["arrays"]]}
+                         for system in SYSTEMS]
+    cases = {"htw systems": setup_models(location=location),
+             "oversized": setup_models(location=location, systems=systems_oversized)}
+
+    for source in ["htw", "fred"]:
+        weather_start = load_weather(source, label="start")
+        weather_hourly = load_weather(source, label="center")
+        weather_native = load_weather(source, freq=None, dtype=np.float32)
+
+        for case, models in cases.items():
+            benchmark = {}
+            for mode, weather, run in [("hourly", weather_hourly, run_hourly), ("native", weather_native, run_native)]:
+                run(models, weather)  # solar positions in the table of the location
+
+                time_start = time.perf_counter()
+                aggregator = run(models, weather)
+                runtime = time.perf_counter() - time_start
+
+                tracemalloc.start()
+                run(models, weather)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                benchmark[mode] = (aggregator, runtime, peak)
+
+            print(f"{f' Benchmark {source.upper()}, {case} ':#^60}")
+            for mode, (aggregator, runtime, peak) in benchmark.items():
+                print(f"{mode:>6}: {aggregator.time_steps} time steps, {runtime:.2f} s, "
+                      f"peak memory {peak / 1024 ** 2:.1f} MB")
+            ratio_runtime = benchmark["native"][1] / benchmark["hourly"][1]
+            ratio_peak = benchmark["native"][2] / benchmark["hourly"][2]
+            within = "within" if max(ratio_runtime, ratio_peak) <= BUDGET else "above"
+            print(f"native / hourly: runtime {ratio_runtime:.2f}, peak memory {ratio_peak:.2f} "
+                  f"({within} the budget of {BUDGET:.0f}x)")
+
+            clipping = {mode: benchmark[mode][0].monthly("clipping_loss").sum() for mode in benchmark}
+            if max(clipping["hourly"].max(), clipping["native"].max()) == 0:
+                print("The inverters do not reach Paco (no clipping losses).")
+
+            print(pd.DataFrame({
+                "yield_hourly_start": run_hourly(models, weather_start).monthly().sum(),
+                "yield_hourly": benchmark["hourly"][0].monthly().sum(),
+                "yield_native": benchmark["native"][0].monthly().sum(),
+                "clipping_hourly": clipping["hourly"],
+                "clipping_native": clipping["native"],
+            }).round(1), "\n")
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains the Monte-Carlo simulation of the yield uncertainty (P50, P90) of the pv-systems.
+
+Instead of one `run_model` per sample, every model runs twice without losses (cached, see `htw_calibration`):
+with the weather and with the irradiation scaled by `IRRADIANCE_STEP`. The two runs give the dc power, the dc
+voltage, the cell temperature and the sensitivity of the dc power to the irradiation of every time step.
+The samples are then applied as additional array dimension (samples x time steps):
+
+    p_dc = p_dc_0 * (1 + sensitivity * (irradiance_scale - 1)) * (1 + gamma_offset / 100 * (t_cell - 25))
+    ac = sandia((1 - losses / 100) * p_dc, (1 - losses / 100) * v_dc)
+
+The losses act on power and voltage like the pvwatts losses of `ModelChain`. The samples are evaluated in chunks
+(`htw_inverter.sandia`), so the memory does not depend on the number of samples.
+P90 is the yield which is exceeded with a probability of 90 % (10 % percentile).
+"""
+
+import numpy as np
+import pandas as pd
+
+import htw_calibration
+import htw_inverter
+from htw_subhourly import time_step_hours
+
+# Standard deviations of the sampled quantities
+# irradiance_scale: relative (e.g. 0.05 = 5 % of the irradiation), losses: in % points, gamma_offset: in %/K
+UNCERTAINTIES = {"irradiance_scale": 0.05,
+                 "losses": 2.0,
+                 "gamma_offset": 0.05,
+                 }
+
+# Relative change of the irradiation for the sensitivity of the dc power
+IRRADIANCE_STEP = 0.05
+
+# Samples per chunk
+CHUNK_SIZE = 256
+
+
+def draw_samples(count, losses, uncertainties=None, seed=None, deviates=None):
+    """
+    Draws normally distributed samples of the uncertain quantities.
+
+    Parameters
+    ----------
+    count: int
+        Number of samples.
+    losses: float
+        Nominal losses in % (e.g. `pvlib.pvsystem.pvwatts_losses(**PVWATTS_LOSSES)`).
+    uncertainties: dict, optional
+        Standard deviations. Default: `UNCERTAINTIES`.
+    seed: int, optional
+        Seed of the random number generator.
+    deviates: np.ndarray, optional
+        Standard normal deviates, array (3, count) (irradiation, losses, temperature coefficient), e.g. the same
+        deviates for several models. Default: drawn with `seed`.
+
+    Returns
+    -------
+    pd.DataFrame
+        "irradiance_scale", "losses" in % (0 - 100) and "gamma_offset" in %/K, one row per sample.
+    """
+    if uncertainties is None:
+        uncertainties = UNCERTAINTIES
+    if deviates is None:
+        deviates = np.random.default_rng(seed).standard_normal((3, count))
+
+    return pd.DataFrame({
+        "irradiance_scale": np.maximum(1. + uncertainties["irradiance_scale"] * deviates[0], 0.),
+        "losses": np.clip(losses + uncertainties["losses"] * deviates[1], 0., 100.),
+        "gamma_offset": uncertainties["gamma_offset"] * deviates[2],
+    })
+
+
+def scale_irradiance(weather, factor):
+    """
+    Returns a copy of the weather with scaled irradiation (ghi, dni, dhi).
+
+    Parameters
+    ----------
+    weather: pd.DataFrame
+        Weather DataFrame.
+    factor: float
+        Scaling factor.
+
+    Returns
+    -------
+    pd.DataFrame
+        Weather with the scaled irradiation.
+    """
+    weather = weather.copy()
+    for column in ["ghi", "dni", "dhi"]:
+        weather[column] = weather[column] * factor
+    return weather
+
+
+def model_intermediates(model, weather):
+    """
+    Calculates the intermediates of a model for the samples (two cached runs without losses).
+
+    Parameters
+    ----------
+    model: pvlib.modelchain.ModelChain
+        ModelChain object.
+    weather: pd.DataFrame
+        Weather DataFrame which is passed to `ModelChain.run_model`.
+
+    Returns
+    -------
+    pd.DataFrame
+        "p_dc" in W, "v_dc" in V and "cell_temperature" in °C without losses
+        and the "sensitivity" of the dc power to the irradiation (relative change / relative change).
+    """
+    dc = htw_calibration.preloss_dc(model, weather)
+    dc_scaled = htw_calibration.preloss_dc(model, scale_irradiance(weather, 1 + IRRADIANCE_STEP))
+
+    p_dc = dc["p_dc"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sensitivity = (dc_scaled["p_dc"].to_numpy() / p_dc - 1) / IRRADIANCE_STEP
+    dc["sensitivity"] = np.where(p_dc > 0, sensitivity, 1.)
+
+    return dc.fillna({"p_dc": 0., "v_dc": 0., "cell_temperature": 25.})
+
+
+def sample_yields(intermediates, inverter_parameters, samples, chunk_size=CHUNK_SIZE):
+    """
+    Calculates the monthly ac energy of the samples.
+
+    Parameters
+    ----------
+    intermediates: pd.DataFrame
+        Intermediates of a model from `model_intermediates`.
+    inverter_parameters: dict
+        Sandia inverter parameters.
+    samples: pd.DataFrame
+        Samples from `draw_samples`.
+    chunk_size: int
+        Samples per chunk.
+
+    Returns
+    -------
+    pd.DataFrame
+        ac energy in kWh, one row per sample, one column per month (periods).
+    """
+    p_dc = intermediates["p_dc"].to_numpy(dtype=np.float64)[np.newaxis, :]
+    v_dc = intermediates["v_dc"].to_numpy(dtype=np.float64)[np.newaxis, :]
+    sensitivity = intermediates["sensitivity"].to_numpy(dtype=np.float64)[np.newaxis, :]
+    temperature_difference = intermediates["cell_temperature"].to_numpy(dtype=np.float64)[np.newaxis, :] - 25
+
+    # Months of the time steps as one-hot matrix (time steps x months): energy = ac @ months * time step
+    periods = intermediates.index.to_period("M")
+    month_keys, month_index = np.unique(periods.asi8, return_inverse=True)
+    months = np.zeros((len(periods), len(month_keys)), dtype=np.float64)
+    months[np.arange(len(periods)), month_index] = time_step_hours(intermediates.index) / 1000
+
+    parameters = htw_inverter.stack_parameters([inverter_parameters])
+
+    energy = np.empty((len(samples), len(month_keys)), dtype=np.float64)
+    for start in range(0, len(samples), chunk_size):
+        chunk = samples.iloc[start:start + chunk_size]
+        scale = chunk["irradiance_scale"].to_numpy()[:, np.newaxis]
+        derate = 1 - chunk["losses"].to_numpy()[:, np.newaxis] / 100
+        gamma_offset = chunk["gamma_offset"].to_numpy()[:, np.newaxis] / 100
+
+        p_sample = p_dc * (1 + sensitivity * (scale - 1)) * (1 + gamma_offset * temperature_difference) * derate
+        ac = htw_inverter.sandia(p_sample, v_dc * derate, parameters)
+        energy[start:start + len(chunk)] = ac @ months
+
+    return pd.DataFrame(energy, columns=pd.PeriodIndex.from_ordinals(month_keys, freq="M"))
+
+
+def yield_percentiles(energy, percentiles=(50, 90)):
+    """
+    Calculates the exceedance percentiles of the monthly and annual yield.
+
+    Parameters
+    ----------
+    energy: pd.DataFrame
+        Monthly ac energy of the samples from `sample_yields`.
+    percentiles: tuple[int]
+        Exceedance probabilities in % (P90: yield which is exceeded with a probability of 90 %).
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per month and the row "year", one column per percentile (e.g. "P50", "P90") in kWh.
+    """
+    energy = energy.copy()
+    energy.columns = energy.columns.astype(str)
+    energy["year"] = energy.sum(axis=1)
+
+    return pd.DataFrame({f"P{p}": np.percentile(energy.to_numpy(), 100 - p, axis=0) for p in percentiles},
+                        index=energy.columns)
+
+
+def run_uncertainty(models, weather, count=1000, uncertainties=None, seed=None, percentiles=(50, 90),
+                    chunk_size=CHUNK_SIZE):
+    """
+    Calculates the yield percentiles of all models.
+
+    Parameters
+    ----------
+    models: list[pvlib.modelchain.ModelChain]
+        ModelChain objects (pvwatts losses, Sandia inverter model).
+    weather: pd.DataFrame
+        Weather DataFrame which is passed to `ModelChain.run_model`.
+    count: int
+        Number of samples (the same deviates are used for all models, shifted by their nominal losses).
+    uncertainties: dict, optional
+        Standard deviations. Default: `UNCERTAINTIES`.
+    seed: int, optional
+        Seed of the random number generator.
+    percentiles: tuple[int]
+        Exceedance probabilities in %.
+    chunk_size: int
+        Samples per chunk.
+
+    Returns
+    -------
+    pd.DataFrame
+        Yield percentiles in kWh with the index (system, month or "year").
+    """
+    from pvlib import pvsystem
+
+    deviates = np.random.default_rng(seed).standard_normal((3, count))
+
+    results = {}
+    for model in models:
+        samples = draw_samples(count, pvsystem.pvwatts_losses(**model.system.losses_parameters),
+                               uncertainties=uncertainties, deviates=deviates)
+        energy = sample_yields(model_intermediates(model, weather), model.system.inverter_parameters, samples,
+                               chunk_size=chunk_size)
+        results[model.name] = yield_percentiles(energy, percentiles=percentiles)
+
+    return pd.concat(results, names=["system", "period"])
+
+
+if __name__ == "__main__":
+    import time
+
+    from htw_weather import load_weather
+    from main import setup_models
+
+    weather_fred = load_weather("fred")
+
+    time_start = time.perf_counter()
+    uncertainty = run_uncertainty(setup_models(), weather_fred, count=2000, seed=1)
+    print(f"Runtime (5 systems, 2000 samples): {time.perf_counter() - time_start:.1f} s\n")
+
+    print(f"{' Annual yield (FRED) ':#^50}")
+    print(uncertainty.xs("year", level="period").round(1), "\n")
+
+    print(f"{' Monthly yield wr1 (FRED) ':#^50}")
+    print(uncertainty.loc["wr1"].round(1))
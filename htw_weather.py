@@ -5,10 +5,16 @@
 This script contains functions to prepare the weather-data from csv files.
 """
 
+import warnings
+
+import numpy as np
 import pandas as pd
-from pvlib import solarposition, irradiance
 
-from config import HTW_LON, HTW_LAT, PATH_HTW_WEATHER, PATH_FRED_WEATHER
+from config import HTW_LON, HTW_LAT, PATH_HTW_WEATHER, PATH_FRED_WEATHER, HTW_WEATHER_TZ, WEATHER_START, WEATHER_END
+import htw_resample
+
+# Weather columns which are used by the models (irradiation, air temperature and wind speed)
+WEATHER_COLUMNS = ["ghi", "dni", "dhi", "temp_air", "wind_speed"]
 
 
 def calculate_diffuse_irradiation(df, parameter_name, lat, lon):
@@ -36,6 +42,8 @@ def calculate_diffuse_irradiation(df, parameter_name, lat, lon):
         Combined with the original Dataframe coulmns.
     """
 
+    from pvlib import solarposition, irradiance
+
     # calculate dhi and dni for htw weatherdata
     df_solarpos = solarposition.spa_python(df.index, lat, lon)
 
@@ -53,7 +61,7 @@ def calculate_diffuse_irradiation(df, parameter_name, lat, lon):
     return df_irradiance_combined
 
 
-def convert_column_names(df, time, ghi, wind_speed, temp_air):
+def convert_column_names(df, time, ghi, wind_speed, temp_air, tz=None, time_format=None):
     """
     Converts the columns of a DataFrame and returns a DataFrame
 
@@ -69,6 +77,11 @@ def convert_column_names(df, time, ghi, wind_speed, temp_air):
         Colum name that contains the wind speed values.
     temp_air: str
     Column name that contains the air temperature values.
+    tz: str, optional
+        Time zone of naive time stamps (e.g. "Europe/Berlin"). The index is converted to UTC.
+        If None, naive time stamps stay naive (UTC).
+    time_format: str, optional
+        Format of the time stamps (e.g. "%Y-%m-%d %H:%M:%S"). If None, the format is inferred.
 
     Returns
     -------
@@ -85,11 +98,170 @@ def convert_column_names(df, time, ghi, wind_speed, temp_air):
 
     # Set the timestamp as Index as a Datetime datatype
     df.set_index('timestamp', inplace=True)
-    df.index = pd.to_datetime(df.index)
+    df.index = pd.to_datetime(df.index, format=time_format)
+
+    # Localize naive time stamps (the repeated hour of the daylight saving time is inferred from the order)
+    if tz is not None and df.index.tz is None:
+        df.index = df.index.tz_localize(tz, ambiguous="infer", nonexistent="shift_forward").tz_convert("UTC")
 
     return df
 
 
+def prepare_weather(df, freq="h", columns=None, dtype=np.float64, convention="start", start=None, end=None,
+                    return_gaps=False, label="start"):
+    """
+    Prepares the weather DataFrame for the models.
+
+    All model-relevant columns are copied once into one contiguous float array. The returned DataFrame holds
+    this array as a single block, so the columns are views on it and all columns are resampled in one pass
+    (integer bins of the UTC epochs, see `htw_resample`). Calendar frequencies (e.g. "MS") are resampled with
+    `pd.DataFrame.resample` of the interval starts.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Weather DataFrame with datetime index and at least the columns "ghi", "dni" and "dhi".
+    freq: str or None
+        Resample frequency (e.g. "h" or "MS"). If None, the weather is not resampled.
+    columns: list[str], optional
+        Columns to keep. Default: all columns of `WEATHER_COLUMNS` which are in the DataFrame.
+    dtype: np.dtype
+        Data type of the buffer (e.g. np.float32 for long sub-hourly time series).
+    convention: str
+        Position of the time stamps in the measuring interval: "start", "center" or "end".
+    start, end: str or pd.Timestamp, optional
+        Period of the weather (interval starts, UTC if not localized; end excluded).
+    return_gaps: bool
+        If True, the number of missing values per time step and column is returned too (0 without resampling).
+    label: str
+        Position of the time stamps in the resampled bins: "start" or "center" (the means represent the whole
+        interval, the models need the center). Calendar frequencies only support "start" (labels of
+        `pd.DataFrame.resample`). Without resampling the original time stamps are kept.
+
+    Returns
+    -------
+    pd.DataFrame
+        Weather DataFrame with the model-relevant columns as float values.
+    pd.DataFrame
+        Only with `return_gaps`: number of missing values (expected values - values, NaN values are missing).
+    """
+    missing = [column for column in ["ghi", "dni", "dhi"] if column not in df.columns]
+    if missing:
+        raise KeyError(f"The weather DataFrame has no irradiation column(s): {missing}")
+
+    if columns is None:
+        columns = [column for column in WEATHER_COLUMNS if column in df.columns]
+
+    # Without temp_air and wind_speed pvlib uses 20 °C and 0 m/s for the cell temperature
+    for column in ["temp_air", "wind_speed"]:
+        if column not in columns:
+            warnings.warn(f"The weather has no column '{column}', the temperature model uses its default value.")
+
+    if freq is not None and not htw_resample.is_fixed_frequency(freq) and label != "start":
+        raise ValueError(f"The bins of the calendar frequency '{freq}' are labelled like `pd.DataFrame.resample`, "
+                         f"use label='start' (label: {label}).")
+
+    epochs = htw_resample.to_epochs(df.index)
+    starts = htw_resample.interval_starts(epochs, convention=convention)
+    start = None if start is None else htw_resample.to_epochs([start])[0]
+    end = None if end is None else htw_resample.to_epochs([end])[0]
+
+    # One contiguous buffer, each column is a contiguous row of it
+    values = np.empty((len(columns), len(df)), dtype=dtype)
+    for i, column in enumerate(columns):
+        values[i, :] = df[column].to_numpy(dtype=dtype)
+
+    keep = np.ones(len(df), dtype=bool)
+    if start is not None:
+        keep &= starts >= start
+    if end is not None:
+        keep &= starts < end
+
+    if freq is None:
+        weather = pd.DataFrame(values[:, keep].T, index=df.index[keep], columns=columns, copy=False)
+        if return_gaps:
+            gaps = pd.DataFrame(np.isnan(values[:, keep].T).astype(np.int64), index=weather.index, columns=columns)
+    elif htw_resample.is_fixed_frequency(freq):
+        means, counts, labels = htw_resample.resample_mean(values, starts, freq=freq, start=start, end=end,
+                                                           label=label)
+        index = pd.DatetimeIndex(labels, tz="UTC" if df.index.tz is not None else None, name=df.index.name)
+        weather = pd.DataFrame(means.astype(dtype).T, index=index, columns=columns, copy=False)
+        if return_gaps:
+            expected = htw_resample.expected_count(freq, htw_resample.time_step(epochs))
+            gaps = pd.DataFrame(expected - counts.T, index=index, columns=columns)
+    else:
+        weather, gaps = _resample_calendar(values[:, keep], starts[keep], freq, columns, df.index, start, end,
+                                           return_gaps)
+        weather = weather.astype(dtype)
+
+    if return_gaps:
+        return weather, gaps
+    return weather
+
+
+def _resample_calendar(values, starts, freq, columns, original_index, start=None, end=None, return_gaps=False):
+    """
+    Resamples the weather to a calendar frequency (e.g. "MS") with `pd.DataFrame.resample` of the interval starts.
+    """
+    tz = "UTC" if original_index.tz is not None else None
+    index = pd.DatetimeIndex(starts, tz=tz, name=original_index.name)
+    resampler = pd.DataFrame(values.T, index=index, columns=columns).resample(freq)
+    weather = resampler.mean()
+    if not return_gaps:
+        return weather, None
+
+    # Expected values per bin: regular time steps of the period
+    step = htw_resample.time_step(htw_resample.to_epochs(original_index))
+    first = starts.min() if start is None else start
+    last = starts.max() + step if end is None else end
+    expected = pd.Series(1, index=pd.DatetimeIndex(np.arange(first, last, step), tz=tz)).resample(freq).sum()
+    expected = expected.reindex(weather.index, fill_value=0).to_numpy()
+    gaps = pd.DataFrame(expected[:, np.newaxis] - resampler.count().to_numpy(), index=weather.index,
+                        columns=columns)
+    return weather, gaps
+
+
+def load_weather(source, freq="h", dtype=np.float64, label="center"):
+    """
+    Reads and prepares the weather-data of a source like in `main.py`.
+
+    Parameters
+    ----------
+    source: str
+        "htw" (weather station, `PATH_HTW_WEATHER`) or "fred" (openFRED, `PATH_FRED_WEATHER`).
+    freq: str or None
+        Resample frequency (e.g. "h"). If None, the weather is not resampled.
+    dtype: np.dtype
+        Data type of the weather values (see `prepare_weather`).
+    label: str
+        Position of the time stamps in the resampled bins (see `prepare_weather`). Default: "center", the time
+        stamps are the input of the models (solar position of the interval center).
+
+    The time stamps of both sources are the centers of 30 min intervals, the period is `WEATHER_START` to
+    `WEATHER_END`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Weather DataFrame with the columns of `WEATHER_COLUMNS` (see `prepare_weather`).
+    """
+    if source == "htw":
+        df = pd.read_csv(PATH_HTW_WEATHER, sep=";")  # (mview!)
+        df = convert_column_names(df, time="timestamp", ghi="g_hor_si", wind_speed="v_wind", temp_air="t_luft",
+                                  tz=HTW_WEATHER_TZ)
+        df = calculate_diffuse_irradiation(df, parameter_name="ghi", lat=HTW_LAT, lon=HTW_LON)
+        return prepare_weather(df, freq=freq, dtype=dtype, convention="center", start=WEATHER_START, end=WEATHER_END,
+                               label=label)
+
+    if source == "fred":
+        df = pd.read_csv(PATH_FRED_WEATHER, sep=",")
+        df = convert_column_names(df, time="time", ghi="ghi", wind_speed="wind_speed", temp_air="temp_air")
+        return prepare_weather(df, freq=freq, dtype=dtype, convention="center", start=WEATHER_START, end=WEATHER_END,
+                               label=label)
+
+    raise ValueError(f"Unknown weather source: {source} (use 'htw' or 'fred')")
+
+
 if __name__ == "__main__":
     # The dataframe for the weather data must fulfill the following conditions:
     # - Index named "timestamp" as Datetime datatype
@@ -105,16 +277,19 @@ if __name__ == "__main__":
     df_fred = pd.read_csv(PATH_FRED_WEATHER, sep=",")  # Read the file
 
     # Convert the column names for the htw weather and calculate the diffuse irradiation.
-    df_htw = convert_column_names(df_htw, time="timestamp", ghi="g_hor_si", wind_speed="v_wind", temp_air="t_Luft")
+    df_htw = convert_column_names(df_htw, time="timestamp", ghi="g_hor_si", wind_speed="v_wind", temp_air="t_luft",
+                                  tz=HTW_WEATHER_TZ)
     df_htw = calculate_diffuse_irradiation(df_htw, parameter_name="ghi", lat=HTW_LAT, lon=HTW_LON)
 
     # Column names are already correct but the "timestamp" column has to be set as Index
     df_fred = convert_column_names(df_fred, time="time", ghi="ghi", wind_speed="wind_speed", temp_air="temp_air")
 
-    # Assign the weather DataFrame hourly resampled
-    weather_htw = df_htw.resample("h").mean()
-    weather_fred = df_fred.resample("h").mean()
-    weather_fred = weather_fred[weather_fred.index.year > 2014]
+    # Assign the weather DataFrame hourly resampled (time stamps: centers of 30 min intervals)
+    # The hourly means are labelled with the center of the hour (time stamps of the models)
+    weather_htw = prepare_weather(df_htw, freq="h", convention="center", start=WEATHER_START, end=WEATHER_END,
+                                  label="center")
+    weather_fred = prepare_weather(df_fred, freq="h", convention="center", start=WEATHER_START, end=WEATHER_END,
+                                   label="center")
 
     # Print the results
     print(weather_htw)
@@ -21,15 +21,153 @@ Infos:
 import calendar as cal
 
 # Import libraries
-import pvlib
+# pvlib and matplotlib are imported when they are needed (faster start of the script and of worker processes)
 import pandas as pd
-import matplotlib.pyplot as plt
 
 # Import own modules
-from config import HTW_LON, HTW_LAT, PATH_HTW_WEATHER, PATH_FRED_WEATHER, PATH_RESULTS
+from config import HTW_LON, HTW_LAT, PATH_RESULTS, PATH_EXPORT, FRED_CORRECTION
 import htw_modules
 import htw_inverter
-import htw_weather
+import htw_reconciliation
+import htw_export
+import htw_cache
+
+# Set the Angles
+# The tilt angle is defined as degrees from horizontal (surface facing up = 0, surface facing horizon = 90)
+SURFACE_TILT = 14.57
+
+# Azimuth angle of the module surface. North=0, East=90, South=180, West=270.
+SURFACE_AZIMUTH = 215
+
+# Set the Albedo
+ALBEDO = 0.2
+
+# Set the temperature model ("open_rack_glass_polymer" (higher yield) or "close_mount_glass_glass")
+TEMPERATURE_MODEL = ("sapm", "open_rack_glass_polymer")
+
+# pvwatts default losses:
+PVWATTS_LOSSES = {"soiling": 2,
+                  "shading": 3,
+                  "snow": 0,
+                  "mismatch": 2,
+                  "wiring": 2,
+                  "connections": 0.5,
+                  "lid": 1.5,
+                  "nameplate_rating": 1,
+                  "age": 0,
+                  "availability": 3
+                  }
+
+# PV systems (one per inverter) with their pv-arrays
+# The module and inverter parameters are functions, they are only called (fitted) when the systems are set up.
+# Every inverter can have several pv-arrays (sub-fields), e.g. with different angles:
+#     "arrays": [{"modules_per_string": 10, "strings": 2},
+#                {"modules_per_string": 10, "strings": 1, "surface_tilt": 30, "surface_azimuth": 125}]
+# Missing array values are SURFACE_TILT, SURFACE_AZIMUTH and ALBEDO.
+SYSTEMS = [
+    {"name": "wr1",
+     "module": "Schott_ASI_105", "module_parameters": htw_modules.modul1,  # Schott ASI 105
+     "inverter": "Danfoss_DLX_2.9", "inverter_parameters": htw_inverter.inv1,  # Danfoss DLX 2.9
+     "arrays": [{"modules_per_string": 10, "strings": 3}]},
+    {"name": "wr2",
+     "module": "Aleo_Solar_S19y285", "module_parameters": htw_modules.modul2,  # Aleo Solar S19 G2 285
+     "inverter": "Danfoss_DLX_2.9", "inverter_parameters": htw_inverter.inv1,  # Danfoss DLX 2.9
+     "arrays": [{"modules_per_string": 11, "strings": 1}]},
+    {"name": "wr3",
+     "module": "Aleo_Solar_S18_240", "module_parameters": htw_modules.modul3,  # Aleo Solar S18 240
+     "inverter": "Danfoss_DLX_2.9", "inverter_parameters": htw_inverter.inv1,  # Danfoss DLX 2.9
+     "arrays": [{"modules_per_string": 14, "strings": 1}]},
+    {"name": "wr4",
+     "module": "Aleo_Solar_S19_245", "module_parameters": htw_modules.modul4,  # Aleo Solar S19 G1 245
+     "inverter": "SMA_SB_3000HF-30", "inverter_parameters": htw_inverter.inv2,  # SMA SUNNY BOY 3000HF-30
+     "arrays": [{"modules_per_string": 13, "strings": 1}]},
+    {"name": "wr5",
+     "module": "Schott_ASI_105", "module_parameters": htw_modules.modul1,  # Schott ASI 105
+     "inverter": "SMA_SB_3000HF-30", "inverter_parameters": htw_inverter.inv2,  # SMA SUNNY BOY 3000HF-30
+     "arrays": [{"modules_per_string": 10, "strings": 3}]},
+]
+
+
+def setup_location(cached=False):
+    """
+    Creates the location of the htw pv-system.
+
+    Parameters
+    ----------
+    cached: bool
+        If True, a `htw_location.CachedLocation` is created, which keeps the calculated solar positions.
+
+    Returns
+    -------
+    pvlib.location.Location
+        Location of the HTW Berlin (Wilhelminenhof).
+    """
+    import pvlib
+    from htw_location import CachedLocation
+
+    location_class = CachedLocation if cached else pvlib.location.Location
+
+    return location_class(name='HTW Berlin',
+                          latitude=HTW_LAT,
+                          longitude=HTW_LON,
+                          tz='Europe/Berlin',
+                          altitude=80)
+
+
+def setup_systems(losses_parameters=None, systems=None):
+    """
+    Creates the pv-systems (one per inverter).
+
+    Parameters
+    ----------
+    losses_parameters: dict, optional
+        pvwatts losses in %. Default: `PVWATTS_LOSSES`.
+    systems: list[dict], optional
+        System definitions. Default: `SYSTEMS`.
+
+    Returns
+    -------
+    list[pvlib.pvsystem.PVSystem]
+        PVSystem objects
+    """
+    import pvlib
+
+    if losses_parameters is None:
+        losses_parameters = PVWATTS_LOSSES
+    if systems is None:
+        systems = SYSTEMS
+
+    temperature_model_parameters = pvlib.temperature.TEMPERATURE_MODEL_PARAMETERS[TEMPERATURE_MODEL[0]][
+        TEMPERATURE_MODEL[1]]
+
+    pv_systems = []
+    for system in systems:
+        module_parameters = system["module_parameters"]()
+
+        arrays = []
+        for i, array in enumerate(system["arrays"]):
+            mount = pvlib.pvsystem.FixedMount(surface_tilt=array.get("surface_tilt", SURFACE_TILT),
+                                              surface_azimuth=array.get("surface_azimuth", SURFACE_AZIMUTH),
+                                              racking_model='close_mount')
+            arrays.append(pvlib.pvsystem.Array(mount=mount,
+                                               albedo=array.get("albedo", ALBEDO),
+                                               # surface_type=,
+                                               module=system["module"],
+                                               module_type='glass_polymer',
+                                               module_parameters=module_parameters,
+                                               temperature_model_parameters=temperature_model_parameters,
+                                               modules_per_string=array["modules_per_string"],
+                                               strings=array["strings"],
+                                               name=array.get("name", f"{system['name']}_{i + 1}")
+                                               ))
+
+        pv_systems.append(pvlib.pvsystem.PVSystem(arrays=arrays,
+                                                  inverter=system["inverter"],
+                                                  inverter_parameters=system["inverter_parameters"](),
+                                                  losses_parameters=losses_parameters,
+                                                  name=system["name"]
+                                                  ))
+    return pv_systems
 
 
 def setup_model(name, system, location):
@@ -51,6 +189,8 @@ def setup_model(name, system, location):
         pvlib ModelChain object (pvlib.modelchain.ModelChain)
 
     """
+    import pvlib
+
     return pvlib.modelchain.ModelChain(system=system,
                                        location=location,
                                        # clearsky_model='ineichen',
@@ -62,217 +202,54 @@ def setup_model(name, system, location):
                                        aoi_model='physical',
                                        spectral_model='no_loss',
                                        # temperature_model='sapm',
-                                       # dc_ohmic_model="dc_ohms_from_percent",  # why does it not work?
+                                       # dc_ohmic_model="dc_ohms_from_percent",  # needs "dc_ohmic_percent"
                                        losses_model='pvwatts',
                                        name=name
                                        )
 
 
-if __name__ == "__main__":
+def setup_models(location=None, losses_parameters=None, systems=None):
+    """
+    Creates the ModelChain objects of all pv-systems.
 
-    # Set the location
-    htw_location = pvlib.location.Location(name='HTW Berlin',
-                                           latitude=HTW_LAT,
-                                           longitude=HTW_LON,
-                                           tz='Europe/Berlin',
-                                           altitude=80)
-
-    # Set the Angles
-    # The tilt angle is defined as degrees from horizontal (surface facing up = 0, surface facing horizon = 90)
-    surface_tilt = 14.57
-
-    # Azimuth angle of the module surface. North=0, East=90, South=180, West=270.
-    surface_azimuth = 215
-
-    # Set the Albedo
-    albedo = 0.2
-
-    # Set the temperature model ("open_rack_glass_polymer" (higher yield) or "close_mount_glass_glass")
-    temperature_model_parameters = pvlib.temperature.TEMPERATURE_MODEL_PARAMETERS['sapm']['open_rack_glass_polymer']
-
-    # pvwatts default losses:
-    pvwatts_losses = {"soiling": 2,
-                      "shading": 3,
-                      "snow": 0,
-                      "mismatch": 2,
-                      "wiring": 2,
-                      "connections": 0.5,
-                      "lid": 1.5,
-                      "nameplate_rating": 1,
-                      "age": 0,
-                      "availability": 3
-                      }
-
-    # Set up the PV System
-    # WR 1:
-    module_name = "Schott_ASI_105"
-    module_parameters = htw_modules.modul1()  # Schott ASI 105
-    inverter_name = "Danfoss_DLX_2.9"
-    inverter_parameters = htw_inverter.inv1()  # Danfoss DLX 2.9
-    modules_per_string = 10
-    strings_per_inverter = 3
-
-    wr1 = pvlib.pvsystem.PVSystem(  # arrays=,  # for multiple pv-arrays (e.g. 3 arrays with different angles)
-                                  surface_tilt=surface_tilt,
-                                  surface_azimuth=surface_azimuth,
-                                  albedo=albedo,
-                                  # surface_type=,
-                                  module=module_name,
-                                  module_type='glass_polymer',
-                                  module_parameters=module_parameters,
-                                  temperature_model_parameters=temperature_model_parameters,
-                                  modules_per_string=modules_per_string,
-                                  strings_per_inverter=strings_per_inverter,
-                                  inverter=inverter_name,
-                                  inverter_parameters=inverter_parameters,
-                                  racking_model='close_mount',
-                                  losses_parameters=pvwatts_losses,
-                                  name="wr1"
-                                  )
-
-    # WR 2:
-    module_name = "Aleo_Solar_S19y285"
-    module_parameters = htw_modules.modul2()  # Aleo Solar S19 G2 285
-    inverter_name = "Danfoss_DLX_2.9"
-    inverter_parameters = htw_inverter.inv1()  # Danfoss DLX 2.9
-    modules_per_string = 11
-    strings_per_inverter = 1
-
-    wr2 = pvlib.pvsystem.PVSystem(  # arrays=,  # for multiple arrays (e.g. 3 arrays with different angles)
-                                  surface_tilt=surface_tilt,
-                                  surface_azimuth=surface_azimuth,
-                                  albedo=albedo,
-                                  # surface_type=,
-                                  module=module_name,
-                                  module_type='glass_polymer',
-                                  module_parameters=module_parameters,
-                                  temperature_model_parameters=temperature_model_parameters,
-                                  modules_per_string=modules_per_string,
-                                  strings_per_inverter=strings_per_inverter,
-                                  inverter=inverter_name,
-                                  inverter_parameters=inverter_parameters,
-                                  racking_model='close_mount',
-                                  losses_parameters=pvwatts_losses,
-                                  name="wr2"
-                                  )
-    # WR 3:
-    module_name = "Aleo_Solar_S18_240"
-    module_parameters = htw_modules.modul3()  # Aleo Solar S18 240
-    inverter_name = "Danfoss_DLX_2.9"
-    inverter_parameters = htw_inverter.inv1()  # Danfoss DLX 2.9
-    modules_per_string = 14
-    strings_per_inverter = 1
-
-    wr3 = pvlib.pvsystem.PVSystem(  # arrays=,  # for multiple arrays (e.g. 3 arrays with different angles)
-                                  surface_tilt=surface_tilt,
-                                  surface_azimuth=surface_azimuth,
-                                  albedo=albedo,
-                                  # surface_type=,
-                                  module=module_name,
-                                  module_type='glass_polymer',
-                                  module_parameters=module_parameters,
-                                  temperature_model_parameters=temperature_model_parameters,
-                                  modules_per_string=modules_per_string,
-                                  strings_per_inverter=strings_per_inverter,
-                                  inverter=inverter_name,
-                                  inverter_parameters=inverter_parameters,
-                                  racking_model='close_mount',
-                                  losses_parameters=pvwatts_losses,
-                                  name="wr3"
-                                  )
-
-    # WR 4:
-    module_name = "Aleo_Solar_S19_245"
-    module_parameters = htw_modules.modul4()  # Aleo Solar S19 G1 245
-    inverter_name = "SMA_SB_3000HF-30"
-    inverter_parameters = htw_inverter.inv2()  # SMA SUNNY BOY 3000HF-30
-    modules_per_string = 13
-    strings_per_inverter = 1
-
-    wr4 = pvlib.pvsystem.PVSystem(  # arrays=,  # for multiple arrays (e.g. 3 arrays with different angles)
-                                  surface_tilt=surface_tilt,
-                                  surface_azimuth=surface_azimuth,
-                                  albedo=albedo,
-                                  # surface_type=,
-                                  module=module_name,
-                                  module_type='glass_polymer',
-                                  module_parameters=module_parameters,
-                                  temperature_model_parameters=temperature_model_parameters,
-                                  modules_per_string=modules_per_string,
-                                  strings_per_inverter=strings_per_inverter,
-                                  inverter=inverter_name,
-                                  inverter_parameters=inverter_parameters,
-                                  racking_model='close_mount',
-                                  losses_parameters=pvwatts_losses,
-                                  name="wr4"
-                                  )
-
-    # WR 5:
-    module_name = "Schott_ASI_105"
-    module_parameters = htw_modules.modul1()  # Schott ASI 105
-    inverter_name = "SMA_SB_3000HF-30"
-    inverter_parameters = htw_inverter.inv2()  # SMA SUNNY BOY 3000HF-30
-    modules_per_string = 10
-    strings_per_inverter = 3
-
-    wr5 = pvlib.pvsystem.PVSystem(  # arrays=,  # for multiple arrays (e.g. 3 arrays with different angles)
-                                  surface_tilt=surface_tilt,
-                                  surface_azimuth=surface_azimuth,
-                                  albedo=albedo,
-                                  # surface_type=,
-                                  module=module_name,
-                                  module_type='glass_polymer',
-                                  module_parameters=module_parameters,
-                                  temperature_model_parameters=temperature_model_parameters,
-                                  modules_per_string=modules_per_string,
-                                  strings_per_inverter=strings_per_inverter,
-                                  inverter=inverter_name,
-                                  inverter_parameters=inverter_parameters,
-                                  racking_model='close_mount',
-                                  losses_parameters=pvwatts_losses,
-                                  name="wr5"
-                                  )
-
-    # Create the model
-    mc1 = setup_model(wr1.name, wr1, htw_location)
-    mc2 = setup_model(wr2.name, wr2, htw_location)
-    mc3 = setup_model(wr3.name, wr3, htw_location)
-    mc4 = setup_model(wr4.name, wr4, htw_location)
-    mc5 = setup_model(wr5.name, wr5, htw_location)
-
-    # Create the model list. Comment out, if you want to run specific models.
-    models = [
-        mc1,
-        mc2,
-        mc3,
-        mc4,
-        mc5
-    ]
+    Parameters
+    ----------
+    location: pvlib.location.Location, optional
+        Location. Default: `setup_location()`.
+    losses_parameters: dict, optional
+        pvwatts losses in %. Default: `PVWATTS_LOSSES`.
+    systems: list[dict], optional
+        System definitions. Default: `SYSTEMS`.
 
-    # Get the weather-data
-    # Read the file
-    df_htw = pd.read_csv(PATH_HTW_WEATHER, sep=";")  # (mview!)
-    df_fred = pd.read_csv(PATH_FRED_WEATHER, sep=",")
+    Returns
+    -------
+    list[pvlib.modelchain.ModelChain]
+        One ModelChain object per pv-system.
+    """
+    if location is None:
+        location = setup_location()
+
+    return [setup_model(pv_system.name, pv_system, location)
+            for pv_system in setup_systems(losses_parameters=losses_parameters, systems=systems)]
 
-    # Convert the column names for the htw weather.
-    df_htw = htw_weather.convert_column_names(df_htw, time="timestamp", ghi="g_hor_si",
-                                              wind_speed="v_wind", temp_air="t_luft")
 
-    df_fred = htw_weather.convert_column_names(df_fred, time="time", ghi="ghi",
-                                               wind_speed="wind_speed", temp_air="temp_air")
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
 
-    # Calculate the diffuse irradiation.
-    df_htw = htw_weather.calculate_diffuse_irradiation(df_htw, parameter_name="ghi", lat=HTW_LAT, lon=HTW_LON)
+    # Create the models (location, pv-systems and ModelChain)
+    # Remove entries of SYSTEMS, if you want to run specific models.
+    models = setup_models()
 
-    # Assign the weather DataFrame hourly resampled
-    weather_htw = df_htw[["ghi", "dni", "dhi"]]  # only keep the important columns which are able to resample
-    weather_htw = weather_htw.resample("h").mean()  # in Wh
-    weather_fred = df_fred.resample("h").mean()  # in Wh
-    weather_fred = weather_fred[weather_fred.index.year > 2014]
+    # Get the weather-data
+    # Both files are read, resampled hourly and aligned once, then the aligned frame is read from the cache.
+    # The time stamps are the centers of 30 min intervals, the period is WEATHER_START - WEATHER_END
+    # The hourly means are labelled with the center of the hour (solar position of the models)
+    # FRED_CORRECTION: openFRED corrected against the weather station (see htw_reconciliation.py)
+    weather_htw, weather_fred = htw_reconciliation.load_sources(corrected=FRED_CORRECTION)  # in Wh
 
     # Run the model (HTW)
     for model_htw in models:
-        model_htw.run_model(weather=weather_htw)
+        htw_cache.run_model_cached(model_htw, weather_htw)  # stored results are used for unchanged runs
 
     # Create monthly results DataFrame
     result_monthly_htw = pd.DataFrame()
@@ -305,6 +282,10 @@ if __name__ == "__main__":
     result_monthly_htw.to_csv(path_or_buf=fr"{PATH_RESULTS}results_monthly_htw.csv", sep=";", encoding="utf-8")
     # result_annual.to_csv(path_or_buf=fr"{PATH_RESULTS}results_annual.csv", sep=";", encoding="utf-8")
 
+    # Export the hourly and monthly results of all systems (Parquet datasets)
+    htw_export.write_results(models, fr"{PATH_EXPORT}hourly", source="htw", mode="overwrite")
+    htw_export.write_results(models, fr"{PATH_EXPORT}monthly", source="htw", freq="ME", mode="overwrite")
+
     # Plot the monthly yield
     result_monthly_htw.plot.bar(rot=90, title="Monthly yield", ylabel="Energy in $kWh$", grid=True)
     plt.tight_layout()
@@ -314,7 +295,7 @@ if __name__ == "__main__":
 
 # Run the model (FRED)
     for model_fred in models:
-        model_fred.run_model(weather=weather_fred)
+        htw_cache.run_model_cached(model_fred, weather_fred)  # stored results are used for unchanged runs
 
     # Create monthly results DataFrame
     result_monthly_fred = pd.DataFrame()
@@ -347,6 +328,10 @@ if __name__ == "__main__":
     result_monthly_fred.to_csv(path_or_buf=fr"{PATH_RESULTS}results_monthly_fred.csv", sep=";", encoding="utf-8")
     # result_annual.to_csv(path_or_buf=fr"{PATH_RESULTS}results_annual.csv", sep=";", encoding="utf-8")
 
+    # Export the hourly and monthly results of all systems (Parquet datasets)
+    htw_export.write_results(models, fr"{PATH_EXPORT}hourly", source="fred", mode="overwrite")
+    htw_export.write_results(models, fr"{PATH_EXPORT}monthly", source="fred", freq="ME", mode="overwrite")
+
     # Plot the monthly yield
     result_monthly_fred.plot.bar(rot=90, title="Monthly yield", ylabel="Energy in $kWh$", grid=True)
     plt.tight_layout()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script contains the import-time budget test of the scripts (lazy imports of pvlib and matplotlib).
+
+The import runs in a fresh interpreter, so modules which were imported by pytest or other tests are not counted.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Path of the repository (the scripts are imported from there)
+PATH_REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Maximum import time in s (pandas and numpy take most of it)
+IMPORT_BUDGET = 2.0
+
+# Modules which are only imported when they are needed
+LAZY_MODULES = ["pvlib", "matplotlib"]
+
+# Code of the subprocess: import time and the imported lazy modules
+IMPORT_CODE = """
+import json, sys, time
+time_start = time.perf_counter()
+import {module}
+runtime = time.perf_counter() - time_start
+print(json.dumps({{"runtime": runtime, "loaded": [name for name in {lazy} if name in sys.modules]}}))
+"""
+
+
+@pytest.mark.parametrize("module", ["main", "weather_analysis"])
+def test_import_budget(module):
+    code = IMPORT_CODE.format(module=module, lazy=LAZY_MODULES)
+    process = subprocess.run([sys.executable, "-c", code], cwd=PATH_REPOSITORY, capture_output=True, text=True,
+                             check=True)
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+
+    assert result["loaded"] == [], f"import {module} loads {result['loaded']}"
+    assert result["runtime"] < IMPORT_BUDGET, f"import {module} takes {result['runtime']:.2f} s"
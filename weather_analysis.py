@@ -7,9 +7,8 @@ This module is used to analyze the htw and openfred weather data.
 
 
 # Import libraries
+# matplotlib is imported in the plot functions (faster start for runs without plots)
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
 
 # Import default modules
 import calendar as cal
@@ -64,6 +63,9 @@ def year_plot(series, title):
     Plot
         matplotlib.pyplot.plot object
     """
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+
     # Basic stacked bar-plot command
     ax = series.plot(kind='bar', figsize=(14, 6))
 
@@ -110,6 +112,9 @@ def year_plot_stacked(df):
     Plot
         matplotlib.pyplot.plot object
     """
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+
     # Basic stacked bar-plot command
     ax = df.plot(kind='bar', stacked=True, figsize=(14, 6))
 
@@ -206,6 +211,8 @@ if __name__ == "__main__":
     results_monthly["Openfred"] = fred_monthly
 
     if plot_monthly:
+        import matplotlib.pyplot as plt
+
         results_monthly.plot(kind="bar", figsize=(14, 6))
         plt.grid(axis="y")
         plt.ylabel("Irradiation in kWh/m²")